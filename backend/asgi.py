@@ -3,8 +3,6 @@ import os
 import django
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
-from mentoshipApp.routing import websocket_urlpatterns
 
 # Set the default Django settings module
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
@@ -12,9 +10,12 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 # Initialize Django ASGI application early to ensure the AppRegistry is populated
 django.setup()
 
+from chatApp.middleware import JWTAuthMiddlewareStack
+from mentorshipApp.routing import websocket_urlpatterns
+
 application = ProtocolTypeRouter({
     "http": get_asgi_application(),
-    "websocket": AuthMiddlewareStack(
+    "websocket": JWTAuthMiddlewareStack(
         URLRouter(
             websocket_urlpatterns
         )
@@ -208,7 +208,7 @@ AUTH_USER_MODEL = 'userApp.CustomUser'
 
 
 # File upload settings
-FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440  # 2.5MB; larger uploads are spooled to disk
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 
 # Allowed file extensions for template uploads
@@ -3,7 +3,7 @@
 from django.contrib import admin
 from .models import (
     GroupChatMessage, GroupChatParticipant, GroupChatRoom, GroupMessageReadStatus, 
-    ChatRoom, Message, MessageReadStatus
+    ChatRoom, Message, MessageReadStatus, UnreadCounter
 )
 
 
@@ -16,7 +16,7 @@ class ChatRoomAdmin(admin.ModelAdmin):
     search_fields = [
         'user1__full_name', 
         'user2__full_name', 
-        'mentorship__program__name'
+        'mentorship__programs__name'
     ]
     readonly_fields = ['created_at', 'updated_at']
     
@@ -95,7 +95,7 @@ class GroupChatParticipantInline(admin.TabularInline):
 class GroupChatRoomAdmin(admin.ModelAdmin):
     list_display = ['name', 'chat_type', 'department', 'mentorship', 'is_active', 'created_by', 'created_at', 'participant_count']
     list_filter = ['chat_type', 'department', 'is_active', 'is_archived', 'created_at']
-    search_fields = ['name', 'description', 'department', 'mentorship__program__name']
+    search_fields = ['name', 'description', 'department', 'mentorship__programs__name']
     readonly_fields = ['created_at', 'updated_at', 'participant_count_display']
     inlines = [GroupChatParticipantInline]
     
@@ -197,4 +197,12 @@ class GroupMessageReadStatusAdmin(admin.ModelAdmin):
     list_select_related = ['message', 'user']
     
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('message', 'user')
\ No newline at end of file
+        return super().get_queryset(request).select_related('message', 'user')
+
+
+@admin.register(UnreadCounter)
+class UnreadCounterAdmin(admin.ModelAdmin):
+    list_display = ['user', 'chat_room', 'group_chat_room', 'count', 'updated_at']
+    search_fields = ['user__full_name', 'user__email', 'group_chat_room__name']
+    list_select_related = ['user', 'chat_room', 'group_chat_room']
+    readonly_fields = ['updated_at']
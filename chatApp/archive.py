@@ -0,0 +1,288 @@
+# chatApp/archive.py
+import json
+import zlib
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.fields.files import FieldFile
+from django.db.models.functions import Coalesce
+from django.utils.timezone import now
+
+from .models import (
+    ChatRoom, GroupChatMessage, GroupChatParticipant, GroupChatRoom, Message, MessageArchiveSegment, UnreadCounter
+)
+from userApp.models import CustomUser
+
+
+DEFAULT_AGE_DAYS = 365
+DEFAULT_SEGMENT_SIZE = 500
+
+
+def get_archive_config():
+    config = getattr(settings, 'CHAT_ARCHIVE', {})
+    return {
+        'AGE_DAYS': config.get('AGE_DAYS', DEFAULT_AGE_DAYS),
+        'SEGMENT_SIZE': config.get('SEGMENT_SIZE', DEFAULT_SEGMENT_SIZE),
+    }
+
+
+def segment_room_field(model):
+    """MessageArchiveSegment field holding the room of a message model"""
+    return 'group_chat_room' if model is GroupChatMessage else 'chat_room'
+
+
+def _encode_value(value):
+    # Full-precision timestamps: cursors compare created_at exactly
+    if isinstance(value, FieldFile):
+        return value.name or None
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_segment(messages, replies=None):
+    """
+    zlib-compressed JSON lines, one object of concrete field values per
+    message, plus the reply_to_info snapshot of replies.
+    """
+    replies = replies or {}
+    lines = []
+    for message in messages:
+        record = {
+            field.attname: getattr(message, field.attname)
+            for field in message._meta.concrete_fields
+        }
+        if message.id in replies:
+            record['reply_to_info'] = replies[message.id]
+        lines.append(json.dumps(record, default=_encode_value))
+    return zlib.compress('\n'.join(lines).encode(), 9)
+
+
+def decode_segment(model, data):
+    """Unsaved model instances rebuilt from a segment, oldest first"""
+    fields = {field.attname: field for field in model._meta.concrete_fields}
+    messages = []
+    for line in zlib.decompress(bytes(data)).decode().splitlines():
+        record = json.loads(line)
+        reply_to_info = record.pop('reply_to_info', None)
+        message = model(**{
+            attname: fields[attname].to_python(value)
+            for attname, value in record.items() if attname in fields
+        })
+        message._state.adding = False
+        message._archived_reply_to = reply_to_info
+        messages.append(message)
+    return messages
+
+
+def archivable_messages(model, room_id, cutoff):
+    """
+    The room's messages created before cutoff. For group chats archiving
+    stops at the oldest message a live reply still points at, so deleting
+    archived rows never clears a reply_to that is still shown.
+    """
+    queryset = model.objects.filter(chat_room_id=room_id, created_at__lt=cutoff)
+    if model is GroupChatMessage:
+        boundary = model.objects.filter(
+            chat_room_id=room_id,
+            created_at__gte=cutoff,
+            reply_to__created_at__lt=cutoff
+        ).order_by('reply_to__created_at', 'reply_to_id').values_list(
+            'reply_to__created_at', 'reply_to_id'
+        ).first()
+        if boundary:
+            queryset = queryset.filter(
+                Q(created_at__lt=boundary[0]) | Q(created_at=boundary[0], id__lt=boundary[1])
+            )
+    return queryset
+
+
+def reply_snapshots(queryset):
+    """reply_to_info of every reply in the queryset, taken before any original is archived"""
+    if queryset.model is not GroupChatMessage:
+        return {}
+    rows = queryset.filter(reply_to__isnull=False).values_list(
+        'id', 'reply_to_id', 'reply_to__sender__full_name', 'reply_to__content', 'reply_to__message_type'
+    )
+    return {
+        message_id: {
+            'id': reply_to_id,
+            'sender': sender,
+            'content': content[:100],
+            'message_type': message_type
+        }
+        for message_id, reply_to_id, sender, content, message_type in rows
+    }
+
+
+def release_unread(model, room_id, batch):
+    """
+    Take archived messages out of the unread counters still counting
+    them, the way deleting them would. Counters never go below zero.
+    """
+    if model is Message:
+        room = ChatRoom(pk=room_id)
+        unread = Counter(message.sender_id for message in batch if not message.is_read and not message.is_deleted)
+        for sender_id, amount in unread.items():
+            UnreadCounter.decrement(room, exclude_user_id=sender_id, amount=amount)
+        return
+
+    room = GroupChatRoom(pk=room_id)
+    participants = GroupChatParticipant.objects.filter(chat_room_id=room_id).annotate(
+        read_until=Coalesce('last_read_at', 'joined_at')
+    ).values_list('user_id', 'read_until')
+    for user_id, read_until in participants:
+        amount = sum(
+            1 for message in batch
+            if not message.is_deleted and message.sender_id != user_id and message.created_at > read_until
+        )
+        if amount:
+            UnreadCounter.decrement(room, user_ids=[user_id], amount=amount)
+
+
+def archive_room(model, room_id, cutoff, segment_size):
+    """
+    Move the room's messages created before cutoff into archive segments,
+    oldest first. Returns the number of messages archived.
+
+    Unread counters drop the archived messages. When the room's last
+    message is archived the room points at its latest remaining message;
+    with none left it keeps the archived message's preview and time.
+    """
+    room_model = ChatRoom if model is Message else GroupChatRoom
+    queryset = archivable_messages(model, room_id, cutoff)
+    replies = reply_snapshots(queryset)
+    archived = 0
+    while True:
+        with transaction.atomic():
+            batch = list(queryset.order_by('created_at', 'id')[:segment_size])
+            if not batch:
+                return archived
+
+            MessageArchiveSegment.objects.create(**{
+                f'{segment_room_field(model)}_id': room_id,
+                'message_count': len(batch),
+                'first_sequence': min((m.sequence for m in batch if m.sequence is not None), default=None),
+                'last_sequence': max((m.sequence for m in batch if m.sequence is not None), default=None),
+                'first_created_at': batch[0].created_at,
+                'first_message_id': batch[0].id,
+                'last_created_at': batch[-1].created_at,
+                'last_message_id': batch[-1].id,
+                'data': encode_segment(batch, replies)
+            })
+
+            # The segment takes over the messages' attachment references
+            ids = [message.id for message in batch]
+            last_archived = room_model.objects.filter(pk=room_id, last_message_id__in=ids).exists()
+            model.objects.filter(id__in=ids).update(attachment_blob=None)
+            model.objects.filter(id__in=ids).delete()
+            release_unread(model, room_id, batch)
+            if last_archived and model.objects.filter(chat_room_id=room_id, is_deleted=False).exists():
+                room_model(pk=room_id).refresh_last_message()
+            archived += len(batch)
+
+
+def archivable_rooms():
+    """(message model, room ids) of inactive or archived rooms"""
+    return [
+        (Message, ChatRoom.objects.filter(is_active=False).values_list('id', flat=True)),
+        (GroupChatMessage, GroupChatRoom.objects.filter(
+            Q(is_active=False) | Q(is_archived=True)
+        ).values_list('id', flat=True)),
+    ]
+
+
+def archive_old_messages(age_days=None, segment_size=None):
+    """Archive everything older than age_days in inactive or archived rooms"""
+    config = get_archive_config()
+    cutoff = now() - timedelta(days=age_days or config['AGE_DAYS'])
+    segment_size = segment_size or config['SEGMENT_SIZE']
+
+    archived = 0
+    for model, room_ids in archivable_rooms():
+        room_ids = model.objects.filter(
+            chat_room_id__in=room_ids, created_at__lt=cutoff
+        ).values_list('chat_room_id', flat=True).distinct()
+        for room_id in list(room_ids):
+            archived += archive_room(model, room_id, cutoff, segment_size)
+    return archived
+
+
+class RoomArchive:
+    """
+    Read access to a room's archived messages for the history endpoints.
+    Deleted messages are skipped, like the live querysets do.
+    """
+
+    def __init__(self, model, room_id):
+        self.model = model
+        self.segments = MessageArchiveSegment.objects.filter(**{f'{segment_room_field(model)}_id': room_id})
+
+    def older(self, position, limit):
+        """Up to limit messages before (created_at, id), newest first"""
+        segments = self.segments
+        if position is not None:
+            created_at, pk = position
+            segments = segments.filter(
+                Q(first_created_at__lt=created_at) | Q(first_created_at=created_at, first_message_id__lt=pk)
+            )
+        found = []
+        for segment in segments.order_by('-last_created_at', '-last_message_id').iterator():
+            for message in reversed(self._decode(segment)):
+                if position is None or (message.created_at, message.id) < position:
+                    found.append(message)
+                    if len(found) == limit:
+                        return self._resolve(found)
+        return self._resolve(found)
+
+    def newer(self, position, limit):
+        """Up to limit messages after (created_at, id), oldest first"""
+        created_at, pk = position
+        segments = self.segments.filter(
+            Q(last_created_at__gt=created_at) | Q(last_created_at=created_at, last_message_id__gt=pk)
+        )
+        found = []
+        for segment in segments.order_by('first_created_at', 'first_message_id').iterator():
+            for message in self._decode(segment):
+                if (message.created_at, message.id) > position:
+                    found.append(message)
+                    if len(found) == limit:
+                        return self._resolve(found)
+        return self._resolve(found)
+
+    def since(self, sequence, limit):
+        """Up to limit messages with a sequence above the given one, in order"""
+        found = []
+        segments = self.segments.filter(last_sequence__gt=sequence).order_by('first_sequence')
+        for segment in segments.iterator():
+            for message in self._decode(segment):
+                if message.sequence is not None and message.sequence > sequence:
+                    found.append(message)
+                    if len(found) == limit:
+                        return self._resolve(found)
+        return self._resolve(found)
+
+    def _decode(self, segment):
+        return [message for message in decode_segment(self.model, segment.data) if not message.is_deleted]
+
+    def _resolve(self, messages):
+        """Attach senders, attachment blobs and reply previews without a query per message"""
+        senders = CustomUser.objects.in_bulk({message.sender_id for message in messages})
+        blob_ids = {message.attachment_blob_id for message in messages if message.attachment_blob_id}
+        blobs = self.model._meta.get_field('attachment_blob').related_model.objects.in_bulk(blob_ids)
+        for message in messages:
+            message.sender = senders.get(message.sender_id) or CustomUser(id=message.sender_id)
+            message.attachment_blob = blobs.get(message.attachment_blob_id)
+            if self.model is GroupChatMessage:
+                info = message._archived_reply_to
+                message.reply_to = GroupChatMessage(
+                    id=info['id'],
+                    content=info['content'],
+                    message_type=info['message_type'],
+                    sender=CustomUser(full_name=info['sender'])
+                ) if info else None
+                message.reply_to_id = info['id'] if info else None
+        return messages
@@ -0,0 +1,304 @@
+# chatApp/attachments.py
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import IntegrityError, transaction
+
+from .models import AttachmentBlob, AttachmentUpload
+from .previews import schedule_preview
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 10 * 1024 * 1024  # 10MB
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+HASH_CHUNK_SIZE = 64 * 1024
+PART_DIGESTS_SIZE = 1000
+
+ALLOWED_CONTENT_TYPES = [
+    'image/jpeg', 'image/png', 'image/gif',
+    'application/pdf', 'text/plain',
+    'application/msword',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+]
+
+
+class UploadError(Exception):
+    """A chunk or upload that cannot be accepted; status is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def get_upload_config():
+    config = getattr(settings, 'CHAT_UPLOADS', {})
+    return {
+        'MAX_SIZE': config.get('MAX_SIZE', DEFAULT_MAX_SIZE),
+        'CHUNK_SIZE': config.get('CHUNK_SIZE', DEFAULT_CHUNK_SIZE),
+        'TEMP_DIR': config.get('TEMP_DIR', os.path.join(settings.MEDIA_ROOT, 'chat_uploads')),
+    }
+
+
+class DigestMixin:
+    """
+    Upload handler mixin computing the SHA-256 of each file from the chunks
+    this handler consumes, as Django reads the request. The finished file
+    carries it as file.sha256.
+    """
+
+    def new_file(self, *args, **kwargs):
+        # Set first: the memory handler stops the chain from new_file()
+        self.digest = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        data = super().receive_data_chunk(raw_data, start)
+        if data is None:
+            # Kept by this handler rather than passed down the chain
+            self.digest.update(raw_data)
+        return data
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.digest.hexdigest()
+        return file
+
+
+class DigestMemoryFileUploadHandler(DigestMixin, MemoryFileUploadHandler):
+    pass
+
+
+class DigestTemporaryFileUploadHandler(DigestMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def hash_uploads(request):
+    """Hash the files of a multipart request while it is parsed; call before reading request.data"""
+    request.upload_handlers = [
+        DigestMemoryFileUploadHandler(request),
+        DigestTemporaryFileUploadHandler(request)
+    ]
+
+
+def file_digest(file):
+    """SHA-256 of a file, read in chunks so large files never sit in memory"""
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def store_attachment(file, content_type='', sha256=None):
+    """
+    Store file content once per digest and return its blob with one
+    reference taken for the caller. Reposting a file that is already
+    stored only bumps the reference count; nothing is written.
+
+    The digest is taken from sha256, then file.sha256 (set by the upload
+    handlers of hash_uploads), and only read from the file as a last
+    resort. The content is written to storage once the caller's
+    transaction commits, so a rollback leaves no file behind; file must
+    stay readable until then. A blob whose earlier write failed gets the
+    content written again.
+    """
+    if not isinstance(file, File):
+        file = File(file)
+    sha256 = sha256 or getattr(file, 'sha256', None) or file_digest(file)
+    blob = AttachmentBlob.acquire(sha256)
+    if blob is None:
+        blob = AttachmentBlob(sha256=sha256, size=file.size, content_type=content_type, ref_count=1)
+        blob.file.name = blob.file.field.generate_filename(blob, f'{sha256[:2]}/{sha256}')
+        try:
+            with transaction.atomic():
+                blob.save()
+        except IntegrityError:
+            # Someone stored the same content concurrently; share theirs
+            blob = AttachmentBlob.acquire(sha256)
+            if not blob.is_missing:
+                return blob
+    elif not blob.is_missing:
+        return blob
+
+    transaction.on_commit(lambda: write_blob(blob, file))
+    transaction.on_commit(lambda: schedule_preview(blob.pk))
+    return blob
+
+
+def write_blob(blob, file):
+    """
+    Write the content of a committed blob to storage. On failure the blob
+    is marked missing, so the next upload of the same content retries.
+    """
+    try:
+        with file.open('rb'):
+            name = blob.file.storage.save(blob.file.name, file)
+    except Exception as e:
+        logger.error(f"Could not write attachment {blob.sha256}: {e}")
+        AttachmentBlob.objects.filter(pk=blob.pk).update(is_missing=True)
+        blob.is_missing = True
+        return
+    # Storage may pick another name when a stale file holds this one
+    AttachmentBlob.objects.filter(pk=blob.pk).update(file=name, is_missing=False)
+    blob.file.name = name
+    blob.is_missing = False
+
+
+class PartDigests:
+    """
+    Running SHA-256 of the part files appended in this process, so a
+    completed chunked upload is not read again to find its digest. A
+    chunk served by another process leaves no usable state; the part file
+    is then hashed once on completion instead.
+    """
+
+    def __init__(self, size=PART_DIGESTS_SIZE):
+        self.size = size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def resume(self, upload_id, offset):
+        """A copy of the digest of the first offset bytes, or None if unknown"""
+        if offset == 0:
+            return hashlib.sha256()
+        with self.lock:
+            entry = self.entries.get(upload_id)
+            if entry is None or entry[0] != offset:
+                return None
+            return entry[1].copy()
+
+    def save(self, upload_id, offset, digest):
+        with self.lock:
+            self.entries.pop(upload_id, None)
+            while len(self.entries) >= self.size:
+                self.entries.popitem(last=False)
+            self.entries[upload_id] = (offset, digest)
+
+    def discard(self, upload_id):
+        with self.lock:
+            self.entries.pop(upload_id, None)
+
+
+part_digests = PartDigests()
+
+
+def describe_upload(upload):
+    """Progress of an upload as returned by the upload endpoints"""
+    return {
+        'upload_id': str(upload.id),
+        'filename': upload.filename,
+        'content_type': upload.content_type,
+        'size': upload.size,
+        'offset': upload.offset,
+        'complete': upload.is_complete,
+        'chunk_size': get_upload_config()['CHUNK_SIZE']
+    }
+
+
+def part_path(upload):
+    return os.path.join(get_upload_config()['TEMP_DIR'], f'{upload.id}.part')
+
+
+def start_upload(user, filename, content_type, size):
+    """Open a resumable upload after checking the declared file"""
+    if content_type not in ALLOWED_CONTENT_TYPES:
+        raise UploadError('File type not allowed')
+    max_size = get_upload_config()['MAX_SIZE']
+    if size <= 0 or size > max_size:
+        raise UploadError(f'File size must be between 1 byte and {max_size // (1024 * 1024)}MB')
+
+    upload = AttachmentUpload.objects.create(
+        user=user,
+        filename=os.path.basename(filename)[:255],
+        content_type=content_type,
+        size=size
+    )
+    os.makedirs(os.path.dirname(part_path(upload)), exist_ok=True)
+    open(part_path(upload), 'wb').close()
+    return upload
+
+
+def append_chunk(upload_id, user, offset, stream):
+    """
+    Append the bytes read from stream at offset. A client that lost track
+    of its progress gets 409 with the current offset and resumes from there.
+    Completes the upload once the declared size has been received.
+    """
+    with transaction.atomic():
+        upload = AttachmentUpload.objects.select_for_update().filter(id=upload_id, user=user).first()
+        if upload is None:
+            raise UploadError('Upload not found', status=404)
+        if upload.is_complete:
+            raise UploadError('Upload is already complete', status=409)
+        if offset != upload.offset:
+            raise UploadError(f'Expected offset {upload.offset}', status=409, offset=upload.offset)
+
+        remaining = upload.size - upload.offset
+        written = 0
+        digest = part_digests.resume(upload.id, upload.offset)
+        with open(part_path(upload), 'r+b') as part:
+            part.seek(upload.offset)
+            part.truncate()
+            for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+                written += len(chunk)
+                if written > remaining:
+                    part.truncate(upload.offset)
+                    raise UploadError('Chunk goes past the declared file size')
+                part.write(chunk)
+                if digest is not None:
+                    digest.update(chunk)
+
+        upload.offset += written
+        if upload.offset == upload.size:
+            sha256 = digest.hexdigest() if digest is not None else None
+            with open(part_path(upload), 'rb') as part:
+                upload.blob = store_attachment(part, upload.content_type, sha256=sha256)
+            part_digests.discard(upload.id)
+            # Runs after the blob has been written from the part file
+            transaction.on_commit(lambda: discard_part(upload))
+        elif digest is not None:
+            part_digests.save(upload.id, upload.offset, digest)
+        upload.save(update_fields=['offset', 'blob', 'updated_at'])
+        return upload
+
+
+def claim_upload(upload_id, user):
+    """
+    Hand the blob of a completed upload over to a new message. The
+    upload's reference becomes the message's; call inside the transaction
+    that creates the message.
+    """
+    upload = AttachmentUpload.objects.select_for_update().filter(
+        id=upload_id, user=user, blob__isnull=False
+    ).first()
+    if upload is None:
+        raise UploadError('Upload not found or not complete')
+    blob = AttachmentBlob.objects.get(pk=upload.blob_id)
+    upload.delete()
+    return blob
+
+
+def cancel_upload(upload):
+    """Delete an upload, dropping its reference to a stored blob"""
+    with transaction.atomic():
+        if upload.blob_id:
+            AttachmentBlob.release(upload.blob_id)
+        upload.delete()
+    part_digests.discard(upload.id)
+    discard_part(upload)
+
+
+def discard_part(upload):
+    try:
+        os.remove(part_path(upload))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,171 @@
+# chatApp/buffer.py
+import asyncio
+import weakref
+from collections import Counter
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.utils.timezone import now
+
+from .models import ChatRoom, Message, UnreadCounter
+from .search import get_search_backend
+
+
+DEFAULT_MAX_BATCH = 100
+DEFAULT_FLUSH_INTERVAL = 0.25
+
+
+def _resolve_primary_keys(messages):
+    """Fill in ids after bulk_create on backends that cannot return them (MySQL)"""
+    missing = [message for message in messages if message.pk is None]
+    if not missing:
+        return
+    rows = Message.objects.filter(
+        chat_room_id__in={message.chat_room_id for message in missing},
+        sequence__in={message.sequence for message in missing}
+    ).values_list('id', 'chat_room_id', 'sequence')
+    ids = {(room_id, sequence): pk for pk, room_id, sequence in rows}
+    for message in missing:
+        message.pk = ids.get((message.chat_room_id, message.sequence))
+
+
+def apply_bulk_side_effects(messages):
+    """
+    Do the bookkeeping post_save signals would have done for each message,
+    once per room: bulk_create does not send signals.
+    """
+    by_room = {}
+    for message in messages:
+        by_room.setdefault(message.chat_room_id, []).append(message)
+
+    for room_id, room_messages in by_room.items():
+        room = ChatRoom(pk=room_id)
+        room.set_last_message(max(room_messages, key=lambda message: (message.created_at, message.pk)))
+        for sender_id, amount in Counter(message.sender_id for message in room_messages).items():
+            UnreadCounter.increment(room, exclude_user_id=sender_id, amount=amount)
+
+    ChatRoom.objects.filter(pk__in=list(by_room)).update(updated_at=now())
+    get_search_backend().index_messages(messages)
+
+
+def assign_sequences(messages):
+    """Reserve one block of sequence numbers per room, in queue order"""
+    by_room = {}
+    for message in messages:
+        by_room.setdefault(message.chat_room_id, []).append(message)
+    for room_id, room_messages in by_room.items():
+        first = ChatRoom.allocate_sequences(room_id, len(room_messages))
+        for offset, message in enumerate(room_messages):
+            message.sequence = first + offset
+
+
+def persist_messages(messages):
+    """Write a batch of unsaved messages with one INSERT"""
+    try:
+        with transaction.atomic():
+            assign_sequences(messages)
+            Message.objects.bulk_create(messages)
+            _resolve_primary_keys(messages)
+            apply_bulk_side_effects(messages)
+        return messages
+    except Exception as e:
+        print(f"Error flushing message batch, saving one by one: {e}")
+
+    # Isolate bad rows so one failure does not drop the whole batch
+    saved = []
+    for message in messages:
+        try:
+            message.pk = None
+            message.sequence = None
+            with transaction.atomic():
+                message.save()
+            saved.append(message)
+        except Exception as e:
+            print(f"Error saving buffered message: {e}")
+    return saved
+
+
+def message_event(message):
+    """chat_message event for a persisted message"""
+    return {
+        'type': 'chat_message',
+        'message': message.content,
+        'message_id': message.pk,
+        'sequence': message.sequence,
+        'message_type': message.message_type,
+        'sender_id': message.sender_id,
+        'client_id': getattr(message, 'client_id', None),
+        'timestamp': message.created_at.isoformat()
+    }
+
+
+class MessageWriteBuffer:
+    """
+    Write-behind queue for one-on-one chat messages.
+
+    Messages are stamped with created_at when enqueued and flushed in FIFO
+    order under a lock, so per-room ordering survives batching. A flush runs
+    when MAX_BATCH messages are waiting or FLUSH_INTERVAL seconds after the
+    first one arrived, whichever comes first, and broadcasts the stored
+    messages to their rooms.
+    """
+
+    def __init__(self, max_batch=None, flush_interval=None):
+        config = getattr(settings, 'CHAT_WRITE_BUFFER', {})
+        self.max_batch = max_batch or config.get('MAX_BATCH', DEFAULT_MAX_BATCH)
+        if flush_interval is None:
+            flush_interval = config.get('FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.lock = asyncio.Lock()
+        self.timer = None
+
+    async def enqueue(self, chat_room_id, sender_id, content, message_type='text', client_id=None):
+        """Queue a message for the next flush and return the unsaved instance"""
+        message = Message(
+            chat_room_id=chat_room_id,
+            sender_id=sender_id,
+            content=content,
+            message_type=message_type,
+            created_at=now()
+        )
+        message.client_id = client_id
+        self.pending.append(message)
+
+        if len(self.pending) >= self.max_batch:
+            await self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.ensure_future(self._flush_later())
+        return message
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        self.timer = None
+        await self.flush()
+
+    async def flush(self):
+        """Persist everything queued so far, then broadcast it to the rooms"""
+        async with self.lock:
+            batch, self.pending = self.pending, []
+            if not batch:
+                return []
+            saved = await database_sync_to_async(persist_messages)(batch)
+
+            # Broadcast only what was stored, so every event carries an id and sequence
+            channel_layer = get_channel_layer()
+            for message in saved:
+                await channel_layer.group_send(f'chat_{message.chat_room_id}', message_event(message))
+            return saved
+
+
+_buffers = weakref.WeakKeyDictionary()
+
+
+def get_write_buffer():
+    """The write buffer of the running event loop"""
+    loop = asyncio.get_running_loop()
+    if loop not in _buffers:
+        _buffers[loop] = MessageWriteBuffer()
+    return _buffers[loop]
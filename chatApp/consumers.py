@@ -1,37 +1,43 @@
 # chatApp/consumers.py
-import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from django.contrib.auth.models import AnonymousUser
 from django.shortcuts import get_object_or_404
 from asgiref.sync import sync_to_async
 from django.utils.timezone import now
 
-from .models import ChatRoom, GroupChatParticipant, Message, ChatNotification
+from .archive import RoomArchive
+from .buffer import get_write_buffer, message_event
+from .fanout import broadcast_frame, fanout_metrics
+from .presence import get_presence
+from .ratelimit import RateLimitMixin
+from .typing_indicator import TypingIndicator
+from .models import ChatRoom, GroupChatMessage, GroupChatParticipant, Message
+from .pagination import InvalidCursor, messages_since
 from .serializers import MessageSerializer
+from .wire import DecodeError, WireFormatMixin
+from notificationApp.models import ChatNotification
 from userApp.models import CustomUser
 
 
-from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
-from django.contrib.auth.models import AnonymousUser
-from rest_framework.authtoken.models import Token
-
-class ChatConsumer(AsyncWebsocketConsumer):
+class ChatConsumer(RateLimitMixin, WireFormatMixin, AsyncWebsocketConsumer):
     async def connect(self):
         self.room_name = self.scope['url_route']['kwargs']['chat_room_id']
         self.room_group_name = f'chat_{self.room_name}'
         
-        # Authenticate user
+        # Authenticated by JWTAuthMiddleware
         try:
-            token = self.scope['query_string'].decode().split('=')[1]
-            user = await self.get_user(token)
+            user = self.scope['user']
             
-            if not user or user.is_anonymous:
+            if user.is_anonymous:
+                await self.close()
+                return
+            
+            self.room_user_ids = await self.get_room_user_ids(self.room_name)
+            if self.room_user_ids is None:
                 await self.close()
                 return
                 
-            self.scope['user'] = user
+            self.typing = TypingIndicator(self.broadcast_typing)
             await self.accept()
             
             # Join room group
@@ -40,20 +46,18 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 self.channel_name
             )
             
+            await sync_to_async(get_presence().heartbeat)(user.id, self.room_group_name, self.channel_name)
+            
         except Exception as e:
             print(f"WebSocket connection error: {e}")
             await self.close()
 
     @database_sync_to_async
-    def get_user(self, token):
-        try:
-            from rest_framework_simplejwt.tokens import AccessToken
-            access_token = AccessToken(token)
-            from userApp.models import CustomUser
-            return CustomUser.objects.get(id=access_token['user_id'])
-        except Exception as e:
-            print(f"Token validation error: {e}")
+    def get_room_user_ids(self, chat_room_id):
+        room = ChatRoom.objects.filter(id=chat_room_id, is_active=True).values('user1_id', 'user2_id').first()
+        if room is None:
             return None
+        return {room['user1_id'], room['user2_id']}
 
     async def disconnect(self, close_code):
         # Leave room group
@@ -61,24 +65,33 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.room_group_name,
             self.channel_name
         )
+        
+        user = self.scope.get('user')
+        if user and user.is_authenticated:
+            await sync_to_async(get_presence().leave)(user.id, self.room_group_name, self.channel_name)
+        
+        if hasattr(self, 'typing'):
+            await self.typing.stop(force=True)
+            self.typing.cancel()
+        
+        # Don't leave this user's messages waiting on the timer
+        await get_write_buffer().flush()
 
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         try:
-            data = json.loads(text_data)
+            data = self.decode_frame(text_data, bytes_data)
+            if not await self.allow_frame(data.get('type')):
+                return
             
             # Handle different message types
             if data.get('type') == 'chat_message':
-                message = data['message']
-                
-                # Send message to room group
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        'type': 'chat_message',
-                        'message': message,
-                        'sender_id': self.scope['user'].id
-                    }
+                await self.handle_chat_message(data)
+            elif data.get('type') == 'heartbeat':
+                await sync_to_async(get_presence().heartbeat)(
+                    self.scope['user'].id, self.room_group_name, self.channel_name
                 )
+            elif data.get('type') == 'resume':
+                await self.handle_resume(data)
             elif data.get('type') == 'video_call_offer':
                 # Forward video call offer to the room group
                 await self.channel_layer.group_send(
@@ -91,34 +104,90 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 )
             elif data.get('type') == 'typing':
                 # Handle typing notifications
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        'type': 'typing_status',
-                        'user_id': self.scope['user'].id,
-                        'is_typing': data.get('is_typing')
-                    }
-                )
+                await self.typing.update(data.get('is_typing'))
             elif data.get('type') == 'join':
                 # Handle user joining
                 pass  # You might want to handle this case
             
-        except json.JSONDecodeError:
+        except DecodeError:
             pass
 
+    async def handle_chat_message(self, data):
+        """Broadcast a chat message and queue it for persistence"""
+        user = self.scope['user']
+        content = data.get('message', '')
+        message_type = data.get('message_type', 'text')
+        
+        if user.id not in self.room_user_ids:
+            await self.send_error('Only chat participants can send messages')
+            return
+        if not isinstance(content, str) or not content.strip():
+            await self.send_error('Message content cannot be empty')
+            return
+        if len(content) > 5000:
+            await self.send_error('Message is too long (max 5000 characters)')
+            return
+        if message_type not in dict(Message.MESSAGE_TYPES):
+            message_type = 'text'
+        
+        # The buffer broadcasts the message to the room once it is stored
+        await get_write_buffer().enqueue(
+            int(self.room_name), user.id, content, message_type, data.get('client_id')
+        )
+        await self.typing.stop()
+
+    async def handle_resume(self, data):
+        """Send the messages stored after the client's last seen sequence"""
+        try:
+            resume = await self.get_messages_since(data.get('last_sequence'))
+        except InvalidCursor as e:
+            await self.send_error(str(e))
+            return
+        await self.send_payload({'type': 'resume', **resume})
+
+    @database_sync_to_async
+    def get_messages_since(self, last_sequence):
+        messages, meta = messages_since(
+            Message.objects.filter(chat_room_id=self.room_name, is_deleted=False),
+            {'after_sequence': last_sequence},
+            archive=RoomArchive(Message, self.room_name)
+        )
+        return {'messages': [message_event(message) for message in messages], **meta}
+
+    async def broadcast_typing(self, is_typing):
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                'type': 'typing_status',
+                'user_id': self.scope['user'].id,
+                'is_typing': is_typing
+            }
+        )
+
+    async def send_error(self, message):
+        await self.send_payload({
+            'type': 'error',
+            'message': message
+        })
+
     # Handler for chat messages
     async def chat_message(self, event):
         """Send message to WebSocket"""
-        await self.send(text_data=json.dumps({
+        await self.send_payload({
             'type': 'chat_message',
             'message': event['message'],
-            'sender_id': event['sender_id']
-        }))
+            'message_id': event.get('message_id'),
+            'sequence': event.get('sequence'),
+            'message_type': event.get('message_type', 'text'),
+            'sender_id': event.get('sender_id'),
+            'client_id': event.get('client_id'),
+            'timestamp': event.get('timestamp')
+        })
 
     # Handler for video call offers
     async def video_call_offer(self, event):
         """Send video call offer to WebSocket"""
-        await self.send(text_data=json.dumps({
+        await self.send_payload({
             'type': 'video_call_offer',
             'chat_room_id': event['chat_room_id'],
             'caller_id': event['caller_id'],
@@ -128,24 +197,34 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 'type': event.get('offer', {}).get('type', 'offer'),
                 'sdp': event.get('offer', {}).get('sdp', '')
             }
-        }))
+        })
 
     # Handler for typing status
     async def typing_status(self, event):
         """Send typing status to WebSocket"""
-        await self.send(text_data=json.dumps({
+        await self.send_payload({
             'type': 'typing_status',
             'user_id': event['user_id'],
             'is_typing': event['is_typing']
-        }))
+        })
 
+    # Handler for read receipts
+    async def messages_read(self, event):
+        """Send aggregated read receipt to WebSocket"""
+        await self.send_payload({
+            'type': 'messages_read',
+            'reader_id': event['reader_id'],
+            'count': event['count'],
+            'read_at': event['read_at']
+        })
 
-class NotificationConsumer(AsyncWebsocketConsumer):
+
+class NotificationConsumer(WireFormatMixin, AsyncWebsocketConsumer):
     """WebSocket consumer for real-time notifications"""
     
     async def connect(self):
         # Check if user is authenticated
-        if self.scope['user'] == AnonymousUser():
+        if self.scope['user'].is_anonymous:
             await self.close()
             return
         
@@ -168,24 +247,24 @@ class NotificationConsumer(AsyncWebsocketConsumer):
                 self.channel_name
             )
     
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         try:
-            data = json.loads(text_data)
+            data = self.decode_frame(text_data, bytes_data)
             message_type = data.get('type')
             
             if message_type == 'mark_notification_read':
                 notification_id = data.get('notification_id')
                 await self.mark_notification_read(notification_id)
                 
-        except json.JSONDecodeError:
-            await self.send(text_data=json.dumps({
+        except DecodeError:
+            await self.send_payload({
                 'type': 'error',
-                'message': 'Invalid JSON'
-            }))
+                'message': 'Invalid payload'
+            })
     
     # WebSocket message handlers
     async def notification_message(self, event):
-        await self.send(text_data=json.dumps(event))
+        await self.send_payload(event)
     
     @database_sync_to_async
     def mark_notification_read(self, notification_id):
@@ -200,19 +279,18 @@ class NotificationConsumer(AsyncWebsocketConsumer):
             pass
 
 
-class GroupChatConsumer(AsyncWebsocketConsumer):
+class GroupChatConsumer(RateLimitMixin, WireFormatMixin, AsyncWebsocketConsumer):
     """WebSocket consumer for group chats"""
     
     async def connect(self):
         self.room_id = self.scope['url_route']['kwargs']['group_chat_id']
         self.room_group_name = f'group_chat_{self.room_id}'
         
-        # Authenticate user
+        # Authenticated by JWTAuthMiddleware
         try:
-            token = self.scope['query_string'].decode().split('=')[1]
-            user = await self.get_user(token)
+            user = self.scope['user']
             
-            if not user or user.is_anonymous:
+            if user.is_anonymous:
                 await self.close()
                 return
             
@@ -222,7 +300,7 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
                 await self.close()
                 return
             
-            self.scope['user'] = user
+            self.typing = TypingIndicator(self.broadcast_typing)
             await self.accept()
             
             # Join room group
@@ -231,16 +309,21 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
                 self.channel_name
             )
             
+            presence = get_presence()
+            await sync_to_async(presence.heartbeat)(user.id, self.room_group_name, self.channel_name)
+            online_user_ids = await sync_to_async(presence.online_in_room)(self.room_group_name)
+            await self.send_payload({
+                'type': 'presence',
+                'online_user_ids': sorted(online_user_ids)
+            })
+            
             # Send online status
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'user_status',
-                    'user_id': user.id,
-                    'status': 'online',
-                    'username': user.full_name
-                }
-            )
+            await self.broadcast({
+                'type': 'user_status',
+                'user_id': user.id,
+                'status': 'online',
+                'username': user.full_name
+            })
             
         except Exception as e:
             print(f"WebSocket connection error: {e}")
@@ -254,27 +337,41 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
                 self.channel_name
             )
             
-            # Send offline status
-            if hasattr(self.scope, 'user'):
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
+            if hasattr(self, 'typing'):
+                await self.typing.stop(force=True)
+                self.typing.cancel()
+            
+            # Send offline status once the user's last connection to the room closes
+            user = self.scope.get('user')
+            if user and user.is_authenticated:
+                went_offline = await sync_to_async(get_presence().leave)(
+                    user.id, self.room_group_name, self.channel_name
+                )
+                if went_offline:
+                    await self.broadcast({
                         'type': 'user_status',
-                        'user_id': self.scope['user'].id,
+                        'user_id': user.id,
                         'status': 'offline',
-                        'username': self.scope['user'].full_name
-                    }
-                )
+                        'username': user.full_name
+                    })
     
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         try:
-            data = json.loads(text_data)
+            data = self.decode_frame(text_data, bytes_data)
             message_type = data.get('type')
+            if not await self.allow_frame(message_type):
+                return
             
             if message_type == 'chat_message':
                 await self.handle_chat_message(data)
             elif message_type == 'typing':
                 await self.handle_typing_status(data)
+            elif message_type == 'heartbeat':
+                await sync_to_async(get_presence().heartbeat)(
+                    self.scope['user'].id, self.room_group_name, self.channel_name
+                )
+            elif message_type == 'resume':
+                await self.handle_resume(data)
             elif message_type == 'read_receipt':
                 await self.handle_read_receipt(data)
             elif message_type == 'edit_message':
@@ -286,7 +383,7 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
             elif message_type == 'remove_participant':
                 await self.handle_remove_participant(data)
             
-        except json.JSONDecodeError:
+        except DecodeError:
             pass
     
     async def handle_chat_message(self, data):
@@ -295,6 +392,15 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
         message_type = data.get('message_type', 'text')
         reply_to_id = data.get('reply_to_id')
         
+        if not isinstance(message, str) or not message.strip():
+            await self.send_error('Message content cannot be empty')
+            return
+        if len(message) > 5000:
+            await self.send_error('Message is too long (max 5000 characters)')
+            return
+        if message_type not in dict(GroupChatMessage.MESSAGE_TYPES):
+            message_type = 'text'
+        
         # Save message to database
         message_obj = await self.save_group_message(
             self.scope['user'].id,
@@ -303,35 +409,74 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
             message_type,
             reply_to_id
         )
+        if message_obj is None:
+            await self.send_error('Message could not be sent')
+            return
         
         # Send message to room group
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'group_chat_message',
-                'message_id': message_obj.id,
-                'sender_id': self.scope['user'].id,
-                'sender_name': self.scope['user'].full_name,
-                'message': message,
-                'message_type': message_type,
-                'reply_to_id': reply_to_id,
-                'timestamp': message_obj.created_at.isoformat()
-            }
+        await self.broadcast({
+            'type': 'group_chat_message',
+            'message_id': message_obj.id,
+            'sender_id': self.scope['user'].id,
+            'sender_name': self.scope['user'].full_name,
+            'message': message,
+            'message_type': message_type,
+            'reply_to_id': reply_to_id,
+            'sequence': message_obj.sequence,
+            'timestamp': message_obj.created_at.isoformat()
+        })
+        await self.typing.stop()
+    
+    async def handle_resume(self, data):
+        """Send the messages stored after the client's last seen sequence"""
+        try:
+            resume = await self.get_messages_since(data.get('last_sequence'))
+        except InvalidCursor as e:
+            await self.send_error(str(e))
+            return
+        await self.send_payload({'type': 'resume', **resume})
+    
+    async def send_error(self, message):
+        await self.send_payload({
+            'type': 'error',
+            'message': message
+        })
+    
+    @database_sync_to_async
+    def get_messages_since(self, last_sequence):
+        messages, meta = messages_since(
+            GroupChatMessage.objects.filter(
+                chat_room_id=self.room_id,
+                is_deleted=False
+            ).select_related('sender'),
+            {'after_sequence': last_sequence},
+            archive=RoomArchive(GroupChatMessage, self.room_id)
         )
+        return {
+            'messages': [{
+                'message_id': message.id,
+                'sequence': message.sequence,
+                'sender_id': message.sender_id,
+                'sender_name': message.sender.full_name,
+                'message': message.content,
+                'message_type': message.message_type,
+                'reply_to_id': message.reply_to_id,
+                'timestamp': message.created_at.isoformat()
+            } for message in messages],
+            **meta
+        }
     
     async def handle_typing_status(self, data):
         """Handle typing status updates"""
-        is_typing = data.get('is_typing', False)
-        
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'group_typing_status',
-                'user_id': self.scope['user'].id,
-                'username': self.scope['user'].full_name,
-                'is_typing': is_typing
-            }
-        )
+        await self.typing.update(data.get('is_typing', False))
+    
+    async def broadcast_typing(self, is_typing):
+        await self.broadcast({
+            'type': 'group_typing_status',
+            'user_id': self.scope['user'].id,
+            'username': self.scope['user'].full_name,
+            'is_typing': is_typing
+        })
     
     async def handle_read_receipt(self, data):
         """Handle read receipts"""
@@ -343,15 +488,12 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
             self.scope['user'].id
         )
         
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'group_read_receipt',
-                'message_id': message_id,
-                'user_id': self.scope['user'].id,
-                'username': self.scope['user'].full_name
-            }
-        )
+        await self.broadcast({
+            'type': 'group_read_receipt',
+            'message_id': message_id,
+            'user_id': self.scope['user'].id,
+            'username': self.scope['user'].full_name
+        })
     
     async def handle_edit_message(self, data):
         """Handle message editing"""
@@ -366,16 +508,13 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
         )
         
         if updated:
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'group_message_edited',
-                    'message_id': message_id,
-                    'new_content': new_content,
-                    'edited_by': self.scope['user'].full_name,
-                    'edited_at': now().isoformat()
-                }
-            )
+            await self.broadcast({
+                'type': 'group_message_edited',
+                'message_id': message_id,
+                'new_content': new_content,
+                'edited_by': self.scope['user'].full_name,
+                'edited_at': now().isoformat()
+            })
     
     async def handle_delete_message(self, data):
         """Handle message deletion"""
@@ -388,14 +527,11 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
         )
         
         if deleted:
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'group_message_deleted',
-                    'message_id': message_id,
-                    'deleted_by': self.scope['user'].full_name
-                }
-            )
+            await self.broadcast({
+                'type': 'group_message_deleted',
+                'message_id': message_id,
+                'deleted_by': self.scope['user'].full_name
+            })
     
     async def handle_add_participant(self, data):
         """Handle adding participants"""
@@ -420,15 +556,12 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
         )
         
         if participant:
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'participant_added',
-                    'user_id': user_id,
-                    'added_by': self.scope['user'].full_name,
-                    'role': role
-                }
-            )
+            await self.broadcast({
+                'type': 'participant_added',
+                'user_id': user_id,
+                'added_by': self.scope['user'].full_name,
+                'role': role
+            })
     
     async def handle_remove_participant(self, data):
         """Handle removing participants"""
@@ -450,95 +583,23 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
         )
         
         if removed:
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'participant_removed',
-                    'user_id': user_id,
-                    'removed_by': self.scope['user'].full_name
-                }
-            )
-    
-    # WebSocket message handlers
-    async def group_chat_message(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'group_chat_message',
-            'message_id': event['message_id'],
-            'sender_id': event['sender_id'],
-            'sender_name': event['sender_name'],
-            'message': event['message'],
-            'message_type': event['message_type'],
-            'reply_to_id': event.get('reply_to_id'),
-            'timestamp': event['timestamp']
-        }))
+            await self.broadcast({
+                'type': 'participant_removed',
+                'user_id': user_id,
+                'removed_by': self.scope['user'].full_name
+            })
     
-    async def group_typing_status(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'group_typing_status',
-            'user_id': event['user_id'],
-            'username': event['username'],
-            'is_typing': event['is_typing']
-        }))
+    async def broadcast(self, payload):
+        """Send a payload to everyone in the room, encoded once"""
+        await broadcast_frame(self.channel_layer, self.room_group_name, int(self.room_id), payload)
     
-    async def group_read_receipt(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'group_read_receipt',
-            'message_id': event['message_id'],
-            'user_id': event['user_id'],
-            'username': event['username']
-        }))
-    
-    async def group_message_edited(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'group_message_edited',
-            'message_id': event['message_id'],
-            'new_content': event['new_content'],
-            'edited_by': event['edited_by'],
-            'edited_at': event['edited_at']
-        }))
-    
-    async def group_message_deleted(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'group_message_deleted',
-            'message_id': event['message_id'],
-            'deleted_by': event['deleted_by']
-        }))
-    
-    async def participant_added(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'participant_added',
-            'user_id': event['user_id'],
-            'added_by': event['added_by'],
-            'role': event['role']
-        }))
-    
-    async def participant_removed(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'participant_removed',
-            'user_id': event['user_id'],
-            'removed_by': event['removed_by']
-        }))
-    
-    async def user_status(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'user_status',
-            'user_id': event['user_id'],
-            'status': event['status'],
-            'username': event['username']
-        }))
+    # WebSocket message handlers
+    async def group_frame(self, event):
+        """Forward a pre-encoded broadcast frame"""
+        size = await self.send_frames(event['frames'])
+        fanout_metrics.record_delivery(event['room_id'], size)
     
     # Database operations
-    @database_sync_to_async
-    def get_user(self, token):
-        try:
-            from rest_framework_simplejwt.tokens import AccessToken
-            access_token = AccessToken(token)
-            from userApp.models import CustomUser
-            return CustomUser.objects.get(id=access_token['user_id'])
-        except Exception as e:
-            print(f"Token validation error: {e}")
-            return None
-    
     @database_sync_to_async
     def check_participation(self, user_id, chat_room_id):
         try:
@@ -556,14 +617,7 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
             from .models import GroupChatMessage, GroupChatRoom, GroupChatParticipant
             
             # Update last read time
-            participant = GroupChatParticipant.objects.filter(
-                chat_room_id=chat_room_id,
-                user_id=user_id
-            ).first()
-            
-            if participant:
-                participant.last_read_at = now()
-                participant.save(update_fields=['last_read_at'])
+            GroupChatParticipant.advance_watermark(GroupChatRoom(pk=chat_room_id), user_id)
             
             # Create message
             message = GroupChatMessage.objects.create(
@@ -582,11 +636,11 @@ class GroupChatConsumer(AsyncWebsocketConsumer):
     @database_sync_to_async
     def mark_message_as_read(self, message_id, user_id):
         try:
-            from .models import GroupMessageReadStatus
-            GroupMessageReadStatus.objects.get_or_create(
-                message_id=message_id,
-                user_id=user_id,
-                defaults={'read_at': now()}
+            from .models import GroupChatMessage, GroupChatParticipant, GroupChatRoom
+            message = GroupChatMessage.objects.only('chat_room_id', 'created_at', 'sequence').get(id=message_id)
+            GroupChatParticipant.advance_watermark(
+                GroupChatRoom(pk=message.chat_room_id), user_id,
+                read_at=message.created_at, read_sequence=message.sequence
             )
             return True
         except Exception as e:
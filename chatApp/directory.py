@@ -0,0 +1,129 @@
+# chatApp/directory.py
+import base64
+import binascii
+
+from django.db.models import Exists, OuterRef, Prefetch, Q
+
+from .models import GroupChatParticipant
+from .pagination import InvalidCursor, get_page_size
+from departmentApp.models import Department
+from userApp.models import CustomUser
+
+
+def encode_user_cursor(user):
+    """Encode a user's position in (full_name, id) order as an opaque cursor"""
+    raw = f'{user.full_name}|{user.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_user_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        full_name, pk = raw.rsplit('|', 1)
+        return full_name, int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor('Invalid cursor')
+
+
+def prefix_matches(term):
+    """
+    Ids of users with a full name, email address, role or department name
+    starting with term. One prefix query per field, combined with UNION,
+    so each is answered from its own index (full name, the unique email
+    columns, role, and the department name and foreign keys) where an OR
+    across them would scan every user.
+    """
+    branches = [
+        CustomUser.objects.filter(full_name__istartswith=term).values('id'),
+        CustomUser.objects.filter(email__istartswith=term).values('id'),
+        CustomUser.objects.filter(work_mail_address__istartswith=term).values('id'),
+        CustomUser.objects.filter(department__name__istartswith=term).values('id'),
+        CustomUser.departments.through.objects.filter(department__name__istartswith=term).values('customuser_id'),
+    ]
+    # Roles are a fixed set; match them here and look them up by value
+    roles = [value for value, _ in CustomUser.ROLE_CHOICES if value.startswith(term.lower())]
+    if roles:
+        branches.append(CustomUser.objects.filter(role__in=roles).values('id'))
+    return branches[0].union(*branches[1:])
+
+
+def candidate_queryset(query='', role=None, department=None, exclude_chat_id=None, exclude_user_id=None):
+    """
+    Approved users matching a picker query, everything filtered in SQL.
+
+    Each word of the query must be a prefix of the full name, an email
+    address, the role or a department name (see prefix_matches). Users
+    already in exclude_chat_id are removed with an anti-join rather than
+    a list of ids. Pages are then read in (status, full_name, id) index
+    order.
+    """
+    users = CustomUser.objects.filter(status='approved')
+    if exclude_user_id is not None:
+        users = users.exclude(id=exclude_user_id)
+
+    for term in query.split():
+        users = users.filter(id__in=prefix_matches(term))
+
+    if role:
+        users = users.filter(role__in=role.split(','))
+
+    if department:
+        users = users.filter(
+            Q(department_id=department) |
+            Exists(Department.objects.filter(mentors=OuterRef('pk'), id=department))
+        )
+
+    if exclude_chat_id:
+        users = users.filter(~Exists(GroupChatParticipant.objects.filter(
+            chat_room_id=exclude_chat_id,
+            user=OuterRef('pk')
+        )))
+
+    return users
+
+
+def search_candidates(params, exclude_user_id=None):
+    """
+    One keyset page of candidates in (full_name, id) order. Returns the
+    users and the cursor of the next page, None on the last one.
+    """
+    limit = get_page_size(params)
+    department = params.get('department')
+    exclude_chat_id = params.get('exclude_chat_id')
+    if (department and not department.isdigit()) or (exclude_chat_id and not exclude_chat_id.isdigit()):
+        raise ValueError('department and exclude_chat_id must be ids')
+
+    users = candidate_queryset(
+        query=params.get('q', params.get('search', '')),
+        role=params.get('role'),
+        department=department,
+        exclude_chat_id=exclude_chat_id,
+        exclude_user_id=exclude_user_id
+    )
+
+    cursor = params.get('cursor')
+    if cursor:
+        full_name, pk = decode_user_cursor(cursor)
+        users = users.filter(Q(full_name__gt=full_name) | Q(full_name=full_name, id__gt=pk))
+
+    page = list(users.select_related('department').prefetch_related(
+        Prefetch('departments', queryset=Department.objects.only('id', 'name'))
+    ).order_by('full_name', 'id')[:limit + 1])
+
+    next_cursor = encode_user_cursor(page[limit - 1]) if len(page) > limit else None
+    return page[:limit], next_cursor
+
+
+def describe_candidate(user):
+    """Picker entry for a candidate user"""
+    return {
+        'id': user.id,
+        'full_name': user.full_name,
+        'role': user.role,
+        'email': user.email,
+        'work_mail_address': user.work_mail_address,
+        'department': user.department.name if user.department else None,
+        'departments': [department.name for department in user.departments.all()],
+        'availability_status': user.availability_status
+    }
@@ -0,0 +1,82 @@
+# chatApp/fanout.py
+import threading
+import time
+import uuid
+
+from .wire import encode_json
+
+
+def encode_frames(payload):
+    """
+    The payload as a JSON text frame, with an id under which consumers
+    share its MessagePack encoding (see wire.MsgpackFrames)
+    """
+    return {'id': uuid.uuid4().hex, 'json': encode_json(payload)}
+
+
+class FanoutMetrics:
+    """
+    Process-local fan-out counters per group chat room.
+
+    broadcasts/encoded_bytes/encode_seconds are counted where an event is
+    published, deliveries/delivered_bytes where a consumer writes the frame
+    to its socket, so deliveries / broadcasts is the average room fan-out
+    seen by this process.
+    """
+
+    FIELDS = ('broadcasts', 'encoded_bytes', 'encode_seconds', 'deliveries', 'delivered_bytes')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rooms = {}
+
+    def _room(self, room_id):
+        return self.rooms.setdefault(room_id, dict.fromkeys(self.FIELDS, 0))
+
+    def record_broadcast(self, room_id, size, encode_seconds):
+        with self.lock:
+            room = self._room(room_id)
+            room['broadcasts'] += 1
+            room['encoded_bytes'] += size
+            room['encode_seconds'] += encode_seconds
+
+    def record_delivery(self, room_id, size):
+        with self.lock:
+            room = self._room(room_id)
+            room['deliveries'] += 1
+            room['delivered_bytes'] += size
+
+    def snapshot(self, room_id=None):
+        """Counters per room, with the average fan-out per broadcast"""
+        with self.lock:
+            rooms = {
+                key: dict(value) for key, value in self.rooms.items()
+                if room_id is None or key == room_id
+            }
+        for counters in rooms.values():
+            broadcasts = counters['broadcasts']
+            counters['avg_fanout'] = counters['deliveries'] / broadcasts if broadcasts else 0
+        return rooms
+
+    def reset(self):
+        with self.lock:
+            self.rooms.clear()
+
+
+fanout_metrics = FanoutMetrics()
+
+
+async def broadcast_frame(channel_layer, group_name, room_id, payload):
+    """
+    Encode a payload once and publish the frame to a channel group.
+    Consumers forward it as-is, or its MessagePack encoding made once per
+    process, so the encoding cost does not grow with the size of the room.
+    """
+    started = time.perf_counter()
+    frames = encode_frames(payload)
+    fanout_metrics.record_broadcast(room_id, len(frames['json']), time.perf_counter() - started)
+    await channel_layer.group_send(group_name, {
+        'type': 'group_frame',
+        'room_id': room_id,
+        'frames': frames
+    })
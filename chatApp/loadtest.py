@@ -0,0 +1,348 @@
+# chatApp/loadtest.py
+import asyncio
+import time
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from channels.routing import URLRouter
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test.utils import override_settings
+
+from .middleware import JWTAuthMiddlewareStack, get_token_cache
+from .models import ChatRoom, GroupChatParticipant, GroupChatRoom
+from .provisioning import add_participants, create_chat_rooms
+from notificationApp.models import ChatNotification
+from userApp.models import CustomUser
+
+
+IN_MEMORY_CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        'CONFIG': {'capacity': 10000},
+    }
+}
+TOKEN_PREFIX = 'load-test'
+
+
+def build_application():
+    """The WebSocket stack of backend/asgi.py, JWT middleware included"""
+    from mentorshipApp.routing import websocket_urlpatterns
+    return JWTAuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+
+
+def summarize_latencies(seconds):
+    """Count and p50/p90/p99/max in milliseconds"""
+    if not seconds:
+        return {'count': 0}
+    values = sorted(seconds)
+
+    def pick(pct):
+        return round(values[round(pct / 100 * (len(values) - 1))] * 1000, 2)
+
+    return {'count': len(values), 'p50': pick(50), 'p90': pick(90), 'p99': pick(99), 'max': pick(100)}
+
+
+def frame_token(frame):
+    """The load-test token carried by a delivered frame, if any"""
+    if frame.get('type') == 'notification_message':
+        return (frame.get('notification') or {}).get('title')
+    return frame.get('message')
+
+
+class QueryCounter:
+    """connection.execute_wrapper() that counts the queries it sees"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class ChatLoadTest:
+    """
+    Drive simulated WebSocket clients through the ASGI application in
+    process, over the in-memory channel layer.
+
+    Three scenarios run one after the other: group chat broadcasts through
+    GroupChatConsumer, one-on-one messages through ChatConsumer and its
+    write buffer, and notifications created in the database and pushed
+    through NotificationConsumer. Each reports connect latency, delivery
+    latency percentiles (send to receipt on every socket), throughput and
+    database queries per connect and per event.
+
+    The fixture users and rooms are written to the current database, so
+    run it against a throwaway one. Database work of the consumers runs on
+    the calling thread, as it does in a Channels worker, which is where
+    queries are counted.
+    """
+
+    def __init__(self, clients=100, rooms=10, messages=10, direct_pairs=10, notifications=20,
+                 concurrency=50, interval=0.0, timeout=30.0, rate_limits=False):
+        self.clients = clients
+        self.rooms = max(1, min(rooms, clients))
+        self.messages = messages
+        self.direct_pairs = direct_pairs
+        self.notifications = notifications
+        self.concurrency = concurrency
+        self.interval = interval
+        self.timeout = timeout
+        self.rate_limits = rate_limits
+        self.queries = QueryCounter()
+
+    def settings_overrides(self):
+        # Notifications are relayed from the outbox right after commit
+        overrides = {'CHANNEL_LAYERS': IN_MEMORY_CHANNEL_LAYERS, 'NOTIFICATION_OUTBOX': {'INLINE': True}}
+        if not self.rate_limits:
+            overrides['CHAT_RATE_LIMITS'] = {'ENABLED': False}
+        return overrides
+
+    def run(self):
+        """Build the fixture, run every scenario and return the report"""
+        with override_settings(**self.settings_overrides()):
+            self.create_fixture()
+            application = build_application()
+            with connection.execute_wrapper(self.queries):
+                return async_to_sync(self.run_scenarios)(application)
+
+    # Fixture
+
+    def create_fixture(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        count = max(self.clients, self.direct_pairs * 2, self.notifications)
+        password = make_password(None)
+        CustomUser.objects.bulk_create([
+            CustomUser(
+                phone_number=f'09{index:09d}',
+                email=f'{TOKEN_PREFIX}-{index}@example.com',
+                work_mail_address=f'{TOKEN_PREFIX}-{index}@example.com',
+                full_name=f'Load Test {index:06d}',
+                role='mentee',
+                status='approved',
+                password=password
+            )
+            for index in range(count)
+        ])
+        self.users = list(CustomUser.objects.filter(
+            email__startswith=f'{TOKEN_PREFIX}-'
+        ).order_by('full_name')[:count])
+        self.tokens = {user.id: str(AccessToken.for_user(user)) for user in self.users}
+
+        # Group clients are spread over the rooms round robin
+        owner = self.users[0]
+        rooms = [
+            GroupChatRoom.objects.create(name=f'Load test room {index}', created_by=owner, is_active=True)
+            for index in range(self.rooms)
+        ]
+        self.group_members = {room.id: [] for room in rooms}
+        participants = []
+        for index, user in enumerate(self.users[:self.clients]):
+            room = rooms[index % len(rooms)]
+            self.group_members[room.id].append(user)
+            participants.append(GroupChatParticipant(chat_room_id=room.id, user_id=user.id, added_by_id=owner.id))
+        add_participants(participants)
+
+        pairs = [(self.users[2 * index], self.users[2 * index + 1]) for index in range(self.direct_pairs)]
+        create_chat_rooms([
+            ChatRoom(user1_id=user1.id, user2_id=user2.id, chat_type='mentor_mentee', is_active=True)
+            for user1, user2 in pairs
+        ])
+        room_ids = {
+            (user1_id, user2_id): room_id
+            for room_id, user1_id, user2_id in ChatRoom.objects.filter(
+                user1_id__in=[user1.id for user1, _ in pairs]
+            ).values_list('id', 'user1_id', 'user2_id')
+        }
+        self.direct_rooms = [(room_ids[(user1.id, user2.id)], user1, user2) for user1, user2 in pairs]
+
+    # Sockets
+
+    async def open_sockets(self, application, paths):
+        """Connect every path, at most concurrency at a time; None for rejected ones"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        latencies = []
+
+        async def open_socket(path):
+            communicator = WebsocketCommunicator(application, path)
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    connected, _ = await communicator.connect(timeout=self.timeout)
+                except asyncio.TimeoutError:
+                    connected = False
+            if not connected:
+                return None
+            latencies.append(time.perf_counter() - started)
+            return communicator
+
+        communicators = await asyncio.gather(*(open_socket(path) for path in paths))
+        return communicators, latencies
+
+    async def close_sockets(self, communicators):
+        # Sockets that hit the deadline were already cancelled by the communicator
+        await asyncio.gather(*(
+            communicator.disconnect()
+            for communicator in communicators
+            if communicator is not None and not communicator.future.done()
+        ))
+
+    async def collect(self, communicator, expected, sent, latencies, deadline):
+        """Read frames until expected load-test frames arrived or the deadline passed"""
+        loop = asyncio.get_running_loop()
+        received = 0
+        while received < expected:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                frame = await communicator.receive_json_from(timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            sent_at = sent.get(frame_token(frame))
+            if sent_at is not None:
+                latencies.append(time.perf_counter() - sent_at)
+                received += 1
+        return received
+
+    async def run_scenario(self, application, sockets, send):
+        """
+        sockets: (path, number of events the socket should receive) pairs.
+        send(communicators, sent) publishes the events and records each
+        token's send time in sent.
+        """
+        get_token_cache().clear()
+        queries = self.queries.count
+        communicators, connect_latencies = await self.open_sockets(application, [path for path, _ in sockets])
+        connect_queries = self.queries.count - queries
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        sent, delivery_latencies = {}, []
+        queries = self.queries.count
+        started = time.perf_counter()
+        readers = asyncio.gather(*(
+            self.collect(communicator, expected, sent, delivery_latencies, deadline)
+            for communicator, (_, expected) in zip(communicators, sockets)
+            if communicator is not None
+        ))
+        await send(communicators, sent)
+        received = sum(await readers)
+        elapsed = time.perf_counter() - started
+        event_queries = self.queries.count - queries
+
+        await self.close_sockets(communicators)
+
+        connected = len(connect_latencies)
+        expected = sum(expected for communicator, (_, expected) in zip(communicators, sockets) if communicator)
+        return {
+            'sockets': len(sockets),
+            'connected': connected,
+            'connect_ms': summarize_latencies(connect_latencies),
+            'queries_per_connect': round(connect_queries / connected, 2) if connected else None,
+            'events': len(sent),
+            'deliveries': received,
+            'lost': expected - received,
+            'delivery_ms': summarize_latencies(delivery_latencies),
+            'events_per_second': round(len(sent) / elapsed, 1) if elapsed else None,
+            'deliveries_per_second': round(received / elapsed, 1) if elapsed else None,
+            'queries_per_event': round(event_queries / len(sent), 2) if sent else None,
+        }
+
+    async def pace(self):
+        # Always yield, so readers drain while events are being sent
+        await asyncio.sleep(self.interval)
+
+    # Scenarios
+
+    async def run_scenarios(self, application):
+        report = {}
+        if self.clients and self.messages:
+            report['group'] = await self.group_scenario(application)
+        if self.direct_pairs and self.messages:
+            report['direct'] = await self.direct_scenario(application)
+        if self.notifications and self.messages:
+            report['notifications'] = await self.notification_scenario(application)
+        return report
+
+    async def group_scenario(self, application):
+        """Members of each room take turns broadcasting to the whole room"""
+        members = [(room_id, user) for room_id, users in self.group_members.items() for user in users]
+        sockets = [
+            (f'/ws/group-chat/{room_id}/?token={self.tokens[user.id]}', self.messages)
+            for room_id, user in members
+        ]
+
+        async def send(communicators, sent):
+            senders = {}
+            for (room_id, _), communicator in zip(members, communicators):
+                if communicator is not None:
+                    senders.setdefault(room_id, []).append(communicator)
+
+            async def send_to_room(room_id, room_senders):
+                for index in range(self.messages):
+                    token = f'{TOKEN_PREFIX} group {room_id}/{index}'
+                    sent[token] = time.perf_counter()
+                    await room_senders[index % len(room_senders)].send_json_to({
+                        'type': 'chat_message',
+                        'message': token
+                    })
+                    await self.pace()
+
+            await asyncio.gather(*(send_to_room(room_id, room_senders) for room_id, room_senders in senders.items()))
+
+        return await self.run_scenario(application, sockets, send)
+
+    async def direct_scenario(self, application):
+        """Both users of each one-on-one room take turns sending"""
+        sockets = [
+            (f'/ws/chat/{room_id}/?token={self.tokens[user.id]}', self.messages)
+            for room_id, user1, user2 in self.direct_rooms
+            for user in (user1, user2)
+        ]
+
+        async def send(communicators, sent):
+            async def send_to_room(room_id, pair):
+                for index in range(self.messages):
+                    token = f'{TOKEN_PREFIX} direct {room_id}/{index}'
+                    sent[token] = time.perf_counter()
+                    await pair[index % 2].send_json_to({
+                        'type': 'chat_message',
+                        'message': token,
+                        'client_id': token
+                    })
+                    await self.pace()
+
+            await asyncio.gather(*(
+                send_to_room(room_id, communicators[2 * index:2 * index + 2])
+                for index, (room_id, _, _) in enumerate(self.direct_rooms)
+                if None not in communicators[2 * index:2 * index + 2]
+            ))
+
+        return await self.run_scenario(application, sockets, send)
+
+    async def notification_scenario(self, application):
+        """Notifications saved through the ORM reach their recipient's socket"""
+        recipients = self.users[:self.notifications]
+        sockets = [(f'/ws/notifications/?token={self.tokens[user.id]}', self.messages) for user in recipients]
+        create_notification = database_sync_to_async(ChatNotification.objects.create)
+
+        async def send(communicators, sent):
+            for index in range(self.messages):
+                for user, communicator in zip(recipients, communicators):
+                    if communicator is None:
+                        continue
+                    token = f'{TOKEN_PREFIX} notification {user.id}/{index}'
+                    sent[token] = time.perf_counter()
+                    await create_notification(
+                        recipient=user,
+                        notification_type='new_message',
+                        title=token,
+                        message='Load test notification'
+                    )
+                    await self.pace()
+
+        return await self.run_scenario(application, sockets, send)
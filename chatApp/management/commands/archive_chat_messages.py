@@ -0,0 +1,18 @@
+# chatApp/management/commands/archive_chat_messages.py
+from django.core.management.base import BaseCommand
+
+from chatApp.archive import archive_old_messages, get_archive_config
+
+
+class Command(BaseCommand):
+    help = 'Move old messages of inactive or archived chat rooms into compressed archive segments'
+
+    def add_arguments(self, parser):
+        config = get_archive_config()
+        parser.add_argument('--days', type=int, default=config['AGE_DAYS'])
+        parser.add_argument('--segment-size', type=int, default=config['SEGMENT_SIZE'])
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Archiving messages older than {options['days']} days...")
+        archived = archive_old_messages(options['days'], options['segment_size'])
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} messages"))
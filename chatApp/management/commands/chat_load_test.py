@@ -0,0 +1,67 @@
+# chatApp/management/commands/chat_load_test.py
+import json
+
+from django.core.management.base import BaseCommand
+from django.test.utils import setup_databases, teardown_databases
+
+from chatApp.loadtest import ChatLoadTest
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive simulated WebSocket clients through the chat consumers in process and report '
+        'connect latency, delivery latency percentiles, throughput and queries per event. '
+        'Runs against a throwaway test database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=100, help='Group chat sockets')
+        parser.add_argument('--rooms', type=int, default=10, help='Group chats the clients are spread over')
+        parser.add_argument('--messages', type=int, default=10, help='Events per room, pair or notification socket')
+        parser.add_argument('--direct-pairs', type=int, default=10, help='One-on-one chats, two sockets each')
+        parser.add_argument('--notifications', type=int, default=20, help='Notification sockets')
+        parser.add_argument('--concurrency', type=int, default=50, help='Sockets connecting at the same time')
+        parser.add_argument('--interval', type=float, default=0.0, help='Seconds between events of one room')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Seconds to wait for deliveries per scenario')
+        parser.add_argument('--rate-limits', action='store_true', help='Keep CHAT_RATE_LIMITS enforced')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        load_test = ChatLoadTest(
+            clients=options['clients'],
+            rooms=options['rooms'],
+            messages=options['messages'],
+            direct_pairs=options['direct_pairs'],
+            notifications=options['notifications'],
+            concurrency=options['concurrency'],
+            interval=options['interval'],
+            timeout=options['timeout'],
+            rate_limits=options['rate_limits']
+        )
+
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'}, serialized_aliases=set())
+        try:
+            report = load_test.run()
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        for scenario, result in report.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(scenario))
+            self.stdout.write(f"  sockets        {result['connected']}/{result['sockets']} connected, "
+                              f"{result['queries_per_connect']} queries per connect")
+            self.stdout.write(f"  connect ms     {self.format_latencies(result['connect_ms'])}")
+            self.stdout.write(f"  events         {result['events']} sent, {result['deliveries']} delivered, "
+                              f"{result['lost']} lost")
+            self.stdout.write(f"  delivery ms    {self.format_latencies(result['delivery_ms'])}")
+            self.stdout.write(f"  throughput     {result['events_per_second']} events/s, "
+                              f"{result['deliveries_per_second']} deliveries/s")
+            self.stdout.write(f"  queries/event  {result['queries_per_event']}")
+
+    def format_latencies(self, latencies):
+        if not latencies['count']:
+            return '-'
+        return ' '.join(f'{key} {latencies[key]}' for key in ('p50', 'p90', 'p99', 'max'))
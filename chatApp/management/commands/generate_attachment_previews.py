@@ -0,0 +1,28 @@
+# chatApp/management/commands/generate_attachment_previews.py
+from django.core.management.base import BaseCommand
+
+from chatApp.models import AttachmentBlob
+from chatApp.previews import generate_preview, schedule_preview
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnails and first-page previews for attachments that have none yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inline', action='store_true', help='Render here instead of queueing Celery tasks')
+        parser.add_argument('--retry-failed', action='store_true')
+
+    def handle(self, *args, **options):
+        statuses = ['pending', 'failed'] if options['retry_failed'] else ['pending']
+        if options['retry_failed']:
+            AttachmentBlob.objects.filter(preview_status='failed').update(preview_status='pending')
+
+        total = 0
+        blob_ids = AttachmentBlob.objects.filter(preview_status__in=statuses).values_list('id', flat=True)
+        for blob_id in blob_ids.iterator():
+            if options['inline']:
+                generate_preview(blob_id)
+            else:
+                schedule_preview(blob_id)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(f"Processed {total} attachments"))
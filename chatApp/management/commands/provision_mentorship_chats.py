@@ -0,0 +1,16 @@
+# chatApp/management/commands/provision_mentorship_chats.py
+from django.core.management.base import BaseCommand
+
+from chatApp.provisioning import provision_mentorship_chats
+from mentorshipApp.models import Mentorship
+
+
+class Command(BaseCommand):
+    help = 'Create missing chat rooms and participants for active mentorships'
+
+    def handle(self, *args, **options):
+        total = 0
+        for mentorship in Mentorship.objects.filter(status='active').select_related('department', 'mentee').iterator():
+            provision_mentorship_chats(mentorship)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(f"Provisioned chats for {total} mentorships"))
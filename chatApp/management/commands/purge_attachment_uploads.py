@@ -0,0 +1,23 @@
+# chatApp/management/commands/purge_attachment_uploads.py
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+from chatApp.attachments import cancel_upload
+from chatApp.models import AttachmentUpload
+
+
+class Command(BaseCommand):
+    help = 'Delete chunked attachment uploads that were abandoned before being sent'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24)
+
+    def handle(self, *args, **options):
+        cutoff = now() - timedelta(hours=options['hours'])
+        total = 0
+        for upload in AttachmentUpload.objects.filter(updated_at__lt=cutoff).iterator():
+            cancel_upload(upload)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(f"Purged {total} stale uploads"))
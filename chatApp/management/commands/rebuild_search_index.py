@@ -0,0 +1,39 @@
+# chatApp/management/commands/rebuild_search_index.py
+from django.core.management.base import BaseCommand
+
+from chatApp.models import GroupChatMessage, Message, MessageSearchToken
+from chatApp.search import InvertedIndexSearchBackend, get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the inverted index used by chat message search'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if not isinstance(get_search_backend(), InvertedIndexSearchBackend):
+            self.stdout.write("The active search backend is FULLTEXT; nothing to rebuild.")
+            return
+
+        backend = InvertedIndexSearchBackend()
+        self.stdout.write("Clearing search index...")
+        MessageSearchToken.objects.all().delete()
+
+        total = 0
+        batch_size = options['batch_size']
+        for model in (Message, GroupChatMessage):
+            messages = model.objects.filter(is_deleted=False).only(
+                'id', 'chat_room_id', 'content', 'is_deleted'
+            )
+            batch = []
+            for message in messages.iterator(chunk_size=batch_size):
+                batch.append(message)
+                if len(batch) >= batch_size:
+                    backend.index_messages(batch)
+                    total += len(batch)
+                    batch = []
+            backend.index_messages(batch)
+            total += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} messages"))
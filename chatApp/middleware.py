@@ -0,0 +1,161 @@
+# chatApp/middleware.py
+import asyncio
+import copy
+import logging
+import threading
+import time
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_TTL = 60
+DEFAULT_CACHE_SIZE = 10000
+
+
+def get_token(scope):
+    """Raw JWT from the ?token= query parameter or an Authorization: Bearer header"""
+    query = parse_qs(scope.get('query_string', b'').decode())
+    if query.get('token'):
+        return query['token'][0]
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            parts = value.decode().split()
+            if len(parts) == 2 and parts[0].lower() == 'bearer':
+                return parts[1]
+    return None
+
+
+class TokenUserCache:
+    """
+    Process-local cache of verified tokens and their users.
+
+    Entries live for TTL seconds, or until the token itself expires if that
+    comes first, so a reconnecting client skips both signature verification
+    and the user lookup. The cache is capped at SIZE entries; the oldest
+    are dropped first. Every hit is a copy of the cached user, so
+    connections never share one instance.
+    """
+
+    def __init__(self, ttl=DEFAULT_CACHE_TTL, size=DEFAULT_CACHE_SIZE):
+        self.ttl = ttl
+        self.size = size
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def get(self, token):
+        with self.lock:
+            entry = self.entries.get(token)
+            if entry is None:
+                return None
+            user, expires = entry
+            if expires <= time.time():
+                del self.entries[token]
+                return None
+        return copy.copy(user)
+
+    def set(self, token, user, token_expires):
+        expires = min(time.time() + self.ttl, token_expires)
+        with self.lock:
+            self.entries.pop(token, None)
+            while len(self.entries) >= self.size:
+                del self.entries[next(iter(self.entries))]
+            self.entries[token] = (user, expires)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def authenticate_token(token):
+    """Verify an access token; returns (user, token expiry) or (None, None)"""
+    from rest_framework_simplejwt.exceptions import TokenError
+    from rest_framework_simplejwt.settings import api_settings
+    from rest_framework_simplejwt.tokens import AccessToken
+    from userApp.models import CustomUser
+
+    try:
+        access_token = AccessToken(token)
+    except TokenError:
+        return None, None
+
+    user = CustomUser.objects.filter(
+        **{api_settings.USER_ID_FIELD: access_token[api_settings.USER_ID_CLAIM]}
+    ).first()
+    if user is None or not user.is_active:
+        return None, None
+    return user, access_token['exp']
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_token_cache():
+    """The shared token cache, sized from CHAT_WS_AUTH {'CACHE_TTL', 'CACHE_SIZE'}"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = getattr(settings, 'CHAT_WS_AUTH', {})
+                _cache = TokenUserCache(
+                    ttl=config.get('CACHE_TTL', DEFAULT_CACHE_TTL),
+                    size=config.get('CACHE_SIZE', DEFAULT_CACHE_SIZE)
+                )
+    return _cache
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Populate scope['user'] from a simplejwt access token.
+
+    Verified tokens are cached for a short while, and concurrent connects
+    with the same token share one lookup, so a burst of reconnects costs
+    at most one query per token. A lookup that fails leaves the connection
+    anonymous, for the consumers to reject.
+    """
+
+    def __init__(self, inner):
+        super().__init__(inner)
+        self.inflight = {}
+
+    async def __call__(self, scope, receive, send):
+        scope = dict(scope)
+        token = get_token(scope)
+        user = None
+        if token:
+            try:
+                user = await self.get_user(token)
+            except Exception as e:
+                logger.error(f"WebSocket authentication failed: {e}")
+        scope['user'] = user or AnonymousUser()
+        return await super().__call__(scope, receive, send)
+
+    async def get_user(self, token):
+        cache = get_token_cache()
+        user = cache.get(token)
+        if user is not None:
+            return user
+
+        lookup = self.inflight.get(token)
+        if lookup is None:
+            lookup = asyncio.ensure_future(self._load_user(token))
+            self.inflight[token] = lookup
+            lookup.add_done_callback(lambda _: self.inflight.pop(token, None))
+        user = await asyncio.shield(lookup)
+        # Connects that shared the lookup each get their own instance
+        return copy.copy(user) if user is not None else None
+
+    async def _load_user(self, token):
+        user, expires = await database_sync_to_async(authenticate_token)(token)
+        if user is not None:
+            get_token_cache().set(token, user, expires)
+        return user
+
+
+def JWTAuthMiddlewareStack(inner):
+    return JWTAuthMiddleware(inner)
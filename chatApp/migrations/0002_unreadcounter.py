@@ -0,0 +1,70 @@
+# Generated by Django 6.0 on 2026-10-17 09:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Q
+from django.db.models.functions import Coalesce
+
+
+def backfill_unread_counters(apps, schema_editor):
+    """Seed counters from the current unread state of every room"""
+    ChatRoom = apps.get_model('chatApp', 'ChatRoom')
+    GroupChatParticipant = apps.get_model('chatApp', 'GroupChatParticipant')
+    UnreadCounter = apps.get_model('chatApp', 'UnreadCounter')
+
+    unread = Q(messages__is_deleted=False, messages__is_read=False)
+    counters = []
+    rooms = ChatRoom.objects.annotate(
+        unread_user1=Count('messages', filter=unread & ~Q(messages__sender=F('user1'))),
+        unread_user2=Count('messages', filter=unread & ~Q(messages__sender=F('user2'))),
+    ).values_list('id', 'user1_id', 'user2_id', 'unread_user1', 'unread_user2')
+    for room_id, user1_id, user2_id, unread_user1, unread_user2 in rooms.iterator():
+        counters.append(UnreadCounter(user_id=user1_id, chat_room_id=room_id, count=unread_user1))
+        if user2_id != user1_id:
+            counters.append(UnreadCounter(user_id=user2_id, chat_room_id=room_id, count=unread_user2))
+
+    participants = GroupChatParticipant.objects.annotate(
+        read_until=Coalesce('last_read_at', 'joined_at'),
+    ).annotate(
+        unread=Count(
+            'chat_room__group_messages',
+            filter=Q(
+                chat_room__group_messages__is_deleted=False,
+                chat_room__group_messages__created_at__gt=F('read_until'),
+            ) & ~Q(chat_room__group_messages__sender=F('user')),
+        ),
+    ).values_list('user_id', 'chat_room_id', 'unread')
+    for user_id, chat_room_id, count in participants.iterator():
+        counters.append(UnreadCounter(user_id=user_id, group_chat_room_id=chat_room_id, count=count))
+
+    UnreadCounter.objects.bulk_create(counters, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatApp', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('chat_room', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='unread_counters', to='chatApp.chatroom')),
+                ('group_chat_room', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='unread_counters', to='chatApp.groupchatroom')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='unread_counters', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Unread Counter',
+                'verbose_name_plural': 'Unread Counters',
+                'indexes': [models.Index(fields=['user', 'count'], name='chatApp_unr_user_id_c7a54f_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'chat_room'), name='unique_unread_counter_chat_room'), models.UniqueConstraint(fields=('user', 'group_chat_room'), name='unique_unread_counter_group_chat_room')],
+            },
+        ),
+        migrations.RunPython(backfill_unread_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 6.0 on 2026-10-17 10:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def preview(content, length=100):
+    if content and len(content) > length:
+        return content[:length] + '...'
+    return content or ''
+
+
+def backfill_last_messages(apps, schema_editor):
+    """Point every room at its latest non-deleted message"""
+    for room_model, message_model in (('ChatRoom', 'Message'), ('GroupChatRoom', 'GroupChatMessage')):
+        Room = apps.get_model('chatApp', room_model)
+        RoomMessage = apps.get_model('chatApp', message_model)
+        latest = RoomMessage.objects.filter(
+            chat_room=OuterRef('pk'),
+            is_deleted=False,
+        ).order_by('-created_at', '-id').values('pk')[:1]
+
+        rooms = Room.objects.annotate(latest_id=Subquery(latest)).filter(latest_id__isnull=False)
+        latest_ids = dict(rooms.values_list('pk', 'latest_id'))
+        messages = RoomMessage.objects.in_bulk(list(latest_ids.values()))
+
+        updated = []
+        for room in Room.objects.filter(pk__in=list(latest_ids)).only('pk').iterator():
+            message = messages[latest_ids[room.pk]]
+            room.last_message_id = message.pk
+            room.last_message_preview = preview(message.content)
+            room.last_message_at = message.created_at
+            updated.append(room)
+        Room.objects.bulk_update(
+            updated,
+            ['last_message', 'last_message_preview', 'last_message_at'],
+            batch_size=500,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatApp', '0002_unreadcounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chatApp.message'),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message_preview',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='groupchatroom',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chatApp.groupchatmessage'),
+        ),
+        migrations.AddField(
+            model_name='groupchatroom',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='groupchatroom',
+            name='last_message_preview',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.RunPython(backfill_last_messages, migrations.RunPython.noop),
+    ]
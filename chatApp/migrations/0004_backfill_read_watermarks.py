@@ -0,0 +1,83 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:20
+
+from django.db import migrations
+from django.db.models import Count, F, Max, Q
+from django.db.models.functions import Coalesce
+
+
+BATCH_SIZE = 500
+
+
+def backfill_read_watermarks(apps, schema_editor):
+    """Fold legacy per-message read receipts into participant watermarks"""
+    GroupChatParticipant = apps.get_model('chatApp', 'GroupChatParticipant')
+    GroupMessageReadStatus = apps.get_model('chatApp', 'GroupMessageReadStatus')
+
+    latest_reads = GroupMessageReadStatus.objects.values(
+        'message__chat_room_id', 'user_id'
+    ).annotate(read_until=Max('message__created_at'))
+    watermarks = {
+        (row['message__chat_room_id'], row['user_id']): row['read_until']
+        for row in latest_reads
+    }
+
+    updated = []
+    participants = GroupChatParticipant.objects.only('pk', 'chat_room_id', 'user_id', 'last_read_at')
+    for participant in participants.iterator():
+        read_until = watermarks.get((participant.chat_room_id, participant.user_id))
+        if read_until and (participant.last_read_at is None or participant.last_read_at < read_until):
+            participant.last_read_at = read_until
+            updated.append(participant)
+    GroupChatParticipant.objects.bulk_update(updated, ['last_read_at'], batch_size=BATCH_SIZE)
+
+    participant_ids = [participant.pk for participant in updated]
+    for start in range(0, len(participant_ids), BATCH_SIZE):
+        recount_group_unread(apps, participant_ids[start:start + BATCH_SIZE])
+
+
+def recount_group_unread(apps, participant_ids):
+    """Bring the group counters seeded in 0002 in line with the moved watermarks"""
+    GroupChatParticipant = apps.get_model('chatApp', 'GroupChatParticipant')
+    UnreadCounter = apps.get_model('chatApp', 'UnreadCounter')
+
+    participants = GroupChatParticipant.objects.filter(pk__in=participant_ids).annotate(
+        read_until=Coalesce('last_read_at', 'joined_at'),
+    ).annotate(
+        unread=Count(
+            'chat_room__group_messages',
+            filter=Q(
+                chat_room__group_messages__is_deleted=False,
+                chat_room__group_messages__created_at__gt=F('read_until'),
+            ) & ~Q(chat_room__group_messages__sender=F('user')),
+        ),
+    ).values_list('user_id', 'chat_room_id', 'unread')
+    counts = {(user_id, chat_room_id): unread for user_id, chat_room_id, unread in participants}
+
+    counters = UnreadCounter.objects.filter(
+        user_id__in={user_id for user_id, _ in counts},
+        group_chat_room_id__in={chat_room_id for _, chat_room_id in counts},
+    ).only('pk', 'user_id', 'group_chat_room_id', 'count')
+    changed = []
+    for counter in counters:
+        count = counts.pop((counter.user_id, counter.group_chat_room_id), None)
+        if count is not None and counter.count != count:
+            counter.count = count
+            changed.append(counter)
+    UnreadCounter.objects.bulk_update(changed, ['count'], batch_size=BATCH_SIZE)
+
+    # Participants without a counter yet get one
+    UnreadCounter.objects.bulk_create([
+        UnreadCounter(user_id=user_id, group_chat_room_id=chat_room_id, count=count)
+        for (user_id, chat_room_id), count in counts.items()
+    ], batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatApp', '0003_chatroom_last_message'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_read_watermarks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-17 11:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatApp', '0004_backfill_read_watermarks'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['chat_room', 'is_read'], name='chatApp_mes_chat_ro_659fd7_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 6.0 on 2026-10-17 12:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+FULLTEXT_INDEXES = (
+    ('chatApp_message', 'chat_message_content_ft'),
+    ('chatApp_groupchatmessage', 'chat_group_message_content_ft'),
+)
+
+
+def add_fulltext_indexes(apps, schema_editor):
+    """FULLTEXT indexes back the MySQL search backend"""
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    quote = schema_editor.quote_name
+    for table, index in FULLTEXT_INDEXES:
+        schema_editor.execute(
+            f'ALTER TABLE {quote(table)} ADD FULLTEXT INDEX {quote(index)} ({quote("content")})'
+        )
+
+
+def drop_fulltext_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    quote = schema_editor.quote_name
+    for table, index in FULLTEXT_INDEXES:
+        schema_editor.execute(f'ALTER TABLE {quote(table)} DROP INDEX {quote(index)}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatApp', '0005_message_chat_room_is_read_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64)),
+                ('weight', models.PositiveSmallIntegerField(default=1)),
+                ('chat_room', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='chatApp.chatroom')),
+                ('group_chat_room', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='chatApp.groupchatroom')),
+                ('group_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='chatApp.groupchatmessage')),
+                ('message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='chatApp.message')),
+            ],
+            options={
+                'verbose_name': 'Message Search Token',
+                'verbose_name_plural': 'Message Search Tokens',
+                'indexes': [models.Index(fields=['token', 'chat_room'], name='chatApp_mes_token_435b88_idx'), models.Index(fields=['token', 'group_chat_room'], name='chatApp_mes_token_24b8a5_idx')],
+            },
+        ),
+        migrations.RunPython(add_fulltext_indexes, drop_fulltext_indexes),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 6.0 on 2026-10-17 14:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_sequences(apps, schema_editor):
+    """Number existing messages per room in (created_at, id) order"""
+    for room_model, message_model in (('ChatRoom', 'Message'), ('GroupChatRoom', 'GroupChatMessage')):
+        Room = apps.get_model('chatApp', room_model)
+        RoomMessage = apps.get_model('chatApp', message_model)
+
+        rooms = []
+        for room in Room.objects.only('pk').iterator():
+            messages = list(RoomMessage.objects.filter(chat_room=room).order_by('created_at', 'id').only('pk'))
+            for sequence, message in enumerate(messages, start=1):
+                message.sequence = sequence
+            RoomMessage.objects.bulk_update(messages, ['sequence'], batch_size=1000)
+            room.last_sequence = len(messages)
+            rooms.append(room)
+        Room.objects.bulk_update(rooms, ['last_sequence'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatApp', '0006_messagesearchtoken'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_sequence',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='groupchatmessage',
+            name='sequence',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='groupchatroom',
+            name='last_sequence',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='sequence',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_sequences, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='groupchatmessage',
+            constraint=models.UniqueConstraint(fields=('chat_room', 'sequence'), name='unique_group_message_sequence'),
+        ),
+        migrations.AddConstraint(
+            model_name='message',
+            constraint=models.UniqueConstraint(fields=('chat_room', 'sequence'), name='unique_message_sequence'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-17 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatApp', '0008_attachmentblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachmentblob',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='attachmentblob',
+            name='preview',
+            field=models.FileField(blank=True, null=True, upload_to='chat_previews/'),
+        ),
+        migrations.AddField(
+            model_name='attachmentblob',
+            name='preview_height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='attachmentblob',
+            name='preview_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('unsupported', 'Unsupported'), ('failed', 'Failed')], default='pending', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='attachmentblob',
+            name='preview_width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='attachmentblob',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 6.0 on 2026-10-17 16:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatApp', '0009_attachmentblob_preview'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageArchiveSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message_count', models.PositiveIntegerField()),
+                ('first_sequence', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('last_sequence', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('first_created_at', models.DateTimeField()),
+                ('first_message_id', models.BigIntegerField()),
+                ('last_created_at', models.DateTimeField()),
+                ('last_message_id', models.BigIntegerField()),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('chat_room', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archive_segments', to='chatApp.chatroom')),
+                ('group_chat_room', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archive_segments', to='chatApp.groupchatroom')),
+            ],
+            options={
+                'verbose_name': 'Message Archive Segment',
+                'verbose_name_plural': 'Message Archive Segments',
+                'indexes': [models.Index(fields=['chat_room', 'last_created_at'], name='chatApp_mes_chat_ro_abcc89_idx'), models.Index(fields=['group_chat_room', 'last_created_at'], name='chatApp_mes_group_c_cfe942_idx')],
+            },
+        ),
+    ]
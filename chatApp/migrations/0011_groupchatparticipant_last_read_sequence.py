@@ -0,0 +1,42 @@
+# Generated by Django 6.0 on 2026-10-17 17:40
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_read_sequences(apps, schema_editor):
+    """Translate each participant's last_read_at into the last sequence it covers"""
+    GroupChatParticipant = apps.get_model('chatApp', 'GroupChatParticipant')
+    GroupChatMessage = apps.get_model('chatApp', 'GroupChatMessage')
+
+    latest = GroupChatMessage.objects.filter(
+        chat_room_id=OuterRef('chat_room_id'),
+        sequence__isnull=False,
+        created_at__lte=OuterRef('last_read_at')
+    ).order_by('-sequence').values('sequence')[:1]
+    GroupChatParticipant.objects.filter(last_read_at__isnull=False).update(
+        last_read_sequence=Coalesce(Subquery(latest), Value(0))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatApp', '0010_messagearchivesegment'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='groupchatparticipant',
+            name='last_read_sequence',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='groupchatparticipant',
+            index=models.Index(fields=['chat_room', 'last_read_sequence'], name='chatApp_gro_chat_ro_592dc2_idx'),
+        ),
+        migrations.RunPython(backfill_read_sequences, migrations.RunPython.noop),
+    ]
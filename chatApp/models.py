@@ -1,7 +1,11 @@
-from django.db import models
+import uuid
+from bisect import bisect_left
+
+from django.db import models, transaction
 from django.utils.timezone import now
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db.models import Count, Q
+from django.db.models import Count, F, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
 from userApp.models import CustomUser
 from mentorshipApp.models import Mentorship
 
@@ -13,8 +17,80 @@ class ChatType(models.TextChoices):
     CROSS_DEPARTMENT = 'cross_department', 'Cross-Department Chat'
 
 
-class ChatRoom(models.Model):
+def message_preview(content, length=100):
+    """Shorten message content for inbox listings"""
+    if content and len(content) > length:
+        return content[:length] + '...'
+    return content or ''
+
+
+class LastMessageMixin:
+    """Maintain the denormalized latest visible message of a chat room"""
+    message_relation = None
+    
+    def set_last_message(self, message):
+        """Move the last message pointer forward in a single UPDATE"""
+        preview = message_preview(message.content)
+        updated = type(self).objects.filter(pk=self.pk).filter(
+            Q(last_message_at__isnull=True) | Q(last_message_at__lte=message.created_at)
+        ).update(
+            last_message=message,
+            last_message_preview=preview,
+            last_message_at=message.created_at
+        )
+        if updated:
+            self.last_message = message
+            self.last_message_preview = preview
+            self.last_message_at = message.created_at
+        return bool(updated)
+    
+    def refresh_last_message(self):
+        """Recompute the latest visible message after an edit or delete"""
+        messages = getattr(self, self.message_relation)
+        latest = messages.filter(is_deleted=False).order_by('-created_at', '-id').first()
+        self.last_message = latest
+        self.last_message_preview = message_preview(latest.content) if latest else ''
+        self.last_message_at = latest.created_at if latest else None
+        type(self).objects.filter(pk=self.pk).update(
+            last_message=latest,
+            last_message_preview=self.last_message_preview,
+            last_message_at=self.last_message_at
+        )
+        return latest
+
+
+class MessageSequenceMixin:
+    """Hand out per-room message sequence numbers"""
+    
+    @classmethod
+    def allocate_sequences(cls, room_id, count=1):
+        """Reserve count consecutive sequence numbers and return the first one"""
+        with transaction.atomic():
+            cls.objects.filter(pk=room_id).update(last_sequence=F('last_sequence') + count)
+            last_sequence = cls.objects.filter(pk=room_id).values_list('last_sequence', flat=True).get()
+        return last_sequence - count + 1
+
+
+class SequencedMessageMixin:
+    """
+    Number messages within their room as they are created. The room row stays
+    locked until the message is committed, so sequences become visible in order.
+    """
+    
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.sequence is None:
+            room_model = self._meta.get_field('chat_room').related_model
+            with transaction.atomic():
+                self.sequence = room_model.allocate_sequences(self.chat_room_id)
+                super().save(*args, **kwargs)
+            return
+        super().save(*args, **kwargs)
+
+
+class ChatRoom(LastMessageMixin, MessageSequenceMixin, models.Model):
     """One-on-one chat room model"""
+    message_relation = 'messages'
+    
     CHAT_TYPES = [
         ('mentor_mentee', 'Mentor-Mentee'),
         ('mentee_admin', 'Mentee-Admin'),
@@ -49,6 +125,19 @@ class ChatRoom(models.Model):
         default=None
     )
     is_active = models.BooleanField(default=True)
+    
+    # Latest visible message snapshot for inbox rendering
+    last_message = models.ForeignKey(
+        'Message',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    last_message_preview = models.CharField(max_length=255, blank=True, default='')
+    last_message_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    last_sequence = models.PositiveBigIntegerField(default=0)
+    
     created_at = models.DateTimeField(default=now)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -71,9 +160,19 @@ class ChatRoom(models.Model):
         if user == self.user1:
             return self.user2
         return self.user1
+    
+    def mark_messages_read(self, user):
+        """Mark every unread message from the other user as read in one UPDATE"""
+        read_at = now()
+        count = self.messages.filter(
+            is_deleted=False,
+            is_read=False
+        ).exclude(sender=user).update(is_read=True, read_at=read_at)
+        UnreadCounter.reset(self, user)
+        return count, read_at
 
 
-class Message(models.Model):
+class Message(SequencedMessageMixin, models.Model):
     """Individual messages in chat rooms"""
     MESSAGE_TYPES = [
         ('text', 'Text'),
@@ -95,6 +194,15 @@ class Message(models.Model):
     message_type = models.CharField(max_length=10, choices=MESSAGE_TYPES, default='text')
     content = models.TextField()
     attachment = models.FileField(upload_to='chat_attachments/', blank=True, null=True)
+    attachment_blob = models.ForeignKey(
+        'AttachmentBlob',
+        on_delete=models.SET_NULL,
+        related_name='messages',
+        null=True,
+        blank=True
+    )
+    
+    sequence = models.PositiveBigIntegerField(null=True, blank=True)
     
     # Message status
     is_read = models.BooleanField(default=False)
@@ -109,8 +217,12 @@ class Message(models.Model):
         ordering = ['created_at']
         verbose_name = 'Message'
         verbose_name_plural = 'Messages'
+        constraints = [
+            models.UniqueConstraint(fields=['chat_room', 'sequence'], name='unique_message_sequence'),
+        ]
         indexes = [
             models.Index(fields=['chat_room', 'created_at']),
+            models.Index(fields=['chat_room', 'is_read']),
             models.Index(fields=['sender', 'is_read']),
         ]
     
@@ -123,6 +235,11 @@ class Message(models.Model):
             self.is_read = True
             self.read_at = now()
             self.save(update_fields=['is_read', 'read_at'])
+            if not self.is_deleted:
+                UnreadCounter.decrement(
+                    ChatRoom(pk=self.chat_room_id),
+                    exclude_user_id=self.sender_id
+                )
 
 
 class MessageReadStatus(models.Model):
@@ -151,8 +268,10 @@ class MessageReadStatus(models.Model):
         return f"{self.user.full_name} read message at {self.read_at}"
 
 
-class GroupChatRoom(models.Model):
+class GroupChatRoom(LastMessageMixin, MessageSequenceMixin, models.Model):
     """Group chat room model"""
+    message_relation = 'group_messages'
+    
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True)
     chat_type = models.CharField(max_length=50, choices=ChatType.choices, default=ChatType.MENTORSHIP_GROUP)
@@ -171,6 +290,19 @@ class GroupChatRoom(models.Model):
     )
     is_active = models.BooleanField(default=True)
     is_archived = models.BooleanField(default=False)
+    
+    # Latest visible message snapshot for inbox rendering
+    last_message = models.ForeignKey(
+        'GroupChatMessage',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    last_message_preview = models.CharField(max_length=255, blank=True, default='')
+    last_message_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    last_sequence = models.PositiveBigIntegerField(default=0)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -240,15 +372,49 @@ class GroupChatRoom(models.Model):
     
     def get_unread_count_for_user(self, user):
         """Get unread message count for a specific user"""
-        participant = self.get_participant(user)
-        if not participant:
+        count = self.unread_counters.filter(user=user).values_list('count', flat=True).first()
+        return count or 0
+    
+    def get_read_watermarks(self):
+        """Read state of the whole room for answering receipts of many messages"""
+        return ReadWatermarks(self.chat_participants.filter(
+            last_read_sequence__gt=0
+        ).values_list('user_id', 'last_read_sequence'))
+
+
+class ReadWatermarks:
+    """
+    Participants' last read sequences of one room, sorted. Whoever has read
+    a message is a suffix of the list, so read counts and reader lists for
+    any number of messages come from a single query and a bisect each.
+    """
+    
+    def __init__(self, rows):
+        rows = sorted(rows, key=lambda row: row[1])
+        self.user_ids = [user_id for user_id, _ in rows]
+        self.sequences = [sequence for _, sequence in rows]
+        self.by_user = dict(rows)
+    
+    def _first_reader(self, sequence):
+        return bisect_left(self.sequences, sequence)
+    
+    def read_count(self, sequence, exclude_user_id=None):
+        """How many participants have read the message with this sequence"""
+        if sequence is None:
             return 0
-        
-        last_read = participant.last_read_at or participant.joined_at
-        return self.group_messages.filter(
-            created_at__gt=last_read,
-            is_deleted=False
-        ).exclude(sender=user).count()
+        count = len(self.sequences) - self._first_reader(sequence)
+        if exclude_user_id is not None and self.by_user.get(exclude_user_id, 0) >= sequence:
+            count -= 1
+        return count
+    
+    def read_by(self, sequence, exclude_user_id=None):
+        """User ids of the participants who have read the message with this sequence"""
+        if sequence is None:
+            return []
+        return [
+            user_id for user_id in self.user_ids[self._first_reader(sequence):]
+            if user_id != exclude_user_id
+        ]
     
 class GroupChatParticipant(models.Model):
     """Track participants in group chats with roles"""
@@ -279,6 +445,8 @@ class GroupChatParticipant(models.Model):
     )
     joined_at = models.DateTimeField(default=now)
     last_read_at = models.DateTimeField(null=True, blank=True)
+    # Highest message sequence read; everything up to it counts as read
+    last_read_sequence = models.PositiveBigIntegerField(default=0)
     is_muted = models.BooleanField(default=False)
     
     class Meta:
@@ -287,6 +455,7 @@ class GroupChatParticipant(models.Model):
         verbose_name_plural = 'Group Chat Participants'
         indexes = [
             models.Index(fields=['chat_room', 'user']),
+            models.Index(fields=['chat_room', 'last_read_sequence']),
             models.Index(fields=['role']),
             models.Index(fields=['is_muted']),
         ]
@@ -303,9 +472,55 @@ class GroupChatParticipant(models.Model):
     def can_manage_participants(self):
         """Check if participant can manage other participants"""
         return self.role in ['admin', 'moderator']
+    
+    @classmethod
+    def advance_watermark(cls, chat_room, user, read_at=None, read_sequence=None):
+        """
+        Move a participant's read watermark forward in a single UPDATE.
+        
+        Everything in the room created at or before last_read_at, or with
+        a sequence up to last_read_sequence, counts as read, so the
+        watermark never moves backwards. Without read_at the whole room is
+        marked as read.
+        """
+        read_all = read_at is None
+        if read_all:
+            read_at = now()
+        
+        if read_sequence is None:
+            # Highest sequence stored at read time, from the (chat_room, sequence) index
+            latest = GroupChatMessage.objects.filter(
+                chat_room_id=chat_room.pk,
+                sequence__isnull=False,
+                created_at__lte=read_at
+            ).order_by('-sequence').values('sequence')[:1]
+            read_sequence = Coalesce(Subquery(latest), Value(0))
+        
+        updated = cls.objects.filter(
+            Q(last_read_at__isnull=True) | Q(last_read_at__lt=read_at),
+            chat_room_id=chat_room.pk,
+            user=user
+        ).update(
+            last_read_at=read_at,
+            last_read_sequence=Greatest(F('last_read_sequence'), read_sequence)
+        )
+        
+        if read_all:
+            UnreadCounter.reset(chat_room, user)
+        elif updated:
+            unread = GroupChatMessage.objects.filter(
+                chat_room_id=chat_room.pk,
+                is_deleted=False,
+                created_at__gt=read_at
+            ).exclude(sender=user).count()
+            UnreadCounter.objects.filter(
+                user=user,
+                group_chat_room_id=chat_room.pk
+            ).update(count=unread, updated_at=now())
+        return bool(updated)
 
 
-class GroupChatMessage(models.Model):
+class GroupChatMessage(SequencedMessageMixin, models.Model):
     """Messages in group chats"""
     MESSAGE_TYPES = [
         ('text', 'Text'),
@@ -328,6 +543,13 @@ class GroupChatMessage(models.Model):
     message_type = models.CharField(max_length=20, choices=MESSAGE_TYPES, default='text')
     content = models.TextField()
     attachment = models.FileField(upload_to='group_chat_attachments/', blank=True, null=True)
+    attachment_blob = models.ForeignKey(
+        'AttachmentBlob',
+        on_delete=models.SET_NULL,
+        related_name='group_messages',
+        null=True,
+        blank=True
+    )
     is_edited = models.BooleanField(default=False)
     edited_at = models.DateTimeField(null=True, blank=True)
     is_deleted = models.BooleanField(default=False)
@@ -339,6 +561,7 @@ class GroupChatMessage(models.Model):
         blank=True,
         related_name='replies'
     )
+    sequence = models.PositiveBigIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(default=now)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -346,6 +569,9 @@ class GroupChatMessage(models.Model):
         ordering = ['created_at']
         verbose_name = 'Group Chat Message'
         verbose_name_plural = 'Group Chat Messages'
+        constraints = [
+            models.UniqueConstraint(fields=['chat_room', 'sequence'], name='unique_group_message_sequence'),
+        ]
         indexes = [
             models.Index(fields=['chat_room', 'created_at']),
             models.Index(fields=['sender', 'created_at']),
@@ -356,28 +582,35 @@ class GroupChatMessage(models.Model):
         return f"Message from {self.sender.full_name} in {self.chat_room.name}"
     
     def mark_as_read_by_user(self, user):
-        """Mark message as read by specific user"""
-        GroupMessageReadStatus.objects.get_or_create(
-            message=self,
-            user=user,
-            defaults={'read_at': now()}
+        """Mark this message and everything before it as read by a user"""
+        return GroupChatParticipant.advance_watermark(
+            self.chat_room, user, read_at=self.created_at, read_sequence=self.sequence
         )
     
     def get_read_by(self):
-        """Get users who have read this message"""
+        """Get other participants whose read watermark has reached this message"""
         return CustomUser.objects.filter(
-            group_message_read_statuses__message=self
-        )
+            group_chat_participations__chat_room_id=self.chat_room_id,
+            group_chat_participations__last_read_sequence__gte=self.sequence or 0
+        ).exclude(id=self.sender_id)
     
     def get_unread_by(self):
-        """Get users who haven't read this message"""
-        all_participants = self.chat_room.participants.all()
-        read_users = self.get_read_by()
-        return all_participants.exclude(id__in=read_users.values_list('id', flat=True))
+        """Get other participants who haven't read this message"""
+        return CustomUser.objects.filter(
+            group_chat_participations__chat_room_id=self.chat_room_id,
+            group_chat_participations__last_read_sequence__lt=self.sequence or 0
+        ).exclude(id=self.sender_id)
+    
+    def get_read_count(self):
+        """How many other participants have read this message, from the watermark index"""
+        return GroupChatParticipant.objects.filter(
+            chat_room_id=self.chat_room_id,
+            last_read_sequence__gte=self.sequence or 0
+        ).exclude(user_id=self.sender_id).count()
 
 
 class GroupMessageReadStatus(models.Model):
-    """Track read status of group messages"""
+    """Legacy per-message read receipts, superseded by GroupChatParticipant.last_read_at"""
     message = models.ForeignKey(
         GroupChatMessage,
         on_delete=models.CASCADE,
@@ -396,4 +629,327 @@ class GroupMessageReadStatus(models.Model):
         verbose_name_plural = 'Group Message Read Statuses'
         indexes = [
             models.Index(fields=['user', 'read_at']),
-        ]
\ No newline at end of file
+        ]
+
+class UnreadCounter(models.Model):
+    """Denormalized unread message count per user and chat room"""
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='unread_counters'
+    )
+    chat_room = models.ForeignKey(
+        ChatRoom,
+        on_delete=models.CASCADE,
+        related_name='unread_counters',
+        null=True,
+        blank=True
+    )
+    group_chat_room = models.ForeignKey(
+        GroupChatRoom,
+        on_delete=models.CASCADE,
+        related_name='unread_counters',
+        null=True,
+        blank=True
+    )
+    count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Unread Counter'
+        verbose_name_plural = 'Unread Counters'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'chat_room'], name='unique_unread_counter_chat_room'),
+            models.UniqueConstraint(fields=['user', 'group_chat_room'], name='unique_unread_counter_group_chat_room'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'count']),
+        ]
+    
+    def __str__(self):
+        room = self.chat_room_id or self.group_chat_room_id
+        return f"{self.user.full_name} has {self.count} unread in room {room}"
+    
+    @classmethod
+    def room_filter(cls, room):
+        """Lookup kwargs selecting counters for a ChatRoom or GroupChatRoom"""
+        if isinstance(room, GroupChatRoom):
+            return {'group_chat_room_id': room.pk}
+        return {'chat_room_id': room.pk}
+    
+    @classmethod
+    def ensure(cls, room, user_ids):
+        """Create missing counters for users in a room"""
+        lookup = cls.room_filter(room)
+        cls.objects.bulk_create(
+            [cls(user_id=user_id, **lookup) for user_id in user_ids],
+            ignore_conflicts=True
+        )
+    
+    @classmethod
+    def increment(cls, room, exclude_user_id=None, user_id=None, amount=1):
+        """Add unread messages for a single user or for everyone except the sender"""
+        counters = cls.objects.filter(**cls.room_filter(room))
+        if user_id is not None:
+            counters = counters.filter(user_id=user_id)
+        if exclude_user_id is not None:
+            counters = counters.exclude(user_id=exclude_user_id)
+        return counters.update(count=F('count') + amount, updated_at=now())
+    
+    @classmethod
+    def decrement(cls, room, user_ids=None, exclude_user_id=None, amount=1):
+        """Remove unread messages without going below zero"""
+        counters = cls.objects.filter(count__gt=0, **cls.room_filter(room))
+        if user_ids is not None:
+            counters = counters.filter(user_id__in=user_ids)
+        if exclude_user_id is not None:
+            counters = counters.exclude(user_id=exclude_user_id)
+        return counters.update(
+            count=Greatest(F('count') - amount, Value(0)),
+            updated_at=now()
+        )
+    
+    @classmethod
+    def reset(cls, room, user):
+        """Mark everything in a room as read for a user"""
+        return cls.objects.filter(
+            user=user,
+            count__gt=0,
+            **cls.room_filter(room)
+        ).update(count=0, updated_at=now())
+    
+    @classmethod
+    def visible_for_user(cls, user):
+        """Counters of a user limited to rooms that are still open"""
+        return cls.objects.filter(user=user).filter(
+            Q(chat_room__is_active=True) |
+            Q(group_chat_room__is_active=True, group_chat_room__is_archived=False)
+        )
+    
+    @classmethod
+    def totals_for_user(cls, user):
+        """Unread totals for one-on-one and group chats in a single query"""
+        totals = cls.visible_for_user(user).aggregate(
+            one_on_one=Sum('count', filter=Q(chat_room__isnull=False)),
+            group=Sum('count', filter=Q(group_chat_room__isnull=False))
+        )
+        one_on_one = totals['one_on_one'] or 0
+        group = totals['group'] or 0
+        return {
+            'one_on_one': one_on_one,
+            'group': group,
+            'total': one_on_one + group
+        }
+    
+    @classmethod
+    def counts_for_user(cls, user):
+        """Per-room unread counts for a user, keyed by room id"""
+        chat_counts = {}
+        group_counts = {}
+        rows = cls.visible_for_user(user).filter(count__gt=0).values_list(
+            'chat_room_id', 'group_chat_room_id', 'count'
+        )
+        for chat_room_id, group_chat_room_id, count in rows:
+            if chat_room_id:
+                chat_counts[chat_room_id] = count
+            else:
+                group_counts[group_chat_room_id] = count
+        return chat_counts, group_counts
+
+
+class MessageSearchToken(models.Model):
+    """Inverted index posting used by the fallback chat search backend"""
+    token = models.CharField(max_length=64)
+    chat_room = models.ForeignKey(
+        ChatRoom,
+        on_delete=models.CASCADE,
+        related_name='+',
+        null=True,
+        blank=True
+    )
+    group_chat_room = models.ForeignKey(
+        GroupChatRoom,
+        on_delete=models.CASCADE,
+        related_name='+',
+        null=True,
+        blank=True
+    )
+    message = models.ForeignKey(
+        Message,
+        on_delete=models.CASCADE,
+        related_name='search_tokens',
+        null=True,
+        blank=True
+    )
+    group_message = models.ForeignKey(
+        GroupChatMessage,
+        on_delete=models.CASCADE,
+        related_name='search_tokens',
+        null=True,
+        blank=True
+    )
+    weight = models.PositiveSmallIntegerField(default=1)
+    
+    class Meta:
+        verbose_name = 'Message Search Token'
+        verbose_name_plural = 'Message Search Tokens'
+        indexes = [
+            models.Index(fields=['token', 'chat_room']),
+            models.Index(fields=['token', 'group_chat_room']),
+        ]
+    
+    def __str__(self):
+        return f"{self.token} x{self.weight}"
+
+
+class AttachmentBlob(models.Model):
+    """
+    Attachment content stored once per SHA-256 digest. Messages that post
+    the same file share the blob; it is deleted with its last reference.
+    """
+    PREVIEW_STATUS = [
+        ('pending', 'Pending'),
+        ('ready', 'Ready'),
+        ('unsupported', 'Unsupported'),
+        ('failed', 'Failed'),
+    ]
+    
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to='chat_blobs/')
+    size = models.PositiveBigIntegerField()
+    content_type = models.CharField(max_length=100, blank=True)
+    ref_count = models.PositiveIntegerField(default=0)
+    # Set when writing the content failed; the next upload of it writes it again
+    is_missing = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    # Thumbnail of an image, or the first page of a PDF
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    preview = models.FileField(upload_to='chat_previews/', blank=True, null=True)
+    preview_width = models.PositiveIntegerField(null=True, blank=True)
+    preview_height = models.PositiveIntegerField(null=True, blank=True)
+    preview_status = models.CharField(max_length=12, choices=PREVIEW_STATUS, default='pending')
+    
+    class Meta:
+        verbose_name = 'Attachment Blob'
+        verbose_name_plural = 'Attachment Blobs'
+    
+    def __str__(self):
+        return f"{self.sha256[:12]} ({self.ref_count} refs)"
+    
+    @classmethod
+    def acquire(cls, sha256):
+        """
+        Add a reference to the blob with this digest; None if there is none.
+        A blob whose content is missing is returned too, so the caller can
+        store the content again instead of sharing the broken file.
+        """
+        with transaction.atomic():
+            blob = cls.objects.select_for_update().filter(sha256=sha256).first()
+            if blob is not None:
+                cls.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+                blob.ref_count += 1
+            return blob
+    
+    @classmethod
+    def release(cls, blob_id):
+        """Drop a reference; the last one deletes the blob and its file"""
+        with transaction.atomic():
+            blob = cls.objects.select_for_update().filter(pk=blob_id).first()
+            if blob is None:
+                return
+            if blob.ref_count > 1:
+                cls.objects.filter(pk=blob_id).update(ref_count=F('ref_count') - 1)
+                return
+            storage = blob.file.storage
+            names = [name for name in (blob.file.name, blob.preview.name) if name]
+            blob.delete()
+            
+            def delete_files():
+                for name in names:
+                    storage.delete(name)
+            transaction.on_commit(delete_files)
+
+
+class AttachmentUpload(models.Model):
+    """
+    Resumable chunked upload. Chunks are appended to a part file until the
+    declared size is reached, then the content is stored as an AttachmentBlob
+    that the upload holds a reference to until a message claims it.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='attachment_uploads'
+    )
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    blob = models.ForeignKey(
+        AttachmentBlob,
+        on_delete=models.SET_NULL,
+        related_name='+',
+        null=True,
+        blank=True
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Attachment Upload'
+        verbose_name_plural = 'Attachment Uploads'
+        indexes = [
+            models.Index(fields=['updated_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+    
+    @property
+    def is_complete(self):
+        return self.blob_id is not None
+
+
+class MessageArchiveSegment(models.Model):
+    """
+    A run of consecutive old messages of one room, moved out of the message
+    tables as zlib-compressed JSON lines. Segments cover the oldest part of
+    a room's history, so every archived message sorts before every live one.
+    """
+    chat_room = models.ForeignKey(
+        ChatRoom,
+        on_delete=models.CASCADE,
+        related_name='archive_segments',
+        null=True,
+        blank=True
+    )
+    group_chat_room = models.ForeignKey(
+        GroupChatRoom,
+        on_delete=models.CASCADE,
+        related_name='archive_segments',
+        null=True,
+        blank=True
+    )
+    message_count = models.PositiveIntegerField()
+    first_sequence = models.PositiveBigIntegerField(null=True, blank=True)
+    last_sequence = models.PositiveBigIntegerField(null=True, blank=True)
+    first_created_at = models.DateTimeField()
+    first_message_id = models.BigIntegerField()
+    last_created_at = models.DateTimeField()
+    last_message_id = models.BigIntegerField()
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Message Archive Segment'
+        verbose_name_plural = 'Message Archive Segments'
+        indexes = [
+            models.Index(fields=['chat_room', 'last_created_at']),
+            models.Index(fields=['group_chat_room', 'last_created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.message_count} messages until {self.last_created_at}"
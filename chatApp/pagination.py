@@ -0,0 +1,133 @@
+# chatApp/pagination.py
+import base64
+import binascii
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+
+def encode_cursor(message):
+    """Encode a message position as an opaque cursor"""
+    raw = f'{message.created_at.isoformat()}|{message.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor back into a (created_at, id) position"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        created_at, pk = raw.rsplit('|', 1)
+        position = (parse_datetime(created_at), int(pk))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor('Invalid cursor')
+
+    if position[0] is None:
+        raise InvalidCursor('Invalid cursor')
+    return position
+
+
+def get_page_size(params):
+    """Read the requested page size, clamped to MAX_PAGE_SIZE"""
+    try:
+        limit = int(params.get('limit', DEFAULT_PAGE_SIZE))
+    except (ValueError, TypeError):
+        return DEFAULT_PAGE_SIZE
+    if limit < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def paginate_messages(queryset, params, archive=None):
+    """
+    Keyset-paginate a message queryset on (created_at, id).
+
+    ``before`` walks back through history and ``after`` fetches newer
+    messages; with neither the newest page is returned. Messages come back
+    oldest first. ``next_cursor`` points at the older page (None once history
+    is exhausted) and ``prev_cursor`` at newer messages, so it can also be
+    used to poll for anything sent after the page.
+
+    ``archive`` (an archive.RoomArchive) supplies the archived part of the
+    room's history, which always sorts before the live messages; pages that
+    cross into it are filled from there.
+    """
+    limit = get_page_size(params)
+    before = params.get('before')
+    after = params.get('after')
+
+    if before and after:
+        raise InvalidCursor('Use either before or after, not both')
+
+    if after:
+        position = decode_cursor(after)
+        page = archive.newer(position, limit + 1) if archive else []
+        created_at, pk = position
+        page += list(queryset.filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+        ).order_by('created_at', 'id')[:limit + 1 - len(page)])
+        has_newer = len(page) > limit
+        messages = page[:limit]
+        has_older = True
+    else:
+        position = None
+        if before:
+            position = decode_cursor(before)
+            created_at, pk = position
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+            )
+        page = list(queryset.order_by('-created_at', '-id')[:limit + 1])
+        if archive and len(page) <= limit:
+            if page:
+                position = (page[-1].created_at, page[-1].id)
+            page += archive.older(position, limit + 1 - len(page))
+        has_older = len(page) > limit
+        messages = list(reversed(page[:limit]))
+        has_newer = bool(before)
+
+    if messages:
+        next_cursor = encode_cursor(messages[0]) if has_older else None
+        prev_cursor = encode_cursor(messages[-1])
+    else:
+        next_cursor = None
+        prev_cursor = after or before
+
+    return messages, {
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor,
+        'has_more': has_newer if after else has_older,
+    }
+
+
+def messages_since(queryset, params, archive=None):
+    """
+    Messages with a sequence above ``after_sequence``, oldest first, for
+    clients catching up after a reconnect. ``last_sequence`` is what the
+    client should send next time. Archived messages are read from
+    ``archive`` when the client is that far behind.
+    """
+    try:
+        after_sequence = int(params.get('after_sequence'))
+    except (ValueError, TypeError):
+        raise InvalidCursor('after_sequence must be an integer')
+    if after_sequence < 0:
+        raise InvalidCursor('after_sequence must be an integer')
+
+    limit = get_page_size(params)
+    page = archive.since(after_sequence, limit + 1) if archive else []
+    page += list(queryset.filter(sequence__gt=after_sequence).order_by('sequence')[:limit + 1 - len(page)])
+    messages = page[:limit]
+
+    return messages, {
+        'last_sequence': messages[-1].sequence if messages else after_sequence,
+        'has_more': len(page) > limit,
+    }
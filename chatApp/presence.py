@@ -0,0 +1,139 @@
+# chatApp/presence.py
+import threading
+import time
+
+from django.conf import settings
+
+
+DEFAULT_TTL = 60
+
+
+def room_key(chat_type, room_id):
+    """Presence key of a room; matches the consumer channel group names"""
+    if chat_type == 'group':
+        return f'group_chat_{room_id}'
+    return f'chat_{room_id}'
+
+
+class InMemoryPresenceBackend:
+    """
+    Process-local presence store for tests and single-process development.
+    Every WebSocket connection is tracked separately so a user stays online
+    while any of their tabs still sends heartbeats.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.users = {}
+        self.rooms = {}
+
+    def heartbeat(self, user_id, room, connection_id):
+        """Mark a connection as alive for another TTL"""
+        expires = time.monotonic() + self.ttl
+        with self.lock:
+            self.users.setdefault(user_id, {})[connection_id] = expires
+            self.rooms.setdefault(room, {})[connection_id] = (user_id, expires)
+
+    def leave(self, user_id, room, connection_id):
+        """Forget a connection; returns True when the user has left the room"""
+        with self.lock:
+            self.users.get(user_id, {}).pop(connection_id, None)
+            self.rooms.get(room, {}).pop(connection_id, None)
+        return user_id not in self.online_in_room(room)
+
+    def is_online(self, user_id):
+        with self.lock:
+            return self._live(user_id)
+
+    def online_in_room(self, room):
+        """User ids with a live connection to the room"""
+        now = time.monotonic()
+        with self.lock:
+            connections = self.rooms.get(room, {})
+            for connection_id in [c for c, (_, expires) in connections.items() if expires <= now]:
+                del connections[connection_id]
+            return {user_id for user_id, _ in connections.values()}
+
+    def _live(self, user_id):
+        now = time.monotonic()
+        connections = self.users.get(user_id, {})
+        for connection_id in [c for c, expires in connections.items() if expires <= now]:
+            del connections[connection_id]
+        return bool(connections)
+
+
+class RedisPresenceBackend:
+    """
+    Presence in Redis sorted sets scored by expiry time, shared by every
+    worker. Expired members are trimmed on read and the keys themselves
+    expire, so crashed workers cannot leave users online forever.
+    """
+
+    USER_KEY = 'presence:user:{}'
+    ROOM_KEY = 'presence:room:{}'
+
+    def __init__(self, ttl=DEFAULT_TTL, alias='default'):
+        from django_redis import get_redis_connection
+
+        self.ttl = ttl
+        self.redis = get_redis_connection(alias)
+
+    def heartbeat(self, user_id, room, connection_id):
+        expires = time.time() + self.ttl
+        user_key = self.USER_KEY.format(user_id)
+        room_key = self.ROOM_KEY.format(room)
+        pipe = self.redis.pipeline()
+        pipe.zadd(user_key, {connection_id: expires})
+        pipe.expire(user_key, self.ttl)
+        pipe.zadd(room_key, {f'{user_id}|{connection_id}': expires})
+        pipe.expire(room_key, self.ttl)
+        pipe.execute()
+
+    def leave(self, user_id, room, connection_id):
+        pipe = self.redis.pipeline()
+        pipe.zrem(self.USER_KEY.format(user_id), connection_id)
+        pipe.zrem(self.ROOM_KEY.format(room), f'{user_id}|{connection_id}')
+        pipe.execute()
+        return user_id not in self.online_in_room(room)
+
+    def is_online(self, user_id):
+        user_key = self.USER_KEY.format(user_id)
+        pipe = self.redis.pipeline()
+        pipe.zremrangebyscore(user_key, '-inf', time.time())
+        pipe.zcard(user_key)
+        return pipe.execute()[-1] > 0
+
+    def online_in_room(self, room):
+        room_key = self.ROOM_KEY.format(room)
+        pipe = self.redis.pipeline()
+        pipe.zremrangebyscore(room_key, '-inf', time.time())
+        pipe.zrange(room_key, 0, -1)
+        members = pipe.execute()[-1]
+        return {int(member.decode().split('|', 1)[0]) for member in members}
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_presence():
+    """
+    The configured presence backend, from CHAT_PRESENCE['BACKEND']
+    ('redis' or 'memory'). Defaults to Redis when the cache is django_redis.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                config = getattr(settings, 'CHAT_PRESENCE', {})
+                ttl = config.get('TTL', DEFAULT_TTL)
+                name = config.get('BACKEND')
+                if name is None:
+                    cache_backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+                    name = 'redis' if cache_backend.startswith('django_redis') else 'memory'
+                if name == 'redis':
+                    _backend = RedisPresenceBackend(ttl=ttl)
+                else:
+                    _backend = InMemoryPresenceBackend(ttl=ttl)
+    return _backend
@@ -0,0 +1,126 @@
+# chatApp/previews.py
+import io
+import logging
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from .models import AttachmentBlob
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; without it no previews are generated
+    Image = None
+
+try:
+    import fitz  # PyMuPDF, used for first-page PDF previews
+except ImportError:
+    fitz = None
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PREVIEW_SIZE = 320
+IMAGE_TYPES = ('image/jpeg', 'image/png', 'image/gif')
+PDF_TYPES = ('application/pdf',)
+
+
+def get_preview_config():
+    config = getattr(settings, 'CHAT_PREVIEWS', {})
+    return {
+        'SIZE': config.get('SIZE', DEFAULT_PREVIEW_SIZE),
+        'INLINE': config.get('INLINE', getattr(settings, 'CELERY_TASK_ALWAYS_EAGER', False)),
+    }
+
+
+def open_first_page(blob):
+    """
+    The image to thumbnail and the dimensions of the original: the image
+    itself, or the first page of a PDF rendered at 72 dpi.
+    """
+    if blob.content_type in IMAGE_TYPES and Image is not None:
+        with blob.file.open('rb') as source:
+            image = Image.open(source)
+            image.load()
+        return image, image.size
+
+    if blob.content_type in PDF_TYPES and Image is not None and fitz is not None:
+        with blob.file.open('rb') as source:
+            document = fitz.open(stream=source.read(), filetype='pdf')
+        try:
+            page = document[0]
+            pixmap = page.get_pixmap()
+            image = Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+            return image, (round(page.rect.width), round(page.rect.height))
+        finally:
+            document.close()
+
+    return None, None
+
+
+def generate_preview(blob_id):
+    """
+    Render the preview of one attachment blob and record its dimensions.
+    Blobs are shared by every message posting the same file, so each file
+    is rendered once however often it is reposted.
+    """
+    blob = AttachmentBlob.objects.filter(pk=blob_id).first()
+    if blob is None or blob.preview_status != 'pending':
+        return blob
+
+    try:
+        image, size = open_first_page(blob)
+        if image is None:
+            blob.preview_status = 'unsupported'
+            blob.save(update_fields=['preview_status'])
+            return blob
+
+        blob.width, blob.height = size
+        max_size = get_preview_config()['SIZE']
+        image.thumbnail((max_size, max_size))
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=80)
+
+        blob.preview.save(f'{blob.sha256[:2]}/{blob.sha256}.jpg', ContentFile(buffer.getvalue()), save=False)
+        blob.preview_width, blob.preview_height = image.size
+        blob.preview_status = 'ready'
+    except Exception as e:
+        logger.error(f"Error generating preview for attachment {blob.pk}: {e}")
+        blob.preview_status = 'failed'
+
+    blob.save(update_fields=['width', 'height', 'preview', 'preview_width', 'preview_height', 'preview_status'])
+    return blob
+
+
+def schedule_preview(blob_id):
+    """Generate a preview in the Celery worker, or right away in inline mode"""
+    if get_preview_config()['INLINE']:
+        generate_preview(blob_id)
+        return
+
+    from .tasks import generate_attachment_preview
+    try:
+        generate_attachment_preview.delay(blob_id)
+    except Exception as e:
+        # The preview stays pending; the backfill command picks it up later
+        logger.error(f"Could not queue preview for attachment {blob_id}: {e}")
+
+
+def preview_info(blob, request=None):
+    """Preview fields exposed by the message serializers"""
+    if blob is None:
+        return None
+    info = {
+        'status': blob.preview_status,
+        'width': blob.width,
+        'height': blob.height,
+        'preview_url': None,
+        'preview_width': blob.preview_width,
+        'preview_height': blob.preview_height,
+    }
+    if blob.preview:
+        url = blob.preview.url
+        info['preview_url'] = request.build_absolute_uri(url) if hasattr(request, 'build_absolute_uri') else url
+    return info
@@ -0,0 +1,171 @@
+# chatApp/provisioning.py
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from .models import ChatRoom, GroupChatParticipant, GroupChatRoom, UnreadCounter
+from userApp.models import CustomUser
+
+
+def staff_chat_type(role):
+    return 'mentee_admin' if role == 'admin' else 'mentee_hr'
+
+
+def approved_staff(department_id=None):
+    """
+    (id, role, in_department) of every approved admin and HR user, in one
+    query. in_department tells whether they cover the given department.
+    """
+    staff = CustomUser.objects.filter(role__in=['admin', 'hr'], status='approved')
+    if department_id is None:
+        return [(user_id, role, False) for user_id, role in staff.values_list('id', 'role')]
+    return list(staff.annotate(
+        in_department=Exists(CustomUser.objects.filter(pk=OuterRef('pk'), departments=department_id))
+    ).values_list('id', 'role', 'in_department'))
+
+
+def create_chat_rooms(rooms):
+    """
+    Insert one-on-one rooms, skipping user pairs that already have one, and
+    make sure both users of each room have an unread counter. bulk_create
+    bypasses the post_save signal that creates counters for single rooms.
+    """
+    if not rooms:
+        return 0
+    ChatRoom.objects.bulk_create(rooms, ignore_conflicts=True)
+
+    pairs = Q()
+    for room in rooms:
+        pairs |= Q(user1_id=room.user1_id, user2_id=room.user2_id)
+    UnreadCounter.objects.bulk_create([
+        UnreadCounter(chat_room_id=room_id, user_id=user_id)
+        for room_id, user1_id, user2_id in ChatRoom.objects.filter(pairs).values_list('id', 'user1_id', 'user2_id')
+        for user_id in (user1_id, user2_id)
+    ], ignore_conflicts=True)
+    return len(rooms)
+
+
+def add_participants(participants):
+    """Bulk version of GroupChatRoom.add_participant, unread counters included"""
+    if not participants:
+        return 0
+    GroupChatParticipant.objects.bulk_create(participants, ignore_conflicts=True)
+    UnreadCounter.objects.bulk_create([
+        UnreadCounter(group_chat_room_id=participant.chat_room_id, user_id=participant.user_id)
+        for participant in participants
+    ], ignore_conflicts=True)
+    return len(participants)
+
+
+def provision_staff_chats(mentee_id, staff=None):
+    """Create the mentee's missing one-on-one chats with approved admin and HR users"""
+    staff = approved_staff() if staff is None else staff
+    if not staff:
+        return 0
+    existing = set(ChatRoom.objects.filter(
+        user1_id=mentee_id,
+        user2_id__in=[user_id for user_id, _, _ in staff]
+    ).values_list('user2_id', flat=True))
+    return create_chat_rooms([
+        ChatRoom(user1_id=mentee_id, user2_id=user_id, chat_type=staff_chat_type(role), is_active=True)
+        for user_id, role, _ in staff
+        if user_id not in existing
+    ])
+
+
+def provision_mentorship_chats(mentorship):
+    """
+    Create whatever an active mentorship is missing: the mentor-mentee
+    chat, the mentee's chats with admin/HR, the mentorship group and the
+    department group with their participants.
+
+    Existing rooms and memberships are read with one query each and only
+    the difference is inserted in bulk, so running this again on a fully
+    provisioned mentorship costs a few SELECTs and no writes.
+    """
+    mentor_id, mentee_id = mentorship.mentor_id, mentorship.mentee_id
+
+    with transaction.atomic():
+        staff = approved_staff(mentorship.department_id)
+
+        # One-on-one chats
+        existing_rooms = set(ChatRoom.objects.filter(
+            Q(mentorship=mentorship) |
+            Q(user1_id=mentor_id, user2_id=mentee_id) |
+            Q(user1_id=mentee_id, user2_id__in=[user_id for user_id, _, _ in staff])
+        ).values_list('mentorship_id', 'user1_id', 'user2_id'))
+        paired = {(user1_id, user2_id) for _, user1_id, user2_id in existing_rooms}
+        has_mentorship_chat = any(mentorship_id == mentorship.pk for mentorship_id, _, _ in existing_rooms)
+
+        missing_rooms = []
+        if not has_mentorship_chat and (mentor_id, mentee_id) not in paired:
+            missing_rooms.append(ChatRoom(
+                mentorship=mentorship,
+                chat_type='mentor_mentee',
+                user1_id=mentor_id,
+                user2_id=mentee_id,
+                is_active=True
+            ))
+        missing_rooms += [
+            ChatRoom(user1_id=mentee_id, user2_id=user_id, chat_type=staff_chat_type(role), is_active=True)
+            for user_id, role, _ in staff
+            if (mentee_id, user_id) not in paired
+        ]
+        create_chat_rooms(missing_rooms)
+
+        # Group chats
+        department = mentorship.department
+        dept_chat_name = f"{department.name} Department Chat"
+        group_chat = dept_group_chat = None
+        for room in GroupChatRoom.objects.filter(
+            Q(mentorship=mentorship, chat_type='mentorship_group') |
+            Q(name=dept_chat_name, chat_type='department_group', department=department.name)
+        ).order_by('id'):
+            if room.chat_type == 'mentorship_group':
+                group_chat = group_chat or room
+            else:
+                dept_group_chat = dept_group_chat or room
+
+        created_by_id = mentorship.created_by_id or mentor_id
+        if group_chat is None:
+            mentee = mentorship.mentee
+            group_chat = GroupChatRoom.objects.create(
+                name=f"{mentee.full_name}'s Mentorship Group - {department.name}",
+                description=f"Mentorship group for {mentee.full_name} in {department.name}",
+                chat_type='mentorship_group',
+                department=department.name,
+                mentorship=mentorship,
+                created_by_id=created_by_id,
+                is_active=True
+            )
+        if dept_group_chat is None:
+            dept_group_chat = GroupChatRoom.objects.create(
+                name=dept_chat_name,
+                description=f"Global chat for all mentorship participants in {department.name}",
+                chat_type='department_group',
+                department=department.name,
+                created_by_id=created_by_id,
+                is_active=True
+            )
+
+        # Participants, with the role each would have been added with
+        wanted = {
+            (group_chat.pk, mentor_id): 'moderator',
+            (group_chat.pk, mentee_id): 'member',
+            (dept_group_chat.pk, mentee_id): 'member',
+            (dept_group_chat.pk, mentor_id): 'moderator',
+        }
+        for user_id, _, in_department in staff:
+            if in_department:
+                wanted.setdefault((group_chat.pk, user_id), 'admin')
+
+        existing_members = set(GroupChatParticipant.objects.filter(
+            chat_room_id__in=[group_chat.pk, dept_group_chat.pk]
+        ).values_list('chat_room_id', 'user_id'))
+        added_by = {group_chat.pk: group_chat.created_by_id, dept_group_chat.pk: dept_group_chat.created_by_id}
+        add_participants([
+            GroupChatParticipant(chat_room_id=room_id, user_id=user_id, role=role, added_by_id=added_by[room_id])
+            for (room_id, user_id), role in wanted.items()
+            if (room_id, user_id) not in existing_members
+        ])
+
+    return group_chat, dept_group_chat
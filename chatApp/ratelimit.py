@@ -0,0 +1,207 @@
+# chatApp/ratelimit.py
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+# (tokens per second, burst) per frame type
+DEFAULT_USER_LIMITS = {
+    'chat_message': (1.0, 10),
+    'edit_message': (0.5, 5),
+    'delete_message': (0.5, 5),
+    'typing': (2.0, 10),
+}
+DEFAULT_ROOM_LIMITS = {
+    'chat_message': (20.0, 60),
+    'edit_message': (5.0, 20),
+    'delete_message': (5.0, 20),
+    'typing': (20.0, 60),
+}
+PRUNE_EVERY = 1000
+
+
+def get_rate_limit_config():
+    """
+    CHAT_RATE_LIMITS settings: ENABLED, and USER / ROOM dicts mapping a
+    frame type to (tokens per second, burst). Frame types missing from both
+    are not limited.
+    """
+    config = getattr(settings, 'CHAT_RATE_LIMITS', {})
+    return {
+        'ENABLED': config.get('ENABLED', True),
+        'USER': {**DEFAULT_USER_LIMITS, **config.get('USER', {})},
+        'ROOM': {**DEFAULT_ROOM_LIMITS, **config.get('ROOM', {})},
+    }
+
+
+class TokenBucket:
+    """Holds up to burst tokens, refilled continuously at rate tokens per second"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now, cost=1):
+        """Take cost tokens; returns 0 on success or the seconds to wait otherwise"""
+        self.refill(now)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0
+        return (cost - self.tokens) / self.rate
+
+    def give_back(self, cost=1):
+        self.tokens = min(self.burst, self.tokens + cost)
+
+    def is_full(self, now):
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+class RateLimiter:
+    """
+    Process-local token buckets per user and per room for each limited
+    frame type. A frame needs a token from both; when the room bucket
+    rejects it the user's token is handed back. Buckets that have refilled
+    completely are dropped from time to time, so idle users cost nothing.
+    """
+
+    def __init__(self, config=None, clock=time.monotonic):
+        config = config or get_rate_limit_config()
+        self.enabled = config['ENABLED']
+        self.limits = {'user': config['USER'], 'room': config['ROOM']}
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.counters = {}
+        self.checks = 0
+
+    def _bucket(self, scope, key, action, now):
+        limit = self.limits[scope].get(action)
+        if limit is None:
+            return None
+        bucket = self.buckets.get((scope, key, action))
+        if bucket is None:
+            bucket = self.buckets[(scope, key, action)] = TokenBucket(*limit, now)
+        return bucket
+
+    def _count(self, action, outcome):
+        counters = self.counters.setdefault(action, {'allowed': 0, 'limited_user': 0, 'limited_room': 0})
+        counters[outcome] += 1
+
+    def check(self, action, user_id, room):
+        """
+        Spend a token for one frame. Returns None when the frame may go
+        through, otherwise ('user' or 'room', seconds until it would).
+        """
+        if not self.enabled:
+            return None
+
+        with self.lock:
+            now = self.clock()
+            self.checks += 1
+            if self.checks % PRUNE_EVERY == 0:
+                self._prune(now)
+
+            user_bucket = self._bucket('user', user_id, action, now)
+            room_bucket = self._bucket('room', room, action, now)
+
+            if user_bucket is not None:
+                wait = user_bucket.take(now)
+                if wait:
+                    self._count(action, 'limited_user')
+                    return 'user', wait
+            if room_bucket is not None:
+                wait = room_bucket.take(now)
+                if wait:
+                    if user_bucket is not None:
+                        user_bucket.give_back()
+                    self._count(action, 'limited_room')
+                    return 'room', wait
+
+            if user_bucket is not None or room_bucket is not None:
+                self._count(action, 'allowed')
+            return None
+
+    def _prune(self, now):
+        for key in [key for key, bucket in self.buckets.items() if bucket.is_full(now)]:
+            del self.buckets[key]
+
+    def snapshot(self):
+        """Allowed and rejected frame counts per frame type"""
+        with self.lock:
+            return {action: dict(counters) for action, counters in self.counters.items()}
+
+    def reset(self):
+        with self.lock:
+            self.buckets.clear()
+            self.counters.clear()
+            self.checks = 0
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """The process-wide rate limiter built from CHAT_RATE_LIMITS"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter()
+    return _limiter
+
+
+@receiver(setting_changed)
+def reset_rate_limiter(setting, **kwargs):
+    """Rebuild the limiter when tests override CHAT_RATE_LIMITS"""
+    global _limiter
+    if setting == 'CHAT_RATE_LIMITS':
+        _limiter = None
+
+
+class RateLimitMixin:
+    """
+    Back-pressure for WebSocket consumers with a room_group_name.
+
+    allow_frame() is called before handling a frame. A rejected frame is
+    dropped and the client gets one rate_limited error with retry_after;
+    further rejections of that frame type stay silent until one gets
+    through again, so a flooding client cannot turn the limit into a
+    flood of error frames. Frames whose type is not a string are dropped
+    without an answer, for the same reason.
+    """
+
+    async def allow_frame(self, action):
+        if not isinstance(action, str):
+            return False
+        limited = get_rate_limiter().check(action, self.scope['user'].id, self.room_group_name)
+        if not hasattr(self, 'rate_limited_actions'):
+            self.rate_limited_actions = set()
+        notified = self.rate_limited_actions
+        if limited is None:
+            notified.discard(action)
+            return True
+
+        if action not in notified:
+            notified.add(action)
+            scope, retry_after = limited
+            await self.send_payload({
+                'type': 'error',
+                'code': 'rate_limited',
+                'action': action,
+                'scope': scope,
+                'retry_after': round(retry_after, 3),
+                'message': f'Too many {action} frames, slow down'
+            })
+        return False
@@ -0,0 +1,215 @@
+# chatApp/search.py
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Q, Sum
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+
+from .models import (
+    ChatRoom, GroupChatMessage, GroupChatRoom, Message, MessageSearchToken
+)
+
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+MIN_TOKEN_LENGTH = 2
+MAX_TOKEN_LENGTH = 64
+MAX_QUERY_TERMS = 10
+SNIPPET_LENGTH = 160
+
+
+def tokenize(text):
+    """Split text into lowercase search tokens"""
+    return [
+        token for token in TOKEN_RE.findall((text or '').lower())
+        if MIN_TOKEN_LENGTH <= len(token) <= MAX_TOKEN_LENGTH
+    ]
+
+
+def query_terms(query):
+    """Unique search terms of a query, in the order they were typed"""
+    return list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+
+
+def highlight(content, terms, length=SNIPPET_LENGTH):
+    """
+    Cut a snippet around the first matching term and wrap every match in <mark>.
+    The content is HTML-escaped, so the snippet is safe to render as-is.
+    """
+    content = content or ''
+    if not terms:
+        return escape(content[:length])
+
+    pattern = re.compile(
+        r'\b(' + '|'.join(re.escape(term) for term in terms) + r')\w*',
+        re.IGNORECASE | re.UNICODE
+    )
+    match = pattern.search(content)
+    start = 0
+    if match and match.start() > length // 3:
+        start = match.start() - length // 3
+    end = min(len(content), start + length)
+
+    snippet = []
+    position = start
+    for found in pattern.finditer(content, start, end):
+        snippet.append(escape(content[position:found.start()]))
+        snippet.append(f'<mark>{escape(found.group(0))}</mark>')
+        position = found.end()
+    snippet.append(escape(content[position:end]))
+
+    prefix = '...' if start > 0 else ''
+    suffix = '...' if end < len(content) else ''
+    return prefix + ''.join(snippet) + suffix
+
+
+class InvertedIndexSearchBackend:
+    """Search through MessageSearchToken postings; works on any database"""
+
+    def postings_for(self, message):
+        """Unsaved postings for a Message or GroupChatMessage"""
+        if message.is_deleted:
+            return []
+        is_group = isinstance(message, GroupChatMessage)
+        message_field = 'group_message' if is_group else 'message'
+        room_field = 'group_chat_room_id' if is_group else 'chat_room_id'
+        return [
+            MessageSearchToken(**{
+                'token': token,
+                'weight': min(weight, 32767),
+                message_field: message,
+                room_field: message.chat_room_id,
+            })
+            for token, weight in Counter(tokenize(message.content)).items()
+        ]
+
+    def index_message(self, message):
+        """(Re)build postings for a Message or GroupChatMessage"""
+        message_field = 'group_message' if isinstance(message, GroupChatMessage) else 'message'
+        MessageSearchToken.objects.filter(**{message_field: message}).delete()
+        postings = self.postings_for(message)
+        MessageSearchToken.objects.bulk_create(postings)
+        return len(postings)
+
+    def index_messages(self, messages):
+        """Index freshly created messages with a single INSERT"""
+        postings = [posting for message in messages for posting in self.postings_for(message)]
+        MessageSearchToken.objects.bulk_create(postings, batch_size=1000)
+        return len(postings)
+
+    def search(self, model, room_ids, terms, limit):
+        """Return (rank, message) pairs ordered best first"""
+        is_group = model is GroupChatMessage
+        message_field = 'group_message' if is_group else 'message'
+        room_field = 'group_chat_room_id' if is_group else 'chat_room_id'
+
+        ranked = MessageSearchToken.objects.filter(**{
+            'token__in': terms,
+            f'{room_field}__in': room_ids,
+            f'{message_field}__is_deleted': False,
+        }).values(f'{message_field}_id').annotate(
+            matched=Count('token', distinct=True),
+            score=Sum('weight')
+        ).order_by('-matched', '-score', f'-{message_field}_id')[:limit]
+        ranked = [
+            (row[f'{message_field}_id'], (row['matched'], row['score']))
+            for row in ranked
+        ]
+
+        messages = model.objects.select_related('sender').in_bulk(
+            [message_id for message_id, _ in ranked]
+        )
+        return [
+            (rank, messages[message_id])
+            for message_id, rank in ranked
+            if message_id in messages
+        ]
+
+
+class FullTextSearchBackend:
+    """MySQL FULLTEXT search over the content columns"""
+
+    def index_message(self, message):
+        """FULLTEXT indexes are maintained by MySQL itself"""
+        return 0
+
+    def index_messages(self, messages):
+        return 0
+
+    def search(self, model, room_ids, terms, limit):
+        """Return (rank, message) pairs ordered best first"""
+        column = '{}.{}'.format(
+            connection.ops.quote_name(model._meta.db_table),
+            connection.ops.quote_name('content')
+        )
+        relevance = RawSQL(
+            f'MATCH({column}) AGAINST (%s IN NATURAL LANGUAGE MODE)',
+            (' '.join(terms),)
+        )
+        messages = model.objects.filter(
+            chat_room_id__in=room_ids,
+            is_deleted=False
+        ).annotate(score=relevance).filter(score__gt=0).select_related(
+            'sender'
+        ).order_by('-score', '-created_at')[:limit]
+        return [((message.score,), message) for message in messages]
+
+
+def get_search_backend():
+    """
+    Pick the search backend from CHAT_SEARCH_BACKEND ('fulltext' or 'index').
+    Defaults to FULLTEXT on MySQL and the inverted index everywhere else.
+    """
+    name = getattr(settings, 'CHAT_SEARCH_BACKEND', None)
+    if name is None:
+        name = 'fulltext' if connection.vendor == 'mysql' else 'index'
+    if name == 'fulltext':
+        return FullTextSearchBackend()
+    return InvertedIndexSearchBackend()
+
+
+def search_chat_messages(user, query, page=1, page_size=20):
+    """
+    Search message content in every room the user belongs to.
+    Returns (results, has_more) with one-on-one and group hits ranked together.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return [], False
+
+    backend = get_search_backend()
+    limit = page * page_size + 1
+
+    chat_room_ids = ChatRoom.objects.filter(
+        Q(user1=user) | Q(user2=user),
+        is_active=True
+    ).values('id')
+    group_chat_ids = GroupChatRoom.objects.filter(
+        chat_participants__user=user,
+        is_active=True
+    ).values('id')
+
+    hits = [
+        (rank, 'one_on_one', message)
+        for rank, message in backend.search(Message, chat_room_ids, terms, limit)
+    ] + [
+        (rank, 'group', message)
+        for rank, message in backend.search(GroupChatMessage, group_chat_ids, terms, limit)
+    ]
+    hits.sort(key=lambda hit: (hit[0], hit[2].created_at), reverse=True)
+
+    offset = (page - 1) * page_size
+    page_hits = hits[offset:offset + page_size]
+    results = [{
+        'type': chat_type,
+        'chat_id': message.chat_room_id,
+        'message_id': message.id,
+        'sender_id': message.sender_id,
+        'sender_name': message.sender.full_name,
+        'snippet': highlight(message.content, terms),
+        'score': float(rank[-1]),
+        'timestamp': message.created_at
+    } for rank, chat_type, message in page_hits]
+    return results, len(hits) > offset + page_size
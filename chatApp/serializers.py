@@ -3,8 +3,9 @@ from django.utils.timezone import now
 from .models import (
     ChatRoom, ChatType, Message, MessageReadStatus,
     GroupChatRoom, GroupChatParticipant, GroupChatMessage,
-    GroupMessageReadStatus
+    GroupMessageReadStatus, message_preview
 )
+from .previews import preview_info
 from userApp.models import CustomUser
 from mentorshipApp.models import Mentorship
 
@@ -23,15 +24,16 @@ class MessageSerializer(serializers.ModelSerializer):
     sender = UserBasicSerializer(read_only=True)
     is_own_message = serializers.SerializerMethodField()
     formatted_time = serializers.SerializerMethodField()
+    attachment_preview = serializers.SerializerMethodField()
     
     class Meta:
         model = Message
         fields = [
-            'id', 'sender', 'message_type', 'content', 'attachment',
-            'is_read', 'created_at', 'updated_at', 'is_own_message',
+            'id', 'sequence', 'sender', 'message_type', 'content', 'attachment',
+            'attachment_preview', 'is_read', 'created_at', 'updated_at', 'is_own_message',
             'formatted_time', 'read_at'
         ]
-        read_only_fields = ['id', 'sender', 'created_at', 'updated_at', 'is_read', 'read_at']
+        read_only_fields = ['id', 'sequence', 'sender', 'created_at', 'updated_at', 'is_read', 'read_at']
     
     def get_is_own_message(self, obj):
         request = self.context.get('request')
@@ -41,6 +43,9 @@ class MessageSerializer(serializers.ModelSerializer):
     
     def get_formatted_time(self, obj):
         return obj.created_at.strftime('%H:%M')
+    
+    def get_attachment_preview(self, obj):
+        return preview_info(obj.attachment_blob, self.context.get('request'))
 
 
 class MessageCreateSerializer(serializers.Serializer):
@@ -102,10 +107,10 @@ class ChatRoomSerializer(serializers.ModelSerializer):
         return None
     
     def get_last_message(self, obj):
-        last_message = obj.messages.filter(is_deleted=False).last()
+        last_message = obj.last_message
         if last_message:
             return {
-                'content': last_message.content[:50] + '...' if len(last_message.content) > 50 else last_message.content,
+                'content': message_preview(last_message.content, 50),
                 'sender': last_message.sender.full_name,
                 'sender_id': last_message.sender.id,
                 'created_at': last_message.created_at,
@@ -116,10 +121,8 @@ class ChatRoomSerializer(serializers.ModelSerializer):
     def get_unread_count(self, obj):
         request = self.context.get('request')
         if request and request.user:
-            return obj.messages.filter(
-                is_deleted=False,
-                is_read=False
-            ).exclude(sender=request.user).count()
+            count = obj.unread_counters.filter(user=request.user).values_list('count', flat=True).first()
+            return count or 0
         return 0
 
 
@@ -161,7 +164,7 @@ class GroupChatRoomSerializer(serializers.ModelSerializer):
         if obj.mentorship:
             return {
                 'id': obj.mentorship.id,
-                'program': obj.mentorship.program.name,
+                'program': ', '.join(program.name for program in obj.mentorship.programs.all()) or None,
                 'mentor': obj.mentorship.mentor.full_name,
                 'mentee': obj.mentorship.mentee.full_name
             }
@@ -171,10 +174,10 @@ class GroupChatRoomSerializer(serializers.ModelSerializer):
         return obj.department
     
     def get_last_message(self, obj):
-        last_message = obj.group_messages.filter(is_deleted=False).last()
+        last_message = obj.last_message
         if last_message:
             return {
-                'content': last_message.content[:100] + '...' if len(last_message.content) > 100 else last_message.content,
+                'content': obj.last_message_preview,
                 'sender': last_message.sender.full_name,
                 'sender_id': last_message.sender.id,
                 'created_at': last_message.created_at,
@@ -185,18 +188,7 @@ class GroupChatRoomSerializer(serializers.ModelSerializer):
     def get_unread_count(self, obj):
         request = self.context.get('request')
         if request and request.user:
-            last_read_status = GroupChatParticipant.objects.filter(
-                chat_room=obj,
-                user=request.user
-            ).first()
-            
-            if last_read_status and last_read_status.last_read_at:
-                return obj.group_messages.filter(
-                    created_at__gt=last_read_status.last_read_at,
-                    is_deleted=False
-                ).exclude(sender=request.user).count()
-            else:
-                return obj.group_messages.filter(is_deleted=False).exclude(sender=request.user).count()
+            return obj.get_unread_count_for_user(request.user)
         return 0
     
     def get_can_manage(self, obj):
@@ -213,17 +205,26 @@ class GroupChatMessageSerializer(serializers.ModelSerializer):
     reply_to_info = serializers.SerializerMethodField()
     is_own_message = serializers.SerializerMethodField()
     formatted_time = serializers.SerializerMethodField()
+    read_count = serializers.SerializerMethodField()
     read_by = serializers.SerializerMethodField()
+    attachment_preview = serializers.SerializerMethodField()
     
     class Meta:
         model = GroupChatMessage
         fields = [
-            'id', 'sender', 'message_type', 'content', 'attachment',
-            'is_edited', 'edited_at', 'is_deleted', 'reply_to', 'reply_to_info',
+            'id', 'sequence', 'sender', 'message_type', 'content', 'attachment',
+            'attachment_preview', 'is_edited', 'edited_at', 'is_deleted', 'reply_to', 'reply_to_info',
             'created_at', 'updated_at', 'is_own_message', 'formatted_time',
-            'read_by'
+            'read_count', 'read_by'
         ]
-        read_only_fields = ['id', 'sender', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'sequence', 'sender', 'created_at', 'updated_at']
+    
+    def to_representation(self, obj):
+        data = super().to_representation(obj)
+        # Reader lists only on request (?include=read_by); counts are always there
+        if not self.context.get('include_read_by'):
+            data.pop('read_by', None)
+        return data
     
     def get_reply_to_info(self, obj):
         if obj.reply_to:
@@ -244,8 +245,22 @@ class GroupChatMessageSerializer(serializers.ModelSerializer):
     def get_formatted_time(self, obj):
         return obj.created_at.strftime('%H:%M')
     
+    def get_attachment_preview(self, obj):
+        return preview_info(obj.attachment_blob, self.context.get('request'))
+    
+    def get_read_count(self, obj):
+        watermarks = self.context.get('read_watermarks')
+        if watermarks is not None:
+            return watermarks.read_count(obj.sequence, exclude_user_id=obj.sender_id)
+        return obj.get_read_count()
+    
     def get_read_by(self, obj):
-        return obj.get_read_by().values_list('id', flat=True)
+        if not self.context.get('include_read_by'):
+            return None
+        watermarks = self.context.get('read_watermarks')
+        if watermarks is not None:
+            return watermarks.read_by(obj.sequence, exclude_user_id=obj.sender_id)
+        return list(obj.get_read_by().values_list('id', flat=True))
 
 
 # Additional serializers for chat management
@@ -269,6 +284,7 @@ class GroupMessageCreateSerializer(serializers.Serializer):
     message_type = serializers.ChoiceField(choices=GroupChatMessage.MESSAGE_TYPES, default='text')
     content = serializers.CharField()
     attachment = serializers.FileField(required=False)
+    upload_id = serializers.UUIDField(required=False)
     reply_to_id = serializers.IntegerField(required=False)
 
 
@@ -1,261 +1,178 @@
 # chatApp/signals.py
-from django.db.models.signals import post_save
+from django.db.models import Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_init, post_save
 from django.dispatch import receiver
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
 
 from mentorshipApp.models import Mentorship
-from .models import ChatRoom, GroupChatRoom
+from .models import (
+    AttachmentBlob, ChatRoom, GroupChatRoom, GroupChatParticipant, GroupChatMessage,
+    Message, MessageArchiveSegment, UnreadCounter, message_preview
+)
+from .archive import decode_segment
+from .provisioning import provision_mentorship_chats, provision_staff_chats
+from .search import get_search_backend
+from notificationApp.outbox import enqueue_notifications
 from notificationApp.models import ChatNotification
 from userApp.models import CustomUser
 
 
-@receiver(post_save, sender=Mentorship)
-def create_mentorship_chats(sender, instance, created, **kwargs):
-    """Create chats when mentorship is created"""
-    if created and instance.status == 'active':
-        # Create one-on-one mentor-mentee chat
-        ChatRoom.objects.get_or_create(
-            mentorship=instance,
-            chat_type='mentor_mentee',
-            defaults={
-                'user1': instance.mentor,
-                'user2': instance.mentee,
-                'is_active': True
-            }
-        )
-        
-        # Get the department from the mentorship
-        department = instance.department
-        
-        # Generate group chat name
-        chat_name = f"{instance.mentee.full_name}'s Mentorship Group - {department.name}"
-        
-        # Get admin and HR users in the department
-        admin_hr_users = CustomUser.objects.filter(
-            departments=department,
-            role__in=['admin', 'hr'],
-            status='approved'
-        )
-        
-        # Create mentorship group chat
-        group_chat = GroupChatRoom.objects.create(
-            name=chat_name,
-            description=f"Mentorship group for {instance.mentee.full_name} in {department.name}",
-            chat_type='mentorship_group',
-            department=department.name,
-            mentorship=instance,
-            created_by=instance.created_by if instance.created_by else instance.mentor,
-            is_active=True
-        )
-        
-        # Add participants to mentorship group
-        # Add mentor
-        group_chat.add_participant(
-            instance.mentor, 
-            added_by=group_chat.created_by, 
-            role='moderator'
-        )
-        
-        # Add mentee
-        group_chat.add_participant(
-            instance.mentee, 
-            added_by=group_chat.created_by, 
-            role='member'
-        )
-        
-        # Add admin and HR users
-        for user in admin_hr_users:
-            group_chat.add_participant(
-                user, 
-                added_by=group_chat.created_by, 
-                role='admin'
-            )
-        
-        # Create or get department-wide group chat
-        dept_chat_name = f"{department.name} Department Chat"
-        dept_group_chat, dept_created = GroupChatRoom.objects.get_or_create(
-            name=dept_chat_name,
-            chat_type='department_group',
-            department=department.name,
-            defaults={
-                'description': f"Global chat for all mentorship participants in {department.name}",
-                'created_by': group_chat.created_by,
-                'is_active': True
-            }
-        )
-        
-        # Add mentee to department chat if not already a participant
-        if not dept_group_chat.has_participant(instance.mentee):
-            dept_group_chat.add_participant(
-                instance.mentee, 
-                added_by=group_chat.created_by, 
-                role='member'
-            )
-        
-        # Add mentor to department chat if not already a participant
-        if not dept_group_chat.has_participant(instance.mentor):
-            dept_group_chat.add_participant(
-                instance.mentor, 
-                added_by=group_chat.created_by, 
-                role='moderator'
-            )
+@receiver(post_init, sender=Mentorship)
+def remember_mentorship_status(sender, instance, **kwargs):
+    """Keep the loaded status to detect activation on save"""
+    instance._loaded_status = instance.__dict__.get('status')
 
 
 @receiver(post_save, sender=Mentorship)
-def ensure_user_chats_exist(sender, instance, created, **kwargs):
-    """Ensure all required chats exist for mentorship participants"""
-    if instance.status == 'active':
-        # Ensure one-on-one mentor-mentee chat exists
-        ChatRoom.objects.get_or_create(
-            mentorship=instance,
-            chat_type='mentor_mentee',
-            defaults={
-                'user1': instance.mentor,
-                'user2': instance.mentee,
-                'is_active': True
-            }
-        )
-        
-        # Ensure mentee has one-on-one chats with admin/HR
-        admin_hr_users = CustomUser.objects.filter(
-            role__in=['admin', 'hr'],
-            status='approved'
-        )
-        
-        for staff_user in admin_hr_users:
-            chat_type = 'mentee_admin' if staff_user.role == 'admin' else 'mentee_hr'
-            ChatRoom.objects.get_or_create(
-                user1=instance.mentee,
-                user2=staff_user,
-                defaults={
-                    'chat_type': chat_type,
-                    'is_active': True
-                }
-            )
-        
-        # Ensure mentorship group chat exists
-        department = instance.department
-        
-        group_chat, group_created = GroupChatRoom.objects.get_or_create(
-            mentorship=instance,
-            chat_type='mentorship_group',
-            defaults={
-                'name': f"{instance.mentee.full_name}'s Mentorship - {department.name}",
-                'description': f"Mentorship group for {instance.mentee.full_name} with {instance.mentor.full_name}",
-                'department': department.name,
-                'created_by': instance.created_by if instance.created_by else instance.mentor,
-                'is_active': True
-            }
-        )
-        
-        # Ensure mentor is in the group chat
-        if not group_chat.has_participant(instance.mentor):
-            group_chat.add_participant(
-                instance.mentor, 
-                added_by=group_chat.created_by, 
-                role='moderator'
-            )
-        
-        # Ensure mentee is in the group chat
-        if not group_chat.has_participant(instance.mentee):
-            group_chat.add_participant(
-                instance.mentee, 
-                added_by=group_chat.created_by, 
-                role='member'
-            )
-        
-        # Add relevant admin/HR users from the same department
-        department_staff = CustomUser.objects.filter(
-            departments=department,
-            role__in=['admin', 'hr'],
-            status='approved'
-        )
-        
-        for staff_user in department_staff:
-            if not group_chat.has_participant(staff_user):
-                group_chat.add_participant(
-                    staff_user, 
-                    added_by=group_chat.created_by, 
-                    role='admin'
-                )
-        
-        # Ensure department group chat exists
-        dept_chat_name = f"{department.name} Department Chat"
-        dept_group_chat, dept_created = GroupChatRoom.objects.get_or_create(
-            name=dept_chat_name,
-            chat_type='department_group',
-            department=department.name,
-            defaults={
-                'description': f"Department-wide chat for all {department.name} participants",
-                'created_by': group_chat.created_by,
-                'is_active': True
-            }
-        )
-        
-        # Add mentee to department chat if not already a participant
-        if not dept_group_chat.has_participant(instance.mentee):
-            dept_group_chat.add_participant(
-                instance.mentee, 
-                added_by=dept_group_chat.created_by, 
-                role='member'
-            )
-        
-        # Add mentor to department chat if not already a participant
-        if not dept_group_chat.has_participant(instance.mentor):
-            dept_group_chat.add_participant(
-                instance.mentor, 
-                added_by=dept_group_chat.created_by, 
-                role='moderator'
-            )
+def provision_chats_for_mentorship(sender, instance, created, **kwargs):
+    """Create the chats of a mentorship when it is created active or becomes active"""
+    if instance.status == 'active' and (created or instance._loaded_status != 'active'):
+        provision_mentorship_chats(instance)
+    
+    instance._loaded_status = instance.status
 
 
 @receiver(post_save, sender=CustomUser)
 def create_one_on_one_chats_for_new_user(sender, instance, created, **kwargs):
     """Create one-on-one chats for new users with admin/HR"""
     if created and instance.role == 'mentee':
-        # Get all admin and HR users
-        admin_hr_users = CustomUser.objects.filter(
-            role__in=['admin', 'hr'],
-            status='approved'
-        )
-        
-        # Create one-on-one chats with each admin/HR
-        for admin_hr_user in admin_hr_users:
-            # Determine chat type based on admin_hr_user role
-            chat_type = 'mentee_admin' if admin_hr_user.role == 'admin' else 'mentee_hr'
-            
-            ChatRoom.objects.get_or_create(
-                user1=instance,
-                user2=admin_hr_user,
-                defaults={
-                    'chat_type': chat_type,
-                    'is_active': True
-                }
-            )
+        provision_staff_chats(instance.id)
 
 
 @receiver(post_save, sender=ChatNotification)
 def send_realtime_notification(sender, instance, created, **kwargs):
-    """Send real-time notification via WebSocket when a new notification is created"""
+    """Queue the WebSocket event of a new notification; it is published after commit"""
+    if created:
+        enqueue_notifications([instance])
+
+
+# ==================== LAST MESSAGE POINTERS ====================
+
+def sync_room_last_message(room, instance, created, update_fields):
+    """Keep the room's latest visible message in sync on send, edit and delete"""
+    if created:
+        if not instance.is_deleted:
+            room.set_last_message(instance)
+        return
+    
+    # Read receipts and other bookkeeping saves cannot change the preview
+    if update_fields is not None and not {'content', 'is_deleted'} & set(update_fields):
+        return
+    
+    if instance.is_deleted != instance._was_deleted:
+        room.refresh_last_message()
+    elif not instance.is_deleted:
+        type(room).objects.filter(
+            pk=room.pk,
+            last_message_id=instance.pk
+        ).update(last_message_preview=message_preview(instance.content))
+
+
+@receiver(post_save, sender=Message)
+def update_chat_room_last_message(sender, instance, created, update_fields=None, **kwargs):
+    """Maintain ChatRoom.last_message"""
+    sync_room_last_message(ChatRoom(pk=instance.chat_room_id), instance, created, update_fields)
+
+
+@receiver(post_save, sender=GroupChatMessage)
+def update_group_chat_room_last_message(sender, instance, created, update_fields=None, **kwargs):
+    """Maintain GroupChatRoom.last_message"""
+    sync_room_last_message(GroupChatRoom(pk=instance.chat_room_id), instance, created, update_fields)
+
+
+# ==================== SEARCH INDEX ====================
+
+@receiver(post_save, sender=Message)
+@receiver(post_save, sender=GroupChatMessage)
+def index_message_for_search(sender, instance, created, update_fields=None, **kwargs):
+    """Keep the chat search index in sync with message content"""
+    if not created and update_fields is not None and not {'content', 'is_deleted'} & set(update_fields):
+        return
+    get_search_backend().index_message(instance)
+
+
+# ==================== ATTACHMENT BLOBS ====================
+
+@receiver(post_delete, sender=Message)
+@receiver(post_delete, sender=GroupChatMessage)
+def release_attachment_blob(sender, instance, **kwargs):
+    """Drop the message's reference to its shared attachment"""
+    if instance.attachment_blob_id:
+        AttachmentBlob.release(instance.attachment_blob_id)
+
+
+@receiver(post_delete, sender=MessageArchiveSegment)
+def release_archived_attachment_blobs(sender, instance, **kwargs):
+    """Archived messages keep their attachment references until the segment goes"""
+    model = Message if instance.chat_room_id else GroupChatMessage
+    for message in decode_segment(model, instance.data):
+        if message.attachment_blob_id:
+            AttachmentBlob.release(message.attachment_blob_id)
+
+
+# ==================== UNREAD COUNTERS ====================
+
+@receiver(post_save, sender=ChatRoom)
+def create_chat_room_unread_counters(sender, instance, created, **kwargs):
+    """Create unread counters for both users of a new one-on-one chat"""
+    if created:
+        UnreadCounter.ensure(instance, [instance.user1_id, instance.user2_id])
+
+
+@receiver(post_save, sender=GroupChatParticipant)
+def create_participant_unread_counter(sender, instance, created, **kwargs):
+    """Create an unread counter when a user joins a group chat"""
+    if created:
+        UnreadCounter.ensure(GroupChatRoom(pk=instance.chat_room_id), [instance.user_id])
+
+
+@receiver(post_delete, sender=GroupChatParticipant)
+def delete_participant_unread_counter(sender, instance, **kwargs):
+    """Drop the unread counter of a user leaving a group chat"""
+    UnreadCounter.objects.filter(
+        user_id=instance.user_id,
+        group_chat_room_id=instance.chat_room_id
+    ).delete()
+
+
+@receiver(post_init, sender=Message)
+@receiver(post_init, sender=GroupChatMessage)
+def remember_message_deleted_state(sender, instance, **kwargs):
+    """Keep the loaded is_deleted value to detect soft deletes on save"""
+    instance._was_deleted = instance.__dict__.get('is_deleted', False)
+
+
+@receiver(post_save, sender=Message)
+def update_unread_counters_for_message(sender, instance, created, **kwargs):
+    """Keep one-on-one unread counters in sync with new and deleted messages"""
+    room = ChatRoom(pk=instance.chat_room_id)
+    
+    if created:
+        if not instance.is_deleted and not instance.is_read:
+            UnreadCounter.increment(room, exclude_user_id=instance.sender_id)
+    elif instance.is_deleted and not instance._was_deleted and not instance.is_read:
+        UnreadCounter.decrement(room, exclude_user_id=instance.sender_id)
+    
+    instance._was_deleted = instance.is_deleted
+
+
+@receiver(post_save, sender=GroupChatMessage)
+def update_unread_counters_for_group_message(sender, instance, created, **kwargs):
+    """Keep group unread counters in sync with new and deleted messages"""
+    room = GroupChatRoom(pk=instance.chat_room_id)
+    
     if created:
-        channel_layer = get_channel_layer()
-        
-        # Send to user's notification channel
-        async_to_sync(channel_layer.group_send)(
-            f"user_{instance.recipient.id}",
-            {
-                'type': 'notification_message',
-                'notification': {
-                    'id': instance.id,
-                    'title': instance.title,
-                    'message': instance.message,
-                    'notification_type': instance.notification_type,
-                    'created_at': instance.created_at.isoformat(),
-                    'sender': {
-                        'id': instance.sender.id,
-                        'full_name': instance.sender.full_name
-                    } if instance.sender else None
-                }
-            }
-        )
\ No newline at end of file
+        if not instance.is_deleted:
+            UnreadCounter.increment(room, exclude_user_id=instance.sender_id)
+    elif instance.is_deleted and not instance._was_deleted:
+        # Only participants who had not read up to this message counted it
+        unread_by = GroupChatParticipant.objects.filter(
+            chat_room_id=instance.chat_room_id
+        ).annotate(
+            read_until=Coalesce('last_read_at', 'joined_at')
+        ).filter(
+            read_until__lt=instance.created_at
+        ).exclude(user_id=instance.sender_id).values('user_id')
+        UnreadCounter.decrement(room, user_ids=Subquery(unread_by))
+    
+    instance._was_deleted = instance.is_deleted
@@ -0,0 +1,28 @@
+# chatApp/tasks.py
+from celery import shared_task
+from .archive import archive_old_messages
+from .previews import generate_preview
+import logging
+
+logger = logging.getLogger(__name__)
+
+@shared_task
+def generate_attachment_preview(blob_id):
+    """Celery task to render the thumbnail or first-page preview of an attachment"""
+    try:
+        blob = generate_preview(blob_id)
+        if blob is not None:
+            logger.info(f"Preview for attachment {blob_id}: {blob.preview_status}")
+    except Exception as e:
+        logger.error(f"Error in attachment preview task: {str(e)}")
+
+
+@shared_task
+def archive_chat_messages():
+    """Celery task to move old messages of inactive or archived rooms into archive segments"""
+    try:
+        logger.info("Starting chat archive task")
+        archived = archive_old_messages()
+        logger.info(f"Chat archive task completed: {archived} messages archived")
+    except Exception as e:
+        logger.error(f"Error in chat archive task: {str(e)}")
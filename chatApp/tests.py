@@ -1,3 +1,1641 @@
-from django.test import TestCase
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import date, timedelta
+from unittest import mock, skipIf
 
-# Create your tests here.
+import msgpack
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import re_path, reverse
+from django.utils.timezone import now
+from rest_framework.test import APIClient
+
+from departmentApp.models import Department
+from mentorshipApp.models import Mentorship, MentorshipProgram
+from userApp.models import CustomUser
+from . import attachments
+from .buffer import MessageWriteBuffer
+from .consumers import ChatConsumer, GroupChatConsumer
+from .archive import RoomArchive, archive_old_messages, archive_room
+from .attachments import append_chunk, part_digests, start_upload, store_attachment
+from .directory import search_candidates
+from .provisioning import provision_mentorship_chats
+from .middleware import JWTAuthMiddleware, TokenUserCache, get_token_cache
+from .presence import InMemoryPresenceBackend, RedisPresenceBackend
+from .previews import Image, generate_preview
+from .ratelimit import RateLimiter
+from .typing_indicator import TypingIndicator
+from .wire import DecodeError, WireFormatMixin, encode_msgpack, msgpack_frames
+from .models import (
+    AttachmentBlob, ChatRoom, GroupChatMessage, GroupChatParticipant, GroupChatRoom, Message, MessageArchiveSegment,
+    ReadWatermarks, UnreadCounter
+)
+
+
+CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+WEBSOCKET_ROUTES = URLRouter([
+    re_path(r'ws/chat/(?P<chat_room_id>\w+)/$', ChatConsumer.as_asgi()),
+    re_path(r'ws/group-chat/(?P<group_chat_id>\w+)/$', GroupChatConsumer.as_asgi()),
+])
+
+
+class ChatTestCase(TestCase):
+    """A department with one mentee, and helpers to add mentors and mentorships"""
+
+    def setUp(self):
+        self.department = Department.objects.create(name='Software Development')
+        self.users = 0
+        self.mentee = self.create_user('mentee')
+        self.client = APIClient()
+
+    def create_user(self, role, **fields):
+        self.users += 1
+        kwargs = {'department': self.department.id} if role == 'mentee' else {'departments': [self.department.id]}
+        kwargs.update(fields)
+        kwargs.setdefault('email', f'{role}{self.users}@example.com')
+        kwargs.setdefault('full_name', f'{role.title()} {self.users}')
+        return CustomUser.objects.create_user(
+            phone_number=f'0780000{self.users:03d}',
+            role=role,
+            status='approved',
+            password='password',
+            **kwargs
+        )
+
+    def add_mentorship(self, programs=()):
+        mentor = self.create_user('mentor')
+        mentorship = Mentorship.objects.create(
+            mentor=mentor,
+            mentee=self.mentee,
+            department=self.department,
+            status='active',
+            start_date=date.today()
+        )
+        mentorship.programs.set(programs)
+        Message.objects.create(
+            chat_room=ChatRoom.objects.get(mentorship=mentorship),
+            sender=mentor,
+            content='Hello'
+        )
+        GroupChatMessage.objects.create(
+            chat_room=GroupChatRoom.objects.get(mentorship=mentorship),
+            sender=mentor,
+            content='Welcome to the group'
+        )
+        return mentorship
+
+    def authenticate(self):
+        # A fresh instance per request, as authentication would load it
+        self.client.force_authenticate(CustomUser.objects.get(pk=self.mentee.pk))
+
+
+class MyChatsTests(ChatTestCase):
+    """The inbox of mentors and mentees renders for every kind of chat in a fixed number of queries"""
+
+    QUERY_BUDGET = 8
+
+    def get_my_chats(self):
+        response = self.client.get(reverse('get_my_chats'))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_mentorship_chats_carry_program_names(self):
+        program = MentorshipProgram.objects.create(
+            name='Leadership', department=self.department, description='Leading teams'
+        )
+        mentorship = self.add_mentorship(programs=[program])
+        self.authenticate()
+
+        data = self.get_my_chats()
+
+        self.assertEqual(data['user']['department'], 'Software Development')
+        chats = {(chat['chat_type'], chat['chat_id']): chat for chat in data['chats']}
+        direct = chats[('one_on_one', ChatRoom.objects.get(mentorship=mentorship).id)]
+        self.assertEqual(direct['mentorship_info']['program_name'], 'Leadership')
+        self.assertEqual(direct['other_user']['department'], None)
+        group = chats[('group', GroupChatRoom.objects.get(mentorship=mentorship).id)]
+        self.assertEqual(group['mentorship_info']['program_name'], 'Leadership')
+        self.assertEqual(group['mentorship_info']['mentor_name'], mentorship.mentor.full_name)
+
+    def test_query_count_does_not_grow_with_rooms(self):
+        self.add_mentorship()
+        self.authenticate()
+        # memberships, unread counters, rooms (2), their programs (2), other participants, department
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            data = self.get_my_chats()
+        self.assertEqual(data['stats']['total_chats'], 3)
+
+        for _ in range(5):
+            self.add_mentorship()
+        department_chat = GroupChatRoom.objects.get(chat_type='department_group', department=self.department.name)
+        department_chat.chat_participants.filter(user=self.mentee).update(role='moderator')
+        self.authenticate()
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            data = self.get_my_chats()
+
+        self.assertEqual(data['stats']['total_chats'], 13)
+        chats = {(chat['chat_type'], chat['chat_id']): chat for chat in data['chats']}
+        department = chats[('group', department_chat.id)]
+        # The mentee and the six mentors of the department; five others are listed
+        self.assertEqual(department['total_participants'], 7)
+        self.assertEqual(
+            [participant['full_name'] for participant in department['other_participants']],
+            ['Mentor 2', 'Mentor 3', 'Mentor 4', 'Mentor 5', 'Mentor 6']
+        )
+        self.assertTrue(department['can_manage'])
+        for mentorship_chat in GroupChatRoom.objects.filter(chat_type='mentorship_group'):
+            chat = chats[('group', mentorship_chat.id)]
+            self.assertEqual(chat['total_participants'], 2)
+            self.assertEqual(len(chat['other_participants']), 1)
+            self.assertFalse(chat['can_manage'])
+
+
+class MessagePaginationTests(ChatTestCase):
+    """Keyset pages of list_messages, with messages sharing a timestamp"""
+
+    def setUp(self):
+        super().setUp()
+        mentorship = self.add_mentorship()
+        self.room = ChatRoom.objects.get(mentorship=mentorship)
+        start = now() - timedelta(hours=1)
+        Message.objects.filter(chat_room=self.room).update(created_at=start)
+        for content, minutes in [('One', 1), ('Two', 2), ('Three', 2), ('Four', 2), ('Five', 3)]:
+            Message.objects.create(
+                chat_room=self.room, sender=mentorship.mentor, content=content, created_at=start + timedelta(minutes=minutes)
+            )
+        self.url = reverse('list_messages', args=[self.room.id])
+        self.authenticate()
+
+    def page(self, **params):
+        response = self.client.get(self.url, {'limit': 2, **params})
+        self.assertEqual(response.status_code, 200)
+        return [message['content'] for message in response.data['messages']], response.data
+
+    def test_before_walks_back_through_history(self):
+        contents, data = self.page()
+        self.assertEqual(contents, ['Four', 'Five'])
+        self.assertTrue(data['has_more'])
+
+        # Two and Three share Four's timestamp; the id decides the order
+        contents, data = self.page(before=data['next_cursor'])
+        self.assertEqual(contents, ['Two', 'Three'])
+        self.assertTrue(data['has_more'])
+
+        contents, data = self.page(before=data['next_cursor'])
+        self.assertEqual(contents, ['Hello', 'One'])
+        self.assertFalse(data['has_more'])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_after_fetches_newer_messages(self):
+        _, data = self.page()
+        _, data = self.page(before=data['next_cursor'])
+        _, oldest = self.page(before=data['next_cursor'])
+
+        contents, data = self.page(after=oldest['prev_cursor'])
+        self.assertEqual(contents, ['Two', 'Three'])
+        self.assertTrue(data['has_more'])
+
+        contents, data = self.page(after=data['prev_cursor'])
+        self.assertEqual(contents, ['Four', 'Five'])
+        self.assertFalse(data['has_more'])
+
+        # Nothing newer yet; the cursor is handed back for the next poll
+        cursor = data['prev_cursor']
+        contents, data = self.page(after=cursor)
+        self.assertEqual((contents, data['prev_cursor'], data['has_more']), ([], cursor, False))
+
+    def test_malformed_cursor_is_rejected(self):
+        _, data = self.page()
+        for params in [
+            {'before': 'not a cursor'},
+            {'after': base64.urlsafe_b64encode(b'yesterday|1').decode()},
+            {'before': base64.urlsafe_b64encode(b'2024-01-01T00:00:00|one').decode()},
+            {'before': data['next_cursor'], 'after': data['prev_cursor']},
+        ]:
+            with self.subTest(params=params):
+                response = self.client.get(self.url, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.data)
+
+
+@override_settings(CHANNEL_LAYERS=CHANNEL_LAYERS)
+class MarkMessagesReadTests(ChatTestCase):
+    """Reading a one-on-one room is one UPDATE and one read receipt"""
+
+    def setUp(self):
+        super().setUp()
+        mentorship = self.add_mentorship()
+        self.mentor = mentorship.mentor
+        self.room = ChatRoom.objects.get(mentorship=mentorship)
+        for content in ('One', 'Two', 'Gone'):
+            Message.objects.create(chat_room=self.room, sender=self.mentor, content=content)
+        Message.objects.filter(content='Gone').update(is_deleted=True)
+        Message.objects.create(chat_room=self.room, sender=self.mentee, content='Mine')
+
+    def unread(self, user):
+        return UnreadCounter.objects.get(chat_room=self.room, user=user).count
+
+    def test_marks_the_other_users_messages_in_one_update(self):
+        self.assertGreater(self.unread(self.mentee), 0)
+
+        # The messages and the counter, whatever the number of messages
+        with self.assertNumQueries(2):
+            count, read_at = self.room.mark_messages_read(self.mentee)
+
+        self.assertEqual(count, 3)
+        self.assertEqual(self.unread(self.mentee), 0)
+        self.assertEqual(
+            set(Message.objects.filter(chat_room=self.room, is_read=True).values_list('content', 'read_at')),
+            {('Hello', read_at), ('One', read_at), ('Two', read_at)}
+        )
+        with self.assertNumQueries(2):
+            self.assertEqual(self.room.mark_messages_read(self.mentee)[0], 0)
+
+    def test_view_sends_one_messages_read_event(self):
+        channel_layer = get_channel_layer()
+        self.authenticate()
+
+        async def subscribe():
+            channel = await channel_layer.new_channel()
+            await channel_layer.group_add(f'chat_{self.room.id}', channel)
+            return channel
+
+        channel = async_to_sync(subscribe)()
+        response = self.client.post(reverse('mark_messages_read', args=[self.room.id]))
+        self.assertEqual(response.status_code, 200)
+        event = async_to_sync(channel_layer.receive)(channel)
+        self.assertEqual(
+            (event['type'], event['reader_id'], event['count']),
+            ('messages_read', self.mentee.id, 3)
+        )
+
+        # Nothing left to read, so no second receipt
+        self.client.post(reverse('mark_messages_read', args=[self.room.id]))
+
+        async def receive_nothing():
+            try:
+                await asyncio.wait_for(channel_layer.receive(channel), timeout=0.1)
+            except asyncio.TimeoutError:
+                return True
+            return False
+
+        self.assertTrue(async_to_sync(receive_nothing)())
+
+
+class MessageSearchTests(ChatTestCase):
+    """Message search ranks hits from the user's own rooms and highlights them"""
+
+    def search(self, query, **params):
+        response = self.client.get(reverse('search_messages'), {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_hits_are_ranked_paged_and_limited_to_own_rooms(self):
+        mentorship = self.add_mentorship()
+        mentor = mentorship.mentor
+        chat_room = ChatRoom.objects.get(mentorship=mentorship)
+        group_room = GroupChatRoom.objects.get(mentorship=mentorship)
+        both = Message.objects.create(chat_room=chat_room, sender=mentor, content='<b>Release</b> checklist is ready')
+        Message.objects.create(chat_room=chat_room, sender=self.mentee, content='Release notes')
+        group = GroupChatMessage.objects.create(chat_room=group_room, sender=mentor, content='Release, release planning')
+        deleted = Message.objects.create(chat_room=chat_room, sender=mentor, content='Release secrets')
+        deleted.is_deleted = True
+        deleted.save(update_fields=['is_deleted'])
+
+        other_mentee = self.create_user('mentee')
+        other = Mentorship.objects.create(
+            mentor=mentor, mentee=other_mentee, department=self.department,
+            status='active', start_date=date.today()
+        )
+        Message.objects.create(
+            chat_room=ChatRoom.objects.get(mentorship=other), sender=mentor, content='Release checklist elsewhere'
+        )
+        self.authenticate()
+
+        data = self.search('release checklist', page_size=2)
+
+        self.assertTrue(data['has_more'])
+        self.assertEqual(
+            [(hit['type'], hit['message_id']) for hit in data['results']],
+            [('one_on_one', both.id), ('group', group.id)]
+        )
+        self.assertEqual(
+            data['results'][0]['snippet'],
+            '&lt;b&gt;<mark>Release</mark>&lt;/b&gt; <mark>checklist</mark> is ready'
+        )
+        data = self.search('release checklist', page_size=2, page=2)
+        self.assertFalse(data['has_more'])
+        self.assertEqual([hit['snippet'] for hit in data['results']], ['<mark>Release</mark> notes'])
+
+    def test_edited_message_is_reindexed(self):
+        mentorship = self.add_mentorship()
+        message = Message.objects.create(
+            chat_room=ChatRoom.objects.get(mentorship=mentorship), sender=mentorship.mentor, content='Draft agenda'
+        )
+        message.content = 'Final agenda'
+        message.save(update_fields=['content'])
+        self.authenticate()
+
+        self.assertEqual(self.search('draft')['results'], [])
+        self.assertEqual([hit['message_id'] for hit in self.search('final')['results']], [message.id])
+
+    def test_query_without_terms_is_rejected_or_empty(self):
+        self.authenticate()
+        self.assertEqual(self.client.get(reverse('search_messages'), {'q': ' '}).status_code, 400)
+        self.assertEqual(self.search('a ?')['results'], [])
+
+
+@override_settings(CHANNEL_LAYERS=CHANNEL_LAYERS)
+class ConsumerTestCase(ChatTestCase):
+    """
+    Drives the chat consumers in process as a signed-in user. Each test
+    body is a coroutine run with run_sockets(), so database work of the
+    consumers stays on the test's connection.
+    """
+
+    def run_sockets(self, coroutine_function):
+        return async_to_sync(coroutine_function)()
+
+    async def open_socket(self, path, user, subprotocols=None):
+        communicator = WebsocketCommunicator(WEBSOCKET_ROUTES, path, subprotocols=subprotocols)
+        # What the authentication middleware puts in the scope
+        communicator.scope['user'] = user
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        communicator.subprotocol = subprotocol
+        return communicator
+
+    async def receive_until(self, communicator, frame_type):
+        """Skip presence and status frames up to the first frame of frame_type"""
+        while True:
+            frame = await communicator.receive_json_from(timeout=5)
+            if frame['type'] == frame_type:
+                return frame
+
+    def create_group(self, *members):
+        room = GroupChatRoom.objects.create(name='Study group', created_by=members[0], is_active=True)
+        for member in members:
+            room.add_participant(member)
+        return room
+
+
+class MessageWriteBufferTests(ConsumerTestCase):
+    """Buffered one-on-one messages are stored in batches and broadcast once stored"""
+
+    def setUp(self):
+        super().setUp()
+        mentorship = self.add_mentorship()
+        self.mentor = mentorship.mentor
+        self.room = ChatRoom.objects.get(mentorship=mentorship)
+
+    async def listen(self):
+        channel_layer = get_channel_layer()
+        channel = await channel_layer.new_channel()
+        await channel_layer.group_add(f'chat_{self.room.id}', channel)
+        return channel_layer, channel
+
+    def unread(self, user):
+        return UnreadCounter.objects.get(chat_room=self.room, user=user).count
+
+    def test_full_batch_is_stored_in_order_and_broadcast(self):
+        unread = self.unread(self.mentee)
+        buffer = MessageWriteBuffer(max_batch=3, flush_interval=60)
+
+        async def scenario():
+            channel_layer, channel = await self.listen()
+            for index, sender in enumerate((self.mentor, self.mentee, self.mentor)):
+                await buffer.enqueue(self.room.id, sender.id, f'Message {index}', client_id=f'client-{index}')
+            return [await channel_layer.receive(channel) for _ in range(3)]
+
+        events = self.run_sockets(scenario)
+
+        messages = list(Message.objects.filter(chat_room=self.room, content__startswith='Message').order_by('sequence'))
+        self.assertEqual([message.content for message in messages], ['Message 0', 'Message 1', 'Message 2'])
+        self.assertEqual(
+            [(event['message_id'], event['sequence'], event['client_id']) for event in events],
+            [(message.id, message.sequence, f'client-{index}') for index, message in enumerate(messages)]
+        )
+        self.assertEqual(messages[0].sequence, 2)
+        self.assertEqual(buffer.pending, [])
+        self.assertEqual(self.unread(self.mentee), unread + 2)
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.last_message_id, messages[-1].id)
+
+    def test_partial_batch_is_stored_after_the_interval(self):
+        buffer = MessageWriteBuffer(max_batch=10, flush_interval=0.05)
+
+        async def scenario():
+            await buffer.enqueue(self.room.id, self.mentor.id, 'Waiting')
+            stored_before = await database_sync_to_async(Message.objects.filter(content='Waiting').exists)()
+            await asyncio.sleep(0.2)
+            return stored_before
+
+        self.assertFalse(self.run_sockets(scenario))
+        self.assertTrue(Message.objects.filter(chat_room=self.room, content='Waiting').exists())
+        self.assertIsNone(buffer.timer)
+
+    def test_failed_batch_falls_back_to_single_saves(self):
+        buffer = MessageWriteBuffer(max_batch=10, flush_interval=60)
+
+        async def scenario():
+            channel_layer, channel = await self.listen()
+            await buffer.enqueue(self.room.id, self.mentor.id, 'First')
+            # NOT NULL violation: the batch INSERT fails, then only this row does
+            await buffer.enqueue(self.room.id, self.mentor.id, None)
+            await buffer.enqueue(self.room.id, self.mentee.id, 'Third')
+            with mock.patch('builtins.print'):
+                saved = await buffer.flush()
+            events = [await channel_layer.receive(channel) for _ in range(2)]
+            return saved, events
+
+        saved, events = self.run_sockets(scenario)
+
+        self.assertEqual([message.content for message in saved], ['First', 'Third'])
+        self.assertEqual([event['message'] for event in events], ['First', 'Third'])
+        self.assertEqual(
+            list(Message.objects.filter(chat_room=self.room).exclude(content='Hello').values_list('content', 'sequence')),
+            [('First', 2), ('Third', 3)]
+        )
+
+    def test_disconnect_stores_waiting_messages(self):
+        async def scenario():
+            communicator = await self.open_socket(f'/ws/chat/{self.room.id}/', self.mentee)
+            await communicator.send_json_to({'type': 'chat_message', 'message': 'Before leaving'})
+            await communicator.disconnect()
+
+        with override_settings(CHAT_WRITE_BUFFER={'FLUSH_INTERVAL': 60}):
+            self.run_sockets(scenario)
+        self.assertTrue(Message.objects.filter(chat_room=self.room, content='Before leaving').exists())
+
+
+class FakeRedis:
+    """The sorted-set commands RedisPresenceBackend uses, on dicts"""
+
+    def __init__(self):
+        self.sets = {}
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def zadd(self, key, mapping):
+        self.sets.setdefault(key, {}).update({member.encode(): score for member, score in mapping.items()})
+
+    def zrem(self, key, member):
+        self.sets.get(key, {}).pop(member.encode(), None)
+
+    def zremrangebyscore(self, key, low, high):
+        members = self.sets.get(key, {})
+        for member in [m for m, score in members.items() if score <= high]:
+            del members[member]
+
+    def zcard(self, key):
+        return len(self.sets.get(key, {}))
+
+    def zrange(self, key, start, end):
+        return sorted(self.sets.get(key, {}), key=self.sets[key].get) if key in self.sets else []
+
+    def expire(self, key, seconds):
+        pass
+
+
+class FakePipeline:
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args):
+            self.calls.append((getattr(self.redis, name), args))
+        return queue
+
+    def execute(self):
+        return [method(*args) for method, args in self.calls]
+
+
+class PresenceBackendTestMixin:
+    """Runs against make_backend() with a clock the test moves forward"""
+
+    def setUp(self):
+        self.clock = 1000.0
+        patcher = mock.patch('chatApp.presence.time')
+        clock = patcher.start()
+        self.addCleanup(patcher.stop)
+        clock.monotonic.side_effect = clock.time.side_effect = lambda: self.clock
+        self.presence = self.make_backend()
+
+    def test_connection_expires_without_heartbeats(self):
+        self.presence.heartbeat(1, 'chat_1', 'tab-1')
+        self.clock += 59
+        self.assertTrue(self.presence.is_online(1))
+        self.assertEqual(self.presence.online_in_room('chat_1'), {1})
+
+        self.clock += 1
+        self.assertFalse(self.presence.is_online(1))
+        self.assertEqual(self.presence.online_in_room('chat_1'), set())
+
+    def test_heartbeat_extends_the_ttl(self):
+        self.presence.heartbeat(1, 'chat_1', 'tab-1')
+        self.clock += 45
+        self.presence.heartbeat(1, 'chat_1', 'tab-1')
+        self.clock += 45
+        self.assertTrue(self.presence.is_online(1))
+
+    def test_user_leaves_with_their_last_connection(self):
+        self.presence.heartbeat(1, 'chat_1', 'tab-1')
+        self.presence.heartbeat(1, 'chat_1', 'tab-2')
+        self.presence.heartbeat(2, 'chat_1', 'tab-3')
+
+        self.assertFalse(self.presence.leave(1, 'chat_1', 'tab-1'))
+        self.assertEqual(self.presence.online_in_room('chat_1'), {1, 2})
+        self.assertTrue(self.presence.leave(1, 'chat_1', 'tab-2'))
+        self.assertEqual(self.presence.online_in_room('chat_1'), {2})
+        self.assertFalse(self.presence.is_online(1))
+
+    def test_rooms_are_tracked_separately(self):
+        self.presence.heartbeat(1, 'chat_1', 'tab-1')
+        self.presence.heartbeat(1, 'group_chat_1', 'tab-2')
+
+        self.assertTrue(self.presence.leave(1, 'chat_1', 'tab-1'))
+        self.assertEqual(self.presence.online_in_room('group_chat_1'), {1})
+        self.assertTrue(self.presence.is_online(1))
+
+
+class InMemoryPresenceTests(PresenceBackendTestMixin, SimpleTestCase):
+
+    def make_backend(self):
+        return InMemoryPresenceBackend(ttl=60)
+
+
+class RedisPresenceTests(PresenceBackendTestMixin, SimpleTestCase):
+
+    def make_backend(self):
+        with mock.patch('django_redis.get_redis_connection', return_value=FakeRedis()):
+            return RedisPresenceBackend(ttl=60)
+
+
+class PresenceConsumerTests(ConsumerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('chatApp.consumers.get_presence', return_value=InMemoryPresenceBackend())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mentor = self.create_user('mentor')
+        self.room = self.create_group(self.mentee, self.mentor)
+        self.path = f'/ws/group-chat/{self.room.id}/'
+
+    async def receive_status(self, communicator, user):
+        while True:
+            frame = await self.receive_until(communicator, 'user_status')
+            if frame['user_id'] == user.id:
+                return frame
+
+    def test_connect_sends_the_members_online(self):
+        async def scenario():
+            mentee = await self.open_socket(self.path, self.mentee)
+            first = await self.receive_until(mentee, 'presence')
+            mentor = await self.open_socket(self.path, self.mentor)
+            second = await self.receive_until(mentor, 'presence')
+            status = await self.receive_status(mentee, self.mentor)
+            await mentor.disconnect()
+            await mentee.disconnect()
+            return first, second, status
+
+        first, second, status = self.run_sockets(scenario)
+        self.assertEqual(first['online_user_ids'], [self.mentee.id])
+        self.assertEqual(second['online_user_ids'], sorted([self.mentee.id, self.mentor.id]))
+        self.assertEqual((status['user_id'], status['status']), (self.mentor.id, 'online'))
+
+    def test_offline_is_sent_when_the_last_connection_closes(self):
+        async def scenario():
+            mentee = await self.open_socket(self.path, self.mentee)
+            tabs = [await self.open_socket(self.path, self.mentor) for _ in range(2)]
+            for _ in tabs:
+                await self.receive_status(mentee, self.mentor)
+
+            await tabs[0].disconnect()
+            still_online = await mentee.receive_nothing(timeout=0.2)
+            await tabs[1].disconnect()
+            status = await self.receive_status(mentee, self.mentor)
+            await mentee.disconnect()
+            return still_online, status
+
+        still_online, status = self.run_sockets(scenario)
+        self.assertTrue(still_online)
+        self.assertEqual((status['user_id'], status['status']), (self.mentor.id, 'offline'))
+
+
+class TypingIndicatorTests(SimpleTestCase):
+    """Typing frames are coalesced into at most one change per interval"""
+
+    def setUp(self):
+        self.broadcasts = []
+
+    async def broadcast(self, is_typing):
+        self.broadcasts.append(is_typing)
+
+    def indicator(self, interval=0.1, idle_timeout=5):
+        return TypingIndicator(self.broadcast, interval=interval, idle_timeout=idle_timeout)
+
+    def test_repeated_frames_broadcast_once(self):
+        async def scenario():
+            typing = self.indicator()
+            for _ in range(10):
+                await typing.update(True)
+            typing.cancel()
+
+        async_to_sync(scenario)()
+        self.assertEqual(self.broadcasts, [True])
+
+    def test_early_changes_are_held_back_and_coalesced(self):
+        async def scenario():
+            typing = self.indicator()
+            await typing.update(True)
+            await typing.update(False)
+            await typing.update(True)
+            await typing.update(False)
+            held_back = list(self.broadcasts)
+            await asyncio.sleep(0.2)
+            typing.cancel()
+            return held_back
+
+        self.assertEqual(async_to_sync(scenario)(), [True])
+        self.assertEqual(self.broadcasts, [True, False])
+
+    def test_change_back_within_interval_is_never_sent(self):
+        async def scenario():
+            typing = self.indicator()
+            await typing.update(True)
+            await typing.update(False)
+            await typing.update(True)
+            await asyncio.sleep(0.2)
+            typing.cancel()
+
+        async_to_sync(scenario)()
+        self.assertEqual(self.broadcasts, [True])
+
+    def test_typing_stops_when_idle(self):
+        async def scenario():
+            typing = self.indicator(interval=0, idle_timeout=0.05)
+            await typing.update(True)
+            await asyncio.sleep(0.2)
+
+        async_to_sync(scenario)()
+        self.assertEqual(self.broadcasts, [True, False])
+
+    def test_forced_stop_is_sent_at_once(self):
+        async def scenario():
+            typing = self.indicator(interval=60)
+            await typing.update(True)
+            await typing.stop(force=True)
+            typing.cancel()
+
+        async_to_sync(scenario)()
+        self.assertEqual(self.broadcasts, [True, False])
+
+
+class ResumeTests(ConsumerTestCase):
+    """Reconnecting clients catch up from the last sequence they saw"""
+
+    def setUp(self):
+        super().setUp()
+        mentorship = self.add_mentorship()
+        self.room = ChatRoom.objects.get(mentorship=mentorship)
+        self.group = GroupChatRoom.objects.get(mentorship=mentorship)
+        for content in ('One', 'Two', 'Three'):
+            Message.objects.create(chat_room=self.room, sender=mentorship.mentor, content=content)
+            GroupChatMessage.objects.create(chat_room=self.group, sender=mentorship.mentor, content=content)
+        Message.objects.filter(content='Two').update(is_deleted=True)
+        GroupChatMessage.objects.filter(content='Two').update(is_deleted=True)
+
+    def resume(self, path, *last_sequences):
+        async def scenario():
+            communicator = await self.open_socket(path, self.mentee)
+            frames = []
+            for last_sequence in last_sequences:
+                await communicator.send_json_to({'type': 'resume', 'last_sequence': last_sequence})
+                frames.append(await self.receive_until(communicator, 'error' if last_sequence == 'latest' else 'resume'))
+            await communicator.disconnect()
+            return frames
+
+        return self.run_sockets(scenario)
+
+    def test_chat_resume_skips_seen_and_deleted_messages(self):
+        first, caught_up, error = self.resume(f'/ws/chat/{self.room.id}/', 1, 4, 'latest')
+
+        self.assertEqual([(m['message'], m['sequence']) for m in first['messages']], [('One', 2), ('Three', 4)])
+        self.assertEqual((first['last_sequence'], first['has_more']), (4, False))
+        self.assertEqual((caught_up['messages'], caught_up['last_sequence']), ([], 4))
+        self.assertEqual(error['message'], 'after_sequence must be an integer')
+
+    def test_group_chat_resume(self):
+        sequences = dict(GroupChatMessage.objects.filter(chat_room=self.group).values_list('content', 'sequence'))
+        first, = self.resume(f'/ws/group-chat/{self.group.id}/', sequences['One'] - 1)
+
+        self.assertEqual([m['message'] for m in first['messages']], ['One', 'Three'])
+        self.assertEqual(first['last_sequence'], sequences['Three'])
+
+    def test_message_list_pages_after_sequence(self):
+        self.authenticate()
+        url = reverse('list_messages', args=[self.room.id])
+
+        data = self.client.get(url, {'after_sequence': 1, 'limit': 1}).data
+        self.assertEqual([message['content'] for message in data['messages']], ['One'])
+        self.assertEqual((data['last_sequence'], data['has_more']), (2, True))
+        data = self.client.get(url, {'after_sequence': data['last_sequence'], 'limit': 1}).data
+        self.assertEqual([message['content'] for message in data['messages']], ['Three'])
+        self.assertFalse(data['has_more'])
+        self.assertEqual(self.client.get(url, {'after_sequence': -1}).status_code, 400)
+
+
+class TokenUserCacheTests(SimpleTestCase):
+    """Cached tokens expire with their TTL or the token, whichever is first"""
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('chatApp.middleware.time.time', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = CustomUser(id=1, full_name='Mentee 1')
+
+    def test_entry_expires_after_ttl(self):
+        cache = TokenUserCache(ttl=60, size=10)
+        cache.set('token', self.user, token_expires=self.now + 3600)
+        self.now += 59
+        self.assertEqual(cache.get('token').pk, 1)
+        self.now += 1
+        self.assertIsNone(cache.get('token'))
+        self.assertEqual(cache.entries, {})
+
+    def test_entry_expires_with_token(self):
+        cache = TokenUserCache(ttl=60, size=10)
+        cache.set('token', self.user, token_expires=self.now + 10)
+        self.now += 10
+        self.assertIsNone(cache.get('token'))
+
+    def test_oldest_entry_is_evicted_when_full(self):
+        cache = TokenUserCache(ttl=60, size=2)
+        for token in ('first', 'second', 'third'):
+            cache.set(token, self.user, token_expires=self.now + 3600)
+        self.assertIsNone(cache.get('first'))
+        self.assertIsNotNone(cache.get('second'))
+        self.assertIsNotNone(cache.get('third'))
+
+    def test_hits_are_copies(self):
+        cache = TokenUserCache(ttl=60, size=10)
+        cache.set('token', self.user, token_expires=self.now + 3600)
+        cache.get('token').full_name = 'Changed'
+        self.assertEqual(cache.get('token').full_name, 'Mentee 1')
+
+
+class JWTAuthMiddlewareTests(SimpleTestCase):
+    """Concurrent connects with one token share a lookup but not a user instance"""
+
+    def setUp(self):
+        get_token_cache().clear()
+        self.addCleanup(get_token_cache().clear)
+        self.lookups = 0
+
+    def authenticate(self, token):
+        self.lookups += 1
+        return CustomUser(id=1, full_name='Mentee 1', is_active=True), 2 ** 40
+
+    def connect(self, *tokens):
+        scopes = []
+
+        async def inner(scope, receive, send):
+            scopes.append(scope)
+
+        middleware = JWTAuthMiddleware(inner)
+
+        async def connect_all():
+            await asyncio.gather(*(
+                middleware({'type': 'websocket', 'query_string': f'token={token}'.encode()}, None, None)
+                for token in tokens
+            ))
+
+        async_to_sync(connect_all)()
+        return [scope['user'] for scope in scopes]
+
+    def test_concurrent_connects_share_one_lookup(self):
+        with mock.patch('chatApp.middleware.authenticate_token', self.authenticate):
+            first, second, third = self.connect('token', 'token', 'token')
+        self.assertEqual(self.lookups, 1)
+        self.assertEqual({first.pk, second.pk, third.pk}, {1})
+        first.full_name = 'Changed'
+        self.assertEqual(second.full_name, 'Mentee 1')
+        self.assertIsNot(second, third)
+
+        with mock.patch('chatApp.middleware.authenticate_token', self.authenticate):
+            user, = self.connect('token')
+        self.assertEqual(self.lookups, 1)
+        self.assertEqual(user.full_name, 'Mentee 1')
+
+    def test_failed_lookup_leaves_connection_anonymous(self):
+        with mock.patch('chatApp.middleware.authenticate_token', side_effect=RuntimeError('database is down')), \
+                self.assertLogs('chatApp.middleware', 'ERROR'):
+            first, second = self.connect('token', 'token')
+        self.assertIsInstance(first, AnonymousUser)
+        self.assertIsInstance(second, AnonymousUser)
+        self.assertEqual(get_token_cache().entries, {})
+
+
+class GroupChatConsumerTests(ConsumerTestCase):
+
+    def test_empty_message_is_rejected(self):
+        room = self.create_group(self.mentee)
+
+        async def scenario():
+            communicator = await self.open_socket(f'/ws/group-chat/{room.id}/', self.mentee)
+            await communicator.send_json_to({'type': 'chat_message', 'message': '   '})
+            error = await self.receive_until(communicator, 'error')
+            await communicator.send_json_to({'type': 'chat_message', 'message': ['not', 'text']})
+            second_error = await self.receive_until(communicator, 'error')
+            await communicator.disconnect()
+            return error, second_error
+
+        error, second_error = self.run_sockets(scenario)
+        self.assertEqual(error['message'], 'Message content cannot be empty')
+        self.assertEqual(second_error['message'], 'Message content cannot be empty')
+        self.assertFalse(GroupChatMessage.objects.filter(chat_room=room).exists())
+
+    def test_failed_save_answers_with_error_and_keeps_socket_open(self):
+        room = self.create_group(self.mentee)
+
+        async def scenario():
+            communicator = await self.open_socket(f'/ws/group-chat/{room.id}/', self.mentee)
+            with mock.patch.object(GroupChatMessage.objects, 'create', side_effect=RuntimeError('disk full')):
+                await communicator.send_json_to({'type': 'chat_message', 'message': 'Hello'})
+                error = await self.receive_until(communicator, 'error')
+            await communicator.send_json_to({'type': 'chat_message', 'message': 'Hello again'})
+            delivered = await self.receive_until(communicator, 'group_chat_message')
+            await communicator.disconnect()
+            return error, delivered
+
+        error, delivered = self.run_sockets(scenario)
+        self.assertEqual(error['message'], 'Message could not be sent')
+        self.assertEqual(delivered['message'], 'Hello again')
+        self.assertEqual(list(GroupChatMessage.objects.filter(chat_room=room).values_list('content', flat=True)), ['Hello again'])
+
+
+class WireFormatTests(ConsumerTestCase):
+    """Sockets get JSON or MessagePack frames depending on the negotiated subprotocol"""
+
+    def setUp(self):
+        super().setUp()
+        self.mentor = self.create_user('mentor')
+        self.room = self.create_group(self.mentee, self.mentor)
+        msgpack_frames.entries.clear()
+
+    async def receive_message(self, communicator):
+        """The next group_chat_message frame, decoded as the socket's format"""
+        while True:
+            output = await communicator.receive_output(timeout=5)
+            if output.get('bytes') is not None:
+                frame = msgpack.unpackb(output['bytes'], raw=False)
+            else:
+                frame = json.loads(output['text'])
+            if frame['type'] == 'group_chat_message':
+                return frame, 'bytes' if output.get('bytes') is not None else 'text'
+
+    def exchange(self, sender_subprotocols, receiver_subprotocols):
+        """Send one message in msgpack or JSON and return what each socket negotiated and got"""
+        path = f'/ws/group-chat/{self.room.id}/'
+
+        async def scenario():
+            sender = await self.open_socket(path, self.mentee, sender_subprotocols)
+            receiver = await self.open_socket(path, self.mentor, receiver_subprotocols)
+            payload = {'type': 'chat_message', 'message': 'Hello'}
+            if sender.subprotocol == 'chat.msgpack':
+                await sender.send_to(bytes_data=msgpack.packb(payload))
+            else:
+                await sender.send_json_to(payload)
+            received = [await self.receive_message(sender), await self.receive_message(receiver)]
+            await sender.disconnect()
+            await receiver.disconnect()
+            return [sender.subprotocol, receiver.subprotocol], received
+
+        return self.run_sockets(scenario)
+
+    def test_msgpack_is_negotiated_and_transcoded_once(self):
+        with mock.patch('chatApp.wire.encode_msgpack', wraps=encode_msgpack) as encode:
+            subprotocols, received = self.exchange(['chat.msgpack', 'chat.json'], ['chat.msgpack'])
+
+        self.assertEqual(subprotocols, ['chat.msgpack', 'chat.msgpack'])
+        for frame, kind in received:
+            self.assertEqual((frame['message'], frame['sender_id'], kind), ('Hello', self.mentee.id, 'bytes'))
+        # Both sockets share one encoding of the broadcast
+        encoded = [call.args[0]['type'] for call in encode.call_args_list]
+        self.assertEqual(encoded.count('group_chat_message'), 1)
+
+    def test_json_rooms_never_encode_msgpack(self):
+        with mock.patch('chatApp.wire.encode_msgpack', side_effect=AssertionError('encoded as msgpack')):
+            subprotocols, received = self.exchange(['chat.json'], None)
+
+        self.assertEqual(subprotocols, ['chat.json', None])
+        self.assertEqual([(frame['message'], kind) for frame, kind in received], [('Hello', 'text'), ('Hello', 'text')])
+
+    def test_mixed_room(self):
+        subprotocols, received = self.exchange(['chat.json'], ['chat.msgpack'])
+
+        self.assertEqual(subprotocols, ['chat.json', 'chat.msgpack'])
+        self.assertEqual([kind for _, kind in received], ['text', 'bytes'])
+        self.assertEqual(received[0][0], received[1][0])
+
+    def test_json_is_used_without_msgpack_installed(self):
+        with mock.patch('chatApp.wire.msgpack', None):
+            subprotocols, received = self.exchange(['chat.msgpack'], ['chat.msgpack', 'chat.json'])
+
+        self.assertEqual(subprotocols, [None, 'chat.json'])
+        self.assertEqual([kind for _, kind in received], ['text', 'text'])
+
+
+class DecodeFrameTests(SimpleTestCase):
+    """Incoming frames must decode to an object in the connection's format"""
+
+    def consumer(self, subprotocol):
+        consumer = WireFormatMixin()
+        consumer.subprotocol = subprotocol
+        return consumer
+
+    def test_frames_are_decoded(self):
+        self.assertEqual(self.consumer('chat.msgpack').decode_frame(bytes_data=msgpack.packb({'a': 1})), {'a': 1})
+        self.assertEqual(self.consumer('chat.msgpack').decode_frame(text_data='{"a": 1}'), {'a': 1})
+        self.assertEqual(self.consumer(None).decode_frame(text_data='{"a": 1}'), {'a': 1})
+
+    def test_invalid_frames_raise_decode_error(self):
+        for subprotocol, frame in (
+            ('chat.msgpack', {'bytes_data': b'\xc1'}),
+            ('chat.msgpack', {'bytes_data': msgpack.packb([1, 2])}),
+            (None, {'text_data': 'not json'}),
+            (None, {'text_data': '"text"'}),
+        ):
+            with self.subTest(subprotocol=subprotocol, frame=frame), self.assertRaises(DecodeError):
+                self.consumer(subprotocol).decode_frame(**frame)
+
+
+class AttachmentStorageTests(ChatTestCase):
+    """Attachments are stored once per digest and hashed as they arrive"""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        overrides = override_settings(
+            MEDIA_ROOT=self.media_root,
+            CHAT_UPLOADS={'TEMP_DIR': os.path.join(self.media_root, 'chat_uploads')},
+            CHAT_PREVIEWS={'INLINE': True}
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        part_digests.entries.clear()
+
+    def stored_files(self):
+        blob_dir = os.path.join(self.media_root, 'chat_blobs')
+        return sorted(
+            os.path.relpath(os.path.join(path, name), blob_dir)
+            for path, _, names in os.walk(blob_dir) for name in names
+        )
+
+    def store(self, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            return store_attachment(SimpleUploadedFile('notes.txt', content), 'text/plain')
+
+    def test_same_content_is_stored_once_and_released_with_last_reference(self):
+        first = self.store(b'meeting notes')
+        second = self.store(b'meeting notes')
+        other = self.store(b'other notes')
+
+        sha256 = hashlib.sha256(b'meeting notes').hexdigest()
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(first.sha256, sha256)
+        self.assertEqual(AttachmentBlob.objects.get(pk=first.pk).ref_count, 2)
+        self.assertEqual(len(self.stored_files()), 2)
+        with AttachmentBlob.objects.get(pk=first.pk).file.open('rb') as stored:
+            self.assertEqual(stored.read(), b'meeting notes')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            AttachmentBlob.release(first.pk)
+        self.assertEqual(AttachmentBlob.objects.get(pk=first.pk).ref_count, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            AttachmentBlob.release(first.pk)
+        self.assertFalse(AttachmentBlob.objects.filter(pk=first.pk).exists())
+        self.assertEqual(self.stored_files(), [f'{other.sha256[:2]}/{other.sha256}'])
+
+    def test_rolled_back_store_writes_nothing(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                store_attachment(SimpleUploadedFile('notes.txt', b'draft'), 'text/plain')
+                raise RuntimeError('message could not be saved')
+        self.assertEqual(callbacks, [])
+        self.assertFalse(AttachmentBlob.objects.exists())
+        self.assertEqual(self.stored_files(), [])
+
+    def test_failed_write_is_retried_by_the_next_upload(self):
+        storage = AttachmentBlob._meta.get_field('file').storage
+        with mock.patch.object(storage, 'save', side_effect=OSError('disk full')), \
+                self.assertLogs('chatApp.attachments', 'ERROR'):
+            broken = self.store(b'meeting notes')
+        self.assertTrue(AttachmentBlob.objects.get(pk=broken.pk).is_missing)
+        self.assertEqual(self.stored_files(), [])
+
+        blob = self.store(b'meeting notes')
+
+        self.assertEqual(blob.pk, broken.pk)
+        blob.refresh_from_db()
+        self.assertFalse(blob.is_missing)
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual(self.stored_files(), [f'{blob.sha256[:2]}/{blob.sha256}'])
+        with blob.file.open('rb') as stored:
+            self.assertEqual(stored.read(), b'meeting notes')
+        # Stored content is shared again without another write
+        with mock.patch.object(storage, 'save', side_effect=AssertionError('written again')):
+            self.assertEqual(self.store(b'meeting notes').pk, blob.pk)
+
+    def send_attachment(self, content):
+        chat_room = ChatRoom.objects.get(mentorship=self.add_mentorship())
+        self.authenticate()
+        # The storage write runs on commit, which the test transaction never reaches
+        with mock.patch.object(attachments, 'file_digest', side_effect=AssertionError('file read again')):
+            response = self.client.post(reverse('send_message'), {
+                'chat_room_id': chat_room.id,
+                'content': 'See attached',
+                'attachment': SimpleUploadedFile('notes.txt', content, content_type='text/plain')
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        return Message.objects.get(chat_room=chat_room, content='See attached').attachment_blob
+
+    def test_posted_attachment_is_hashed_while_parsed(self):
+        blob = self.send_attachment(b'kept in memory')
+        self.assertEqual(blob.sha256, hashlib.sha256(b'kept in memory').hexdigest())
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=4)
+    def test_spooled_attachment_is_hashed_while_parsed(self):
+        blob = self.send_attachment(b'spooled to a temporary file')
+        self.assertEqual(blob.sha256, hashlib.sha256(b'spooled to a temporary file').hexdigest())
+
+    def upload_in_chunks(self, content, forget_progress=False):
+        upload = start_upload(self.mentee, 'notes.txt', 'text/plain', len(content))
+        middle = len(content) // 2
+        append_chunk(upload.id, self.mentee, 0, io.BytesIO(content[:middle]))
+        if forget_progress:
+            # As if the next chunk were served by another process
+            part_digests.entries.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            upload = append_chunk(upload.id, self.mentee, middle, io.BytesIO(content[middle:]))
+        return upload
+
+    def test_chunked_upload_is_hashed_while_appended(self):
+        content = b'first half, second half'
+        with mock.patch.object(attachments, 'file_digest', side_effect=AssertionError('file read again')):
+            upload = self.upload_in_chunks(content)
+        self.assertEqual(upload.blob.sha256, hashlib.sha256(content).hexdigest())
+        self.assertEqual(upload.blob.ref_count, 1)
+        self.assertEqual(part_digests.entries, {})
+        self.assertFalse(os.listdir(os.path.join(self.media_root, 'chat_uploads')))
+
+    def test_chunked_upload_without_running_digest_hashes_part_file(self):
+        content = b'first half, second half'
+        existing = self.store(content)
+        with mock.patch.object(attachments, 'file_digest', wraps=attachments.file_digest) as file_digest:
+            upload = self.upload_in_chunks(content, forget_progress=True)
+        self.assertEqual(file_digest.call_count, 1)
+        self.assertEqual(upload.blob.pk, existing.pk)
+        self.assertEqual(AttachmentBlob.objects.get(pk=existing.pk).ref_count, 2)
+
+
+@skipIf(Image is None, 'Pillow is not installed')
+class AttachmentPreviewTests(ChatTestCase):
+    """Thumbnails are rendered once per blob and exposed by the message serializers"""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        overrides = override_settings(
+            MEDIA_ROOT=self.media_root,
+            CHAT_UPLOADS={'TEMP_DIR': os.path.join(self.media_root, 'chat_uploads')},
+            CHAT_PREVIEWS={'INLINE': True, 'SIZE': 100}
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        part_digests.entries.clear()
+
+    def store(self, name, content, content_type):
+        with self.captureOnCommitCallbacks(execute=True):
+            blob = store_attachment(SimpleUploadedFile(name, content), content_type)
+        blob.refresh_from_db()
+        return blob
+
+    def png(self, size):
+        buffer = io.BytesIO()
+        Image.new('RGBA', size, (200, 30, 30, 128)).save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    def fake_pdf_renderer(self):
+        page = mock.Mock()
+        page.rect.width, page.rect.height = 612.4, 791.6
+        page.get_pixmap.return_value = mock.Mock(width=60, height=80, samples=bytes(60 * 80 * 3))
+        renderer = mock.Mock()
+        renderer.open.return_value.__getitem__ = mock.Mock(return_value=page)
+        return renderer
+
+    def assert_thumbnail(self, blob, size):
+        with blob.preview.open('rb') as stored:
+            thumbnail = Image.open(stored)
+            self.assertEqual((thumbnail.format, thumbnail.size), ('JPEG', size))
+
+    def test_image_thumbnail(self):
+        blob = self.store('photo.png', self.png((400, 200)), 'image/png')
+
+        self.assertEqual(blob.preview_status, 'ready')
+        self.assertEqual((blob.width, blob.height), (400, 200))
+        self.assertEqual((blob.preview_width, blob.preview_height), (100, 50))
+        self.assert_thumbnail(blob, (100, 50))
+
+    def test_pdf_thumbnail_is_the_first_page(self):
+        renderer = self.fake_pdf_renderer()
+        with mock.patch('chatApp.previews.fitz', renderer):
+            blob = self.store('plan.pdf', b'%PDF-1.4 plan', 'application/pdf')
+
+        renderer.open.assert_called_once_with(stream=b'%PDF-1.4 plan', filetype='pdf')
+        renderer.open.return_value.close.assert_called_once_with()
+        self.assertEqual(blob.preview_status, 'ready')
+        self.assertEqual((blob.width, blob.height), (612, 792))
+        self.assertEqual((blob.preview_width, blob.preview_height), (60, 80))
+        self.assert_thumbnail(blob, (60, 80))
+
+    def test_files_without_a_renderer_are_unsupported(self):
+        with mock.patch('chatApp.previews.fitz', None):
+            pdf = self.store('plan.pdf', b'%PDF-1.4 plan', 'application/pdf')
+        text = self.store('notes.txt', b'meeting notes', 'text/plain')
+
+        for blob in (pdf, text):
+            self.assertEqual(blob.preview_status, 'unsupported')
+            self.assertFalse(blob.preview)
+
+    def test_unreadable_image_fails_and_is_not_retried(self):
+        with self.assertLogs('chatApp.previews', 'ERROR'):
+            blob = self.store('photo.png', b'not an image', 'image/png')
+        self.assertEqual(blob.preview_status, 'failed')
+        self.assertFalse(blob.preview)
+
+        with mock.patch('chatApp.previews.open_first_page') as open_first_page:
+            self.assertEqual(generate_preview(blob.pk).preview_status, 'failed')
+        open_first_page.assert_not_called()
+
+    def test_message_lists_include_the_preview(self):
+        mentorship = self.add_mentorship()
+        room = ChatRoom.objects.get(mentorship=mentorship)
+        group = GroupChatRoom.objects.get(mentorship=mentorship)
+        blob = self.store('photo.png', self.png((400, 200)), 'image/png')
+        Message.objects.create(
+            chat_room=room, sender=mentorship.mentor, content='Photo', message_type='image', attachment_blob=blob
+        )
+        GroupChatMessage.objects.create(
+            chat_room=group, sender=mentorship.mentor, content='Photo', message_type='image', attachment_blob=blob
+        )
+        self.authenticate()
+
+        for url in (reverse('list_messages', args=[room.id]), reverse('list_group_messages', args=[group.id])):
+            with self.subTest(url=url):
+                messages = self.client.get(url).data['messages']
+                self.assertIsNone(messages[0]['attachment_preview'])
+                preview = messages[-1]['attachment_preview']
+                self.assertEqual(
+                    {key: preview[key] for key in ('status', 'width', 'height', 'preview_width', 'preview_height')},
+                    {'status': 'ready', 'width': 400, 'height': 200, 'preview_width': 100, 'preview_height': 50}
+                )
+                self.assertEqual(preview['preview_url'], f'http://testserver{blob.preview.url}')
+
+
+class ArchiveTests(ChatTestCase):
+    """Old messages of inactive rooms move to segments and are still served from there"""
+
+    def setUp(self):
+        super().setUp()
+        mentorship = self.add_mentorship()
+        self.mentor = mentorship.mentor
+        self.room = ChatRoom.objects.get(mentorship=mentorship)
+        self.group = GroupChatRoom.objects.get(mentorship=mentorship)
+        old = now() - timedelta(days=400)
+        Message.objects.filter(chat_room=self.room).update(created_at=old)
+        for index in range(1, 5):
+            Message.objects.create(
+                chat_room=self.room, sender=self.mentor, content=f'Old {index}', created_at=old + timedelta(minutes=index)
+            )
+        Message.objects.create(chat_room=self.room, sender=self.mentee, content='Recent')
+        deleted = Message.objects.get(content='Old 2')
+        deleted.is_deleted = True
+        deleted.save()
+        ChatRoom.objects.filter(pk=self.room.pk).update(is_active=False)
+
+    def contents(self, messages):
+        return [message['content'] for message in messages]
+
+    def test_old_messages_are_moved_into_segments(self):
+        self.assertEqual(archive_old_messages(segment_size=2), 5)
+
+        self.assertEqual(list(Message.objects.filter(chat_room=self.room).values_list('content', flat=True)), ['Recent'])
+        segments = MessageArchiveSegment.objects.filter(chat_room=self.room).order_by('first_sequence')
+        self.assertEqual(
+            [(segment.message_count, segment.first_sequence, segment.last_sequence) for segment in segments],
+            [(2, 1, 2), (2, 3, 4), (1, 5, 5)]
+        )
+        # Active rooms are left alone, and a second run finds nothing
+        self.assertTrue(GroupChatMessage.objects.filter(chat_room=self.group).exists())
+        self.assertEqual(archive_old_messages(segment_size=2), 0)
+
+    def test_history_pages_read_through_to_the_archive(self):
+        archive_old_messages(segment_size=2)
+        self.authenticate()
+        url = reverse('list_messages', args=[self.room.id])
+
+        pages = []
+        params = {'limit': 2}
+        while True:
+            data = self.client.get(url, params).data
+            pages.append(self.contents(data['messages']))
+            if not data['has_more']:
+                break
+            params['before'] = data['next_cursor']
+        self.assertEqual(pages, [['Old 4', 'Recent'], ['Old 1', 'Old 3'], ['Hello']])
+
+        data = self.client.get(url, {'after_sequence': 0, 'limit': 3}).data
+        self.assertEqual(self.contents(data['messages']), ['Hello', 'Old 1', 'Old 3'])
+        self.assertEqual(data['last_sequence'], 4)
+        data = self.client.get(url, {'after_sequence': data['last_sequence']}).data
+        self.assertEqual(self.contents(data['messages']), ['Old 4', 'Recent'])
+
+    def test_archived_group_replies_keep_their_preview(self):
+        GroupChatRoom.objects.filter(pk=self.group.pk).update(is_archived=True)
+        old = now() - timedelta(days=400)
+        original = GroupChatMessage.objects.create(
+            chat_room=self.group, sender=self.mentor, content='Question', created_at=old
+        )
+        GroupChatMessage.objects.create(
+            chat_room=self.group, sender=self.mentee, content='Answer', reply_to=original, created_at=old + timedelta(minutes=1)
+        )
+        archive_old_messages()
+
+        reply, = [message for message in RoomArchive(GroupChatMessage, self.group.id).older(None, 10)
+                  if message.content == 'Answer']
+        self.assertEqual(reply.reply_to_id, original.id)
+        self.assertEqual(reply.reply_to.content, 'Question')
+        self.assertEqual(reply.reply_to.sender.full_name, self.mentor.full_name)
+        self.assertEqual(reply.sender, self.mentee)
+
+    def unread(self, user, **room):
+        return UnreadCounter.objects.get(user=user, **room).count
+
+    def test_archived_messages_leave_the_unread_counts(self):
+        Message.objects.get(content='Old 3').mark_as_read()
+        self.assertEqual(self.unread(self.mentee, chat_room=self.room), 3)
+        self.assertEqual(self.unread(self.mentor, chat_room=self.room), 1)
+
+        old = now() - timedelta(days=400)
+        GroupChatRoom.objects.filter(pk=self.group.pk).update(is_archived=True)
+        GroupChatParticipant.objects.filter(chat_room=self.group).update(joined_at=old - timedelta(days=1))
+        GroupChatMessage.objects.filter(chat_room=self.group).update(created_at=old)
+        GroupChatMessage.objects.create(chat_room=self.group, sender=self.mentor, content='Old news', created_at=old)
+        GroupChatMessage.objects.create(chat_room=self.group, sender=self.mentor, content='News')
+        self.assertEqual(self.unread(self.mentee, group_chat_room=self.group), 3)
+
+        archive_old_messages(segment_size=2)
+
+        self.assertEqual(self.unread(self.mentee, chat_room=self.room), 0)
+        self.assertEqual(self.unread(self.mentor, chat_room=self.room), 1)
+        self.assertEqual(self.unread(self.mentee, group_chat_room=self.group), 1)
+
+    def test_room_keeps_its_last_message(self):
+        archive_old_messages(segment_size=2)
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.last_message.content, 'Recent')
+
+        # Once everything is archived the pointer goes but the inbox entry stays
+        last_message_at = self.room.last_message_at
+        archive_room(Message, self.room.id, now() + timedelta(seconds=1), 2)
+        self.room.refresh_from_db()
+        self.assertIsNone(self.room.last_message)
+        self.assertEqual((self.room.last_message_preview, self.room.last_message_at), ('Recent', last_message_at))
+
+
+class ChatDashboardQueryTests(ChatTestCase):
+    """The chat dashboard runs a fixed number of queries however many chats a user has"""
+
+    # department, rooms (2), unread counters, mentorships (+ programs), recent messages (2)
+    QUERY_BUDGET = 8
+
+    def get_dashboard(self):
+        response = self.client.get(reverse('get_chat_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_query_count_does_not_grow_with_rooms(self):
+        self.add_mentorship()
+        self.authenticate()
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            data = self.get_dashboard()
+        self.assertEqual(len(data['chats']['mentorship_chats']), 2)
+
+        for _ in range(4):
+            self.add_mentorship()
+        self.authenticate()
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            data = self.get_dashboard()
+
+        self.assertEqual(len(data['chats']['mentorship_chats']), 10)
+        self.assertEqual(len(data['chats']['department_chats']), 1)
+        self.assertEqual(data['statistics']['total_chats'], 11)
+        self.assertEqual(data['statistics']['active_conversations'], 10)
+        self.assertEqual(len(data['recent_activity']), 10)
+        self.assertEqual(data['user']['department'], 'Software Development')
+
+
+class MentorshipProvisioningTests(ChatTestCase):
+    """Mentorship chats are provisioned in bulk when a mentorship becomes active"""
+
+    def setUp(self):
+        super().setUp()
+        self.hr = self.create_user('hr')
+        self.mentor = self.create_user('mentor')
+
+    def create_mentorship(self, status='active'):
+        return Mentorship.objects.create(
+            mentor=self.mentor,
+            mentee=self.mentee,
+            department=self.department,
+            status=status,
+            start_date=date.today()
+        )
+
+    def assert_provisioned(self, mentorship):
+        direct = ChatRoom.objects.get(mentorship=mentorship)
+        self.assertEqual((direct.user1, direct.user2, direct.chat_type), (self.mentor, self.mentee, 'mentor_mentee'))
+        staff = ChatRoom.objects.get(user1=self.mentee, user2=self.hr)
+        self.assertEqual(staff.chat_type, 'mentee_hr')
+        group = GroupChatRoom.objects.get(mentorship=mentorship, chat_type='mentorship_group')
+        department = GroupChatRoom.objects.get(chat_type='department_group', department=self.department.name)
+        for room in (group, department):
+            self.assertEqual(
+                dict(room.chat_participants.values_list('user_id', 'role')),
+                {self.mentor.id: 'moderator', self.mentee.id: 'member'}
+            )
+        # bulk_create skips the signals that add counters for single rooms
+        self.assertEqual(
+            set(UnreadCounter.objects.filter(chat_room__in=[direct, staff]).values_list('chat_room_id', 'user_id')),
+            {(direct.id, self.mentor.id), (direct.id, self.mentee.id), (staff.id, self.mentee.id), (staff.id, self.hr.id)}
+        )
+        self.assertEqual(
+            set(UnreadCounter.objects.filter(group_chat_room__in=[group, department]).values_list('group_chat_room_id', 'user_id')),
+            {(room.id, user.id) for room in (group, department) for user in (self.mentor, self.mentee)}
+        )
+
+    def test_active_mentorship_is_provisioned_on_create(self):
+        self.assert_provisioned(self.create_mentorship())
+
+    def test_only_activation_provisions(self):
+        mentorship = self.create_mentorship(status='pending')
+        self.assertFalse(ChatRoom.objects.filter(mentorship=mentorship).exists())
+        self.assertFalse(GroupChatRoom.objects.filter(mentorship=mentorship).exists())
+
+        mentorship = Mentorship.objects.get(pk=mentorship.pk)
+        with mock.patch('chatApp.signals.provision_mentorship_chats') as provision:
+            mentorship.save(update_fields=['status'])
+        provision.assert_not_called()
+
+        mentorship.status = 'active'
+        mentorship.save(update_fields=['status'])
+        self.assert_provisioned(mentorship)
+
+        mentorship = Mentorship.objects.get(pk=mentorship.pk)
+        with mock.patch('chatApp.signals.provision_mentorship_chats') as provision:
+            mentorship.save(update_fields=['status'])
+        provision.assert_not_called()
+
+    def test_existing_pair_room_is_reused(self):
+        ChatRoom.objects.create(user1=self.mentor, user2=self.mentee, chat_type='mentor_mentee', is_active=True)
+        mentorship = self.create_mentorship()
+        self.assertEqual(ChatRoom.objects.filter(user1=self.mentor, user2=self.mentee).count(), 1)
+        self.assertFalse(ChatRoom.objects.filter(mentorship=mentorship).exists())
+
+    def test_provisioning_again_writes_nothing(self):
+        mentorship = self.create_mentorship()
+        mentorship = Mentorship.objects.select_related('department', 'mentee').get(pk=mentorship.pk)
+
+        # staff, rooms, group rooms, participants, in one savepoint
+        with self.assertNumQueries(6) as queries:
+            provision_mentorship_chats(mentorship)
+        statements = [query['sql'].split()[0] for query in queries.captured_queries]
+        self.assertEqual(statements.count('SELECT'), 4)
+        self.assert_provisioned(mentorship)
+
+
+class CandidateSearchTests(ChatTestCase):
+    """Cross-department candidates are matched by prefix and paged on (full_name, id)"""
+
+    def create_candidate(self, full_name, role='mentee', **fields):
+        return self.create_user(role, full_name=full_name, **fields)
+
+    def search(self, **params):
+        return search_candidates(params, exclude_user_id=self.mentee.id)
+
+    def test_keyset_pages_walk_equal_names_in_id_order(self):
+        twins = [self.create_candidate('Alex Kim') for _ in range(5)]
+        first = self.create_candidate('Aaron Lee')
+        last = self.create_candidate('Alex Kimura')
+
+        seen = []
+        cursor = None
+        while True:
+            params = {'q': 'al', 'limit': '2'}
+            if cursor:
+                params['cursor'] = cursor
+            page, cursor = self.search(**params)
+            seen.extend(user.id for user in page)
+            if cursor is None:
+                break
+
+        self.assertEqual(seen, [user.id for user in twins] + [last.id])
+        self.assertNotIn(first.id, seen)
+
+    def test_terms_match_name_email_role_and_department_prefixes(self):
+        design = Department.objects.create(name='Design')
+        by_name = self.create_candidate('Grace Hopper')
+        by_email = self.create_candidate('Someone Else', email='grace.h@example.com')
+        by_department = self.create_candidate('Mentee Without Name Match', department=design.id)
+        mentor = self.create_candidate('Mentor In Design', role='mentor', departments=[design.id])
+        self.create_candidate('Unrelated Person')
+
+        page, _ = self.search(q='grace')
+        self.assertEqual({user.id for user in page}, {by_name.id, by_email.id})
+
+        page, _ = self.search(q='des')
+        self.assertEqual({user.id for user in page}, {by_department.id, mentor.id})
+
+        page, _ = self.search(q='ment des')
+        self.assertEqual({user.id for user in page}, {by_department.id, mentor.id})
+
+        page, _ = self.search(q='mentor des')
+        self.assertEqual([user.id for user in page], [mentor.id])
+
+
+class RateLimiterTests(SimpleTestCase):
+    """Token buckets allow a burst, then refill at their rate"""
+
+    def setUp(self):
+        self.now = 0.0
+        self.limiter = RateLimiter({
+            'ENABLED': True,
+            'USER': {'chat_message': (1.0, 3)},
+            'ROOM': {'chat_message': (2.0, 4)},
+        }, clock=lambda: self.now)
+
+    def test_user_budget_boundary(self):
+        for _ in range(3):
+            self.assertIsNone(self.limiter.check('chat_message', 1, 'room'))
+        self.assertEqual(self.limiter.check('chat_message', 1, 'room'), ('user', 1.0))
+
+        self.now += 0.5
+        scope, retry_after = self.limiter.check('chat_message', 1, 'room')
+        self.assertEqual((scope, retry_after), ('user', 0.5))
+        self.now += 0.5
+        self.assertIsNone(self.limiter.check('chat_message', 1, 'room'))
+        self.assertEqual(self.limiter.snapshot(), {
+            'chat_message': {'allowed': 4, 'limited_user': 2, 'limited_room': 0}
+        })
+
+    def test_room_rejection_gives_the_user_token_back(self):
+        for user_id in (1, 1, 2, 2):
+            self.assertIsNone(self.limiter.check('chat_message', user_id, 'room'))
+        self.assertEqual(self.limiter.check('chat_message', 1, 'room'), ('room', 0.5))
+        # User 1 still has the token the room refused
+        self.now += 0.5
+        self.assertIsNone(self.limiter.check('chat_message', 1, 'room'))
+        self.assertEqual(self.limiter.check('chat_message', 1, 'other room'), ('user', 0.5))
+
+    def test_unlimited_frame_types_and_disabled_limiter_pass(self):
+        for _ in range(10):
+            self.assertIsNone(self.limiter.check('heartbeat', 1, 'room'))
+        limiter = RateLimiter({'ENABLED': False, 'USER': {'chat_message': (1.0, 1)}, 'ROOM': {}})
+        for _ in range(10):
+            self.assertIsNone(limiter.check('chat_message', 1, 'room'))
+
+
+@override_settings(CHAT_RATE_LIMITS={'USER': {'chat_message': (0.001, 2)}})
+class RateLimitedConsumerTests(ConsumerTestCase):
+    """Consumers drop frames over budget and tell the client once"""
+
+    def test_frames_over_budget_get_one_rate_limited_frame(self):
+        room = self.create_group(self.mentee)
+
+        async def scenario():
+            communicator = await self.open_socket(f'/ws/group-chat/{room.id}/', self.mentee)
+            # A malformed type is dropped without taking the consumer down
+            await communicator.send_json_to({'type': ['chat_message'], 'message': 'Malformed'})
+            for index in range(4):
+                await communicator.send_json_to({'type': 'chat_message', 'message': f'Message {index}'})
+            frames = []
+            while not await communicator.receive_nothing(timeout=0.5):
+                frames.append(await communicator.receive_json_from())
+            await communicator.disconnect()
+            return frames
+
+        frames = self.run_sockets(scenario)
+        delivered = [frame['message'] for frame in frames if frame['type'] == 'group_chat_message']
+        errors = [frame for frame in frames if frame['type'] == 'error']
+        self.assertEqual(delivered, ['Message 0', 'Message 1'])
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0]['code'], 'rate_limited')
+        self.assertEqual(errors[0]['action'], 'chat_message')
+        self.assertEqual(errors[0]['scope'], 'user')
+        self.assertGreater(errors[0]['retry_after'], 0)
+        self.assertEqual(GroupChatMessage.objects.filter(chat_room=room).count(), 2)
+
+
+class ReadWatermarksTests(SimpleTestCase):
+    """Readers of a message are the participants whose watermark reached its sequence"""
+
+    def setUp(self):
+        self.watermarks = ReadWatermarks([(1, 5), (2, 2), (3, 9), (4, 5)])
+
+    def test_read_counts(self):
+        self.assertEqual(self.watermarks.read_count(1), 4)
+        self.assertEqual(self.watermarks.read_count(5), 3)
+        self.assertEqual(self.watermarks.read_count(6), 1)
+        self.assertEqual(self.watermarks.read_count(10), 0)
+        self.assertEqual(self.watermarks.read_count(5, exclude_user_id=1), 2)
+        self.assertEqual(self.watermarks.read_count(6, exclude_user_id=1), 1)
+        self.assertEqual(self.watermarks.read_count(None), 0)
+
+    def test_readers(self):
+        self.assertEqual(sorted(self.watermarks.read_by(5)), [1, 3, 4])
+        self.assertEqual(sorted(self.watermarks.read_by(3, exclude_user_id=3)), [1, 4])
+        self.assertEqual(self.watermarks.read_by(None), [])
+
+
+class ReadReceiptTests(ChatTestCase):
+    """Group read receipts follow each participant's sequence watermark"""
+
+    def setUp(self):
+        super().setUp()
+        self.mentor = self.create_user('mentor')
+        self.hr = self.create_user('hr')
+        self.group = GroupChatRoom.objects.create(name='Study group', created_by=self.mentor, is_active=True)
+        for member in (self.mentor, self.mentee, self.hr):
+            self.group.add_participant(member)
+        self.messages = [
+            GroupChatMessage.objects.create(chat_room=self.group, sender=self.mentor, content=f'Message {index}')
+            for index in range(3)
+        ]
+
+    def test_receipts_follow_the_watermark_and_leave_out_the_sender(self):
+        first, second, third = self.messages
+        second.mark_as_read_by_user(self.mentee)
+        first.mark_as_read_by_user(self.mentee)
+
+        self.assertEqual(list(second.get_read_by()), [self.mentee])
+        self.assertEqual(second.get_read_count(), 1)
+        self.assertEqual(list(third.get_read_by()), [])
+        self.assertEqual(set(third.get_unread_by()), {self.mentee, self.hr})
+        self.assertEqual(
+            GroupChatParticipant.objects.get(chat_room=self.group, user=self.mentee).last_read_sequence,
+            second.sequence
+        )
+
+        watermarks = self.group.get_read_watermarks()
+        for message in self.messages:
+            self.assertEqual(
+                watermarks.read_count(message.sequence, exclude_user_id=message.sender_id),
+                message.get_read_count()
+            )
+
+    def test_message_list_returns_counts_and_readers_on_request(self):
+        self.messages[0].mark_as_read_by_user(self.hr)
+        self.authenticate()
+        url = reverse('list_group_messages', args=[self.group.id])
+
+        data = self.client.get(url).data
+        # Listing marks the room read for the mentee
+        self.assertEqual([message['read_count'] for message in data['messages']][-3:], [2, 1, 1])
+        self.assertNotIn('read_by', data['messages'][-1])
+
+        data = self.client.get(url, {'include': 'read_by'}).data
+        self.assertEqual(
+            [sorted(message['read_by']) for message in data['messages']][-3:],
+            [sorted([self.mentee.id, self.hr.id]), [self.mentee.id], [self.mentee.id]]
+        )
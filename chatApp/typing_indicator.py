@@ -0,0 +1,88 @@
+# chatApp/typing_indicator.py
+import asyncio
+
+from django.conf import settings
+
+
+DEFAULT_INTERVAL = 1.0
+DEFAULT_IDLE_TIMEOUT = 5.0
+
+
+class TypingIndicator:
+    """
+    Server-side typing state for one user in one room.
+
+    Clients may send typing frames as often as they like; only changes of
+    state are broadcast, at most one per INTERVAL seconds. A change that
+    arrives too early is held back and coalesced with whatever comes next,
+    and typing stops on its own after IDLE_TIMEOUT seconds without a frame.
+    """
+
+    def __init__(self, broadcast, interval=None, idle_timeout=None):
+        config = getattr(settings, 'CHAT_TYPING', {})
+        self.broadcast = broadcast
+        self.interval = interval if interval is not None else config.get('INTERVAL', DEFAULT_INTERVAL)
+        self.idle_timeout = idle_timeout if idle_timeout is not None else config.get('IDLE_TIMEOUT', DEFAULT_IDLE_TIMEOUT)
+        self.is_typing = False
+        self.wants_typing = False
+        self.last_change = None
+        self.pending = None
+        self.idle = None
+
+    async def update(self, is_typing):
+        """Handle a typing frame from the client"""
+        self.wants_typing = bool(is_typing)
+        self._cancel_idle()
+        if self.wants_typing:
+            self.idle = asyncio.ensure_future(self._stop_when_idle())
+        await self._sync()
+
+    async def stop(self, force=False):
+        """Stop typing, e.g. after a message was sent or on disconnect"""
+        self.wants_typing = False
+        self._cancel_idle()
+        if force:
+            self._cancel_pending()
+            self.last_change = None
+        await self._sync()
+
+    def cancel(self):
+        self._cancel_idle()
+        self._cancel_pending()
+
+    async def _sync(self):
+        if self.wants_typing == self.is_typing:
+            return
+
+        loop = asyncio.get_running_loop()
+        if self.last_change is not None:
+            wait = self.last_change + self.interval - loop.time()
+            if wait > 0:
+                if self.pending is None:
+                    self.pending = asyncio.ensure_future(self._sync_later(wait))
+                return
+
+        self.is_typing = self.wants_typing
+        self.last_change = loop.time()
+        await self.broadcast(self.is_typing)
+
+    async def _sync_later(self, wait):
+        await asyncio.sleep(wait)
+        self.pending = None
+        await self._sync()
+
+    async def _stop_when_idle(self):
+        await asyncio.sleep(self.idle_timeout)
+        self.idle = None
+        self.wants_typing = False
+        await self._sync()
+
+    def _cancel_idle(self):
+        if self.idle is not None:
+            self.idle.cancel()
+            self.idle = None
+
+    def _cancel_pending(self):
+        if self.pending is not None:
+            self.pending.cancel()
+            self.pending = None
@@ -9,6 +9,11 @@ urlpatterns = [
     path('rooms/<int:chat_room_id>/messages/', views.list_messages, name='list_messages'),
     path('messages/send/', views.send_message, name='send_message'),
     path('rooms/<int:chat_room_id>/mark-read/', views.mark_messages_read, name='mark_messages_read'),
+    path('rooms/<int:chat_room_id>/presence/', views.get_chat_room_presence, name='get_chat_room_presence'),
+    
+    # Attachment Upload URLs
+    path('attachments/uploads/', views.create_attachment_upload, name='create_attachment_upload'),
+    path('attachments/uploads/<uuid:upload_id>/', views.attachment_upload_detail, name='attachment_upload_detail'),
     
     # Group Chat URLs
     path('group-chats/', views.list_group_chats, name='list_group_chats'),
@@ -17,6 +22,9 @@ urlpatterns = [
     path('group-chats/<int:group_chat_id>/add-participant/', views.add_group_chat_participant, name='add_group_chat_participant'),
     path('group-chats/<int:group_chat_id>/remove-participant/<int:user_id>/', views.remove_group_chat_participant, name='remove_group_chat_participant'),
     path('group-chats/<int:group_chat_id>/messages/', views.list_group_messages, name='list_group_messages'),
+    path('group-chats/<int:group_chat_id>/online/', views.get_group_chat_online_users, name='get_group_chat_online_users'),
+    path('group-chats/fanout-metrics/', views.get_group_chat_fanout_metrics, name='get_group_chat_fanout_metrics'),
+    path('rate-limits/metrics/', views.get_chat_rate_limit_metrics, name='get_chat_rate_limit_metrics'),
     path('group-chats/messages/send/', views.send_group_message, name='send_group_message'),
     
     # Chat Dashboard URLs
@@ -31,6 +39,7 @@ urlpatterns = [
     path('cross-department-chats/<int:chat_id>/update/', views.update_cross_department_chat, name='update_cross_department_chat'),
     path('cross-department-chats/<int:chat_id>/archive/', views.archive_cross_department_chat, name='archive_cross_department_chat'),
     path('cross-department-chats/available-users/', views.get_available_users_for_cross_department, name='get_available_users_for_cross_department'),
+    path('cross-department-chats/candidates/', views.search_cross_department_candidates, name='search_cross_department_candidates'),
     
     # User-specific chat endpoints
     path('my-chats/', views.get_my_chats, name='get_my_chats'),
@@ -39,6 +48,7 @@ urlpatterns = [
     path('department-groups/', views.get_department_group_chats_for_user, name='get_department_group_chats_for_user'),
     path('summary/', views.get_chat_summary, name='get_chat_summary'),
     path('search/', views.search_my_chats, name='search_my_chats'),
+    path('search/messages/', views.search_messages, name='search_messages'),
     path('dashboard/', views.get_chat_dashboard, name='get_chat_dashboard'),
     
    
@@ -7,7 +7,10 @@ from django.conf import settings
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 
-from .models import ChatNotification, ChatRoom, GroupChatParticipant, GroupChatRoom
+from notificationApp.models import ChatNotification
+from mentorshipApp.models import Mentorship
+from .models import ChatRoom, GroupChatParticipant, GroupChatRoom, UnreadCounter
+from .presence import get_presence, room_key
 from userApp.models import CustomUser
 from .serializers import MessageSerializer
 
@@ -26,6 +29,22 @@ def send_notification_to_user(user_id, notification_data):
     )
 
 
+def send_messages_read_event(chat_room_id, reader_id, count, read_at):
+    """
+    Send a single read receipt covering every message marked as read
+    """
+    channel_layer = get_channel_layer()
+    async_to_sync(channel_layer.group_send)(
+        f"chat_{chat_room_id}",
+        {
+            'type': 'messages_read',
+            'reader_id': reader_id,
+            'count': count,
+            'read_at': read_at.isoformat()
+        }
+    )
+
+
 def send_email_notification(recipient_email, subject, template_name, context):
     """
     Send email notification
@@ -170,14 +189,18 @@ def format_chat_room_name(mentorship):
     """
     return f"Case {mentorship.case_number} - {mentorship.title[:30]}{'...' if len(mentorship.title) > 30 else ''}"
 
-def get_online_users(chat_room_id):
+def get_online_users(chat_room_id, chat_type='one_on_one'):
+    """
+    Get ids of users with a live WebSocket connection to a chat room
+    """
+    return sorted(get_presence().online_in_room(room_key(chat_type, chat_room_id)))
+
+
+def is_user_online(user_id):
     """
-    Get list of online users in a chat room
-    This would require implementing user presence tracking
+    Check whether a user has any live WebSocket connection
     """
-    # This is a placeholder - you'd need to implement Redis-based presence tracking
-    # or use Django Channels' group management features
-    return []
+    return get_presence().is_online(user_id)
 
 
 
@@ -191,10 +214,136 @@ def get_online_users(chat_room_id):
 
 # Add to mentorshipApp/utils.py (create if it doesn't exist)
 
-from django.db.models import Count, Q, Max
+from django.db.models import Count, F, OuterRef, Q, Max, Subquery, Window
+from django.db.models.functions import RowNumber
 from django.utils import timezone
 from datetime import timedelta
 
+def load_dashboard_rooms(user):
+    """
+    The user's open one-on-one and group chat rooms, two queries in total.
+    Group rooms carry their participant count and the user's read watermark.
+    """
+    direct_rooms = list(ChatRoom.objects.filter(
+        Q(user1=user) | Q(user2=user),
+        is_active=True
+    ).select_related('user1', 'user2'))
+    
+    group_rooms = list(GroupChatRoom.objects.filter(
+        id__in=GroupChatParticipant.objects.filter(user=user).values('chat_room_id'),
+        is_active=True,
+        is_archived=False
+    ).annotate(
+        participant_count=Count('chat_participants'),
+        my_last_read_sequence=Subquery(GroupChatParticipant.objects.filter(
+            chat_room=OuterRef('pk'),
+            user=user
+        ).values('last_read_sequence')[:1])
+    ))
+    return direct_rooms, group_rooms
+
+
+def last_activity(room):
+    return room.last_message_at or room.updated_at
+
+
+def program_names(mentorship):
+    """Names of a mentorship's programs, from prefetched programs when loaded"""
+    return ', '.join(program.name for program in mentorship.programs.all()) or None
+
+
+def summarize_chat_statistics(user, direct_rooms, group_rooms, unread_total):
+    """Chat statistics computed from already loaded rooms, without further queries"""
+    week_ago = timezone.now() - timedelta(days=7)
+    group_types = [room.chat_type for room in group_rooms]
+    
+    if user.role == 'mentor':
+        mentorship_types = ['mentorship_group']
+    else:
+        mentorship_types = ['mentorship_group', 'department_group']
+    
+    return {
+        'total_chats': len(direct_rooms) + len(group_rooms),
+        'unread_messages': unread_total,
+        'active_conversations': sum(
+            1 for room in direct_rooms + group_rooms
+            if room.last_message_at and room.last_message_at >= week_ago
+        ),
+        'mentorship_chats': sum(1 for chat_type in group_types if chat_type in mentorship_types),
+        'department_chats': group_types.count('department_group'),
+        'staff_chats': sum(
+            1 for room in direct_rooms if room.chat_type in ['mentee_admin', 'mentee_hr']
+        ) if user.role == 'mentee' else 0
+    }
+
+
+def collect_recent_chat_activity(user, direct_rooms, group_rooms, limit=5):
+    """
+    The latest messages across the given rooms, at most two queries: the
+    three newest messages of each of the limit most recently active rooms
+    per kind, ranked with a window function.
+    """
+    from .models import GroupChatMessage, Message
+
+    def most_recent(rooms):
+        rooms = sorted(
+            (room for room in rooms if room.last_message_at),
+            key=lambda room: room.last_message_at,
+            reverse=True
+        )[:limit]
+        return {room.id: room for room in rooms}
+
+    def latest_messages(model, room_ids):
+        if not room_ids:
+            return []
+        return model.objects.filter(
+            chat_room_id__in=room_ids,
+            is_deleted=False
+        ).annotate(
+            room_rank=Window(
+                RowNumber(),
+                partition_by=F('chat_room_id'),
+                order_by=[F('created_at').desc(), F('id').desc()]
+            )
+        ).filter(room_rank__lte=3).select_related('sender')
+
+    recent_activity = []
+    
+    direct_chats = most_recent(direct_rooms)
+    for message in latest_messages(Message, list(direct_chats)):
+        chat = direct_chats[message.chat_room_id]
+        other_user = chat.user2 if chat.user1_id == user.id else chat.user1
+        recent_activity.append({
+            'type': 'one_on_one',
+            'chat_id': chat.id,
+            'other_user': other_user.full_name,
+            'message': message.content[:100],
+            'timestamp': message.created_at,
+            'sender': message.sender.full_name,
+            'is_own': message.sender_id == user.id,
+            'is_read': message.is_read if message.sender_id != user.id else True
+        })
+    
+    group_chats = most_recent(group_rooms)
+    for message in latest_messages(GroupChatMessage, list(group_chats)):
+        chat = group_chats[message.chat_room_id]
+        last_read_sequence = chat.my_last_read_sequence or 0
+        recent_activity.append({
+            'type': 'group',
+            'chat_id': chat.id,
+            'chat_name': chat.name,
+            'message': message.content[:100],
+            'timestamp': message.created_at,
+            'sender': message.sender.full_name,
+            'is_own': message.sender_id == user.id,
+            'is_read': message.sender_id == user.id or (message.sequence or 0) <= last_read_sequence
+        })
+    
+    # Sort by timestamp and limit
+    recent_activity.sort(key=lambda x: x['timestamp'], reverse=True)
+    return recent_activity[:limit]
+
+
 def get_user_chat_statistics(user):
     """Get comprehensive chat statistics for a user"""
     stats = {
@@ -210,100 +359,9 @@ def get_user_chat_statistics(user):
         if user.role not in ['mentor', 'mentee']:
             return stats
         
-        # One-on-one chat stats
-        one_on_one_chats = ChatRoom.objects.filter(
-            Q(user1=user) | Q(user2=user),
-            is_active=True
-        )
-        
-        # Group chat stats
-        group_chats = GroupChatRoom.objects.filter(
-            participants=user,
-            is_active=True,
-            is_archived=False
-        )
-        
-        stats['total_chats'] = one_on_one_chats.count() + group_chats.count()
-        
-        # Calculate unread messages
-        total_unread = 0
-        
-        # Unread in one-on-one chats
-        for chat in one_on_one_chats:
-            total_unread += chat.messages.filter(
-                is_deleted=False,
-                is_read=False
-            ).exclude(sender=user).count()
-        
-        # Unread in group chats
-        for chat in group_chats:
-            participant = GroupChatParticipant.objects.filter(
-                chat_room=chat,
-                user=user
-            ).first()
-            
-            if participant and participant.last_read_at:
-                total_unread += chat.group_messages.filter(
-                    created_at__gt=participant.last_read_at,
-                    is_deleted=False
-                ).exclude(sender=user).count()
-            else:
-                total_unread += chat.group_messages.filter(
-                    is_deleted=False
-                ).exclude(sender=user).count()
-        
-        stats['unread_messages'] = total_unread
-        
-        # Active conversations (chats with activity in last 7 days)
-        week_ago = timezone.now() - timedelta(days=7)
-        
-        active_one_on_one = one_on_one_chats.filter(
-            messages__created_at__gte=week_ago
-        ).distinct().count()
-        
-        active_group = group_chats.filter(
-            group_messages__created_at__gte=week_ago
-        ).distinct().count()
-        
-        stats['active_conversations'] = active_one_on_one + active_group
-        
-        # Mentorship chats
-        if user.role == 'mentor':
-            mentorship_chats = GroupChatRoom.objects.filter(
-                participants=user,
-                chat_type='mentorship_group',
-                is_active=True,
-                is_archived=False
-            ).count()
-        else:
-            mentorship_chats = GroupChatRoom.objects.filter(
-                participants=user,
-                chat_type__in=['mentorship_group', 'department_group'],
-                is_active=True,
-                is_archived=False
-            ).count()
-        
-        stats['mentorship_chats'] = mentorship_chats
-        
-        # Department chats
-        department_chats = GroupChatRoom.objects.filter(
-            participants=user,
-            chat_type='department_group',
-            is_active=True,
-            is_archived=False
-        ).count()
-        
-        stats['department_chats'] = department_chats
-        
-        # Staff chats (for mentees)
-        if user.role == 'mentee':
-            staff_chats = ChatRoom.objects.filter(
-                Q(user1=user) | Q(user2=user),
-                chat_type__in=['mentee_admin', 'mentee_hr'],
-                is_active=True
-            ).count()
-            
-            stats['staff_chats'] = staff_chats
+        direct_rooms, group_rooms = load_dashboard_rooms(user)
+        unread_total = UnreadCounter.totals_for_user(user)['total']
+        return summarize_chat_statistics(user, direct_rooms, group_rooms, unread_total)
         
     except Exception as e:
         print(f"Error getting chat statistics: {e}")
@@ -313,61 +371,114 @@ def get_user_chat_statistics(user):
 
 def get_recent_chat_activity(user, limit=5):
     """Get recent chat activity for a user"""
-    recent_activity = []
-    
     try:
-        # Get recent one-on-one messages
-        one_on_one_chats = ChatRoom.objects.filter(
-            Q(user1=user) | Q(user2=user),
-            is_active=True
-        )
-        
-        for chat in one_on_one_chats:
-            recent_messages = chat.messages.filter(
-                is_deleted=False
-            ).order_by('-created_at')[:3]
-            
-            for message in recent_messages:
-                other_user = chat.user2 if chat.user1 == user else chat.user1
-                recent_activity.append({
-                    'type': 'one_on_one',
-                    'chat_id': chat.id,
-                    'other_user': other_user.full_name,
-                    'message': message.content[:100],
-                    'timestamp': message.created_at,
-                    'sender': message.sender.full_name,
-                    'is_own': message.sender == user,
-                    'is_read': message.is_read if message.sender != user else True
-                })
-        
-        # Get recent group messages
-        group_chats = GroupChatRoom.objects.filter(
-            participants=user,
-            is_active=True,
-            is_archived=False
-        )
-        
-        for chat in group_chats:
-            recent_messages = chat.group_messages.filter(
-                is_deleted=False
-            ).order_by('-created_at')[:3]
-            
-            for message in recent_messages:
-                recent_activity.append({
-                    'type': 'group',
-                    'chat_id': chat.id,
-                    'chat_name': chat.name,
-                    'message': message.content[:100],
-                    'timestamp': message.created_at,
-                    'sender': message.sender.full_name,
-                    'is_own': message.sender == user,
-                    'is_read': message.get_read_by().filter(id=user.id).exists() if message.sender != user else True
-                })
-        
-        # Sort by timestamp and limit
-        recent_activity.sort(key=lambda x: x['timestamp'], reverse=True)
-        return recent_activity[:limit]
+        direct_rooms, group_rooms = load_dashboard_rooms(user)
+        return collect_recent_chat_activity(user, direct_rooms, group_rooms, limit)
         
     except Exception as e:
         print(f"Error getting recent activity: {e}")
-        return []
\ No newline at end of file
+        return []
+
+
+def build_chat_dashboard(user, activity_limit=10):
+    """
+    Statistics, recent activity and categorized chats of the dashboard.
+
+    Everything is derived from one load of the user's rooms, unread
+    counters and active mentorships, so the number of queries stays the
+    same however many chats the user has.
+    """
+    direct_rooms, group_rooms = load_dashboard_rooms(user)
+    chat_unread_counts, group_unread_counts = UnreadCounter.counts_for_user(user)
+    unread_total = sum(chat_unread_counts.values()) + sum(group_unread_counts.values())
+    
+    mentorship_filter = {'mentor': user} if user.role == 'mentor' else {'mentee': user}
+    active_mentorships = Mentorship.objects.filter(
+        status='active', **mentorship_filter
+    ).select_related('mentor', 'mentee').prefetch_related('programs')
+    
+    # First matching room per mentorship, as the per-mentorship lookups returned
+    mentorship_groups = {}
+    for room in group_rooms:
+        if room.chat_type == 'mentorship_group' and room.mentorship_id:
+            mentorship_groups.setdefault(room.mentorship_id, room)
+    mentorship_direct = {}
+    for room in direct_rooms:
+        if room.chat_type == 'mentor_mentee' and room.mentorship_id:
+            mentorship_direct.setdefault(room.mentorship_id, room)
+    
+    mentorship_chats = []
+    for mentorship in active_mentorships:
+        other_user = mentorship.mentee if user.role == 'mentor' else mentorship.mentor
+        program = program_names(mentorship)
+        
+        mentorship_group = mentorship_groups.get(mentorship.id)
+        if mentorship_group:
+            mentorship_chats.append({
+                'type': 'group',
+                'id': mentorship_group.id,
+                'name': mentorship_group.name,
+                'description': f"Mentorship with {other_user.full_name}",
+                'program': program,
+                'last_activity': last_activity(mentorship_group),
+                'unread_count': group_unread_counts.get(mentorship_group.id, 0)
+            })
+        
+        one_on_one = mentorship_direct.get(mentorship.id)
+        if one_on_one:
+            mentorship_chats.append({
+                'type': 'one_on_one',
+                'id': one_on_one.id,
+                'name': f"Direct chat with {other_user.full_name}",
+                'description': f"One-on-one communication",
+                'program': program,
+                'last_activity': last_activity(one_on_one),
+                'unread_count': chat_unread_counts.get(one_on_one.id, 0)
+            })
+    
+    department = user.department if user.department_id else None
+    department_chats = [
+        {
+            'type': 'department_group',
+            'id': chat.id,
+            'name': chat.name,
+            'description': chat.description,
+            'participant_count': chat.participant_count,
+            'last_activity': last_activity(chat),
+            'unread_count': group_unread_counts.get(chat.id, 0)
+        }
+        for chat in group_rooms
+        if department and chat.chat_type == 'department_group' and chat.department == department.name
+    ]
+    
+    staff_chats = []
+    if user.role == 'mentee':
+        for chat in direct_rooms:
+            if chat.chat_type not in ['mentee_admin', 'mentee_hr']:
+                continue
+            staff_user = chat.user2 if chat.user1_id == user.id else chat.user1
+            staff_chats.append({
+                'type': 'staff_chat',
+                'id': chat.id,
+                'name': f"Chat with {staff_user.full_name} ({staff_user.role})",
+                'description': f"{staff_user.role.upper()} Support",
+                'staff_role': staff_user.role,
+                'last_activity': last_activity(chat),
+                'unread_count': chat_unread_counts.get(chat.id, 0)
+            })
+    
+    return {
+        'user': {
+            'id': user.id,
+            'full_name': user.full_name,
+            'role': user.role,
+            'department': department.name if department else None
+        },
+        'statistics': summarize_chat_statistics(user, direct_rooms, group_rooms, unread_total),
+        'recent_activity': collect_recent_chat_activity(user, direct_rooms, group_rooms, activity_limit),
+        'chats': {
+            'mentorship_chats': sorted(mentorship_chats, key=lambda x: x['last_activity'], reverse=True),
+            'department_chats': sorted(department_chats, key=lambda x: x['last_activity'], reverse=True),
+            'staff_chats': sorted(staff_chats, key=lambda x: x['last_activity'], reverse=True)
+        }
+    }
@@ -1,20 +1,24 @@
 # mentorshipApp/views.py
+import io
 from django.forms import ValidationError
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
-from django.db.models import Q, Count, Avg
+from django.db import transaction
+from django.db.models import Q, Count, Avg, Prefetch
+from django.db.models.functions import Coalesce
 from django.utils.timezone import now
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 from datetime import timedelta
+from notificationApp.dispatch import NotificationTemplate, dispatch_notifications
 from notificationApp.models import ChatNotification
 
 from .models import (
-    ChatType, GroupChatMessage, GroupChatParticipant, GroupChatRoom, Mentorship,
-    ChatRoom, Message
+    AttachmentUpload, ChatType, GroupChatMessage, GroupChatParticipant, GroupChatRoom, Mentorship,
+    ChatRoom, Message, UnreadCounter, message_preview
 )
 from .serializers import (
     AddParticipantSerializer, GroupChatCreateSerializer, GroupChatMessageSerializer, GroupChatParticipantSerializer, GroupChatRoomSerializer, GroupMessageCreateSerializer,
@@ -22,8 +26,36 @@ from .serializers import (
     ChatRoomSerializer
     
 )
+from .archive import RoomArchive
+from .attachments import (
+    UploadError, append_chunk, cancel_upload, claim_upload, describe_upload,
+    hash_uploads, start_upload, store_attachment
+)
+from .directory import describe_candidate, search_candidates
+from .fanout import fanout_metrics
+from .ratelimit import get_rate_limiter
+from .search import search_chat_messages
+from .pagination import InvalidCursor, get_page_size, messages_since, paginate_messages
+from .utils import build_chat_dashboard, get_online_users, is_user_online, program_names, send_messages_read_event
 from userApp.models import CustomUser
 
+
+ADDED_TO_CROSS_DEPARTMENT_CHAT = NotificationTemplate(
+    'case_assigned',
+    'Added to Cross-Department Chat',
+    'You have been added to "{chat_name}" by {sender_name}'
+)
+REMOVED_FROM_CROSS_DEPARTMENT_CHAT = NotificationTemplate(
+    'status_changed',
+    'Removed from Cross-Department Chat',
+    'You have been removed from "{chat_name}" by {sender_name}'
+)
+CROSS_DEPARTMENT_CHAT_ARCHIVED = NotificationTemplate(
+    'status_changed',
+    'Chat Archived',
+    'The cross-department chat "{chat_name}" has been archived'
+)
+
 # ==================== CHAT ROOM VIEWS ====================
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -44,8 +76,8 @@ def list_chat_rooms(request):
             }, status=status.HTTP_403_FORBIDDEN)
         
         chat_rooms = chat_rooms.select_related(
-            'mentorship__mentor', 'mentorship__mentee', 'mentorship__program'
-        )
+            'mentorship__mentor', 'mentorship__mentee'
+        ).prefetch_related('mentorship__programs')
         
         serializer = ChatRoomSerializer(chat_rooms, many=True, context={'request': request})
         return Response({
@@ -135,7 +167,7 @@ def get_chat_room_by_mentorship(request, mentorship_id):
                 chat_room=chat_room,
                 notification_type='case_assigned',
                 title='Chat Room Created',
-                message=f'You can now chat with your mentor for {mentorship.program.name}'
+                message=f'You can now chat with your mentor for {program_names(mentorship)}'
             )
             
             ChatNotification.objects.create(
@@ -143,7 +175,7 @@ def get_chat_room_by_mentorship(request, mentorship_id):
                 chat_room=chat_room,
                 notification_type='case_assigned',
                 title='Chat Room Created',
-                message=f'You can now chat with your mentee for {mentorship.program.name}'
+                message=f'You can now chat with your mentee for {program_names(mentorship)}'
             )
         
         serializer = ChatRoomSerializer(chat_room, context={'request': request})
@@ -187,31 +219,29 @@ def list_messages(request, chat_room_id):
             }, status=status.HTTP_403_FORBIDDEN)
         
         # Mark unread messages as read
-        unread_messages = chat_room.messages.filter(
-            is_deleted=False,
-            is_read=False
-        ).exclude(sender=user)
-        
-        for message in unread_messages:
-            message.mark_as_read()
+        count, read_at = chat_room.mark_messages_read(user)
+        if count:
+            send_messages_read_event(chat_room.id, user.id, count, read_at)
         
-        # Get messages with pagination
-        limit = request.query_params.get('limit', 50)
+        # Get messages with cursor pagination, or everything after a sequence when resuming
+        paginate = messages_since if 'after_sequence' in request.query_params else paginate_messages
         try:
-            limit = int(limit)
-            if limit > 100:
-                limit = 100
-        except (ValueError, TypeError):
-            limit = 50
-        
-        messages = chat_room.messages.filter(is_deleted=False).order_by('-created_at')[:limit]
-        messages = list(reversed(messages))
+            messages, cursors = paginate(
+                chat_room.messages.filter(is_deleted=False).select_related('sender', 'attachment_blob'),
+                request.query_params,
+                archive=RoomArchive(Message, chat_room.id)
+            )
+        except InvalidCursor as e:
+            return Response({
+                'error': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
         
         serializer = MessageSerializer(messages, many=True, context={'request': request})
         return Response({
             'success': True,
             'count': len(messages),
-            'messages': serializer.data
+            'messages': serializer.data,
+            **cursors
         }, status=status.HTTP_200_OK)
     
     except Exception as e:
@@ -223,10 +253,11 @@ def list_messages(request, chat_room_id):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
-def send_message(request, chat_room_id):
+def send_message(request, chat_room_id=None):
     """Send a message in a chat room"""
     try:
-        chat_room = get_object_or_404(ChatRoom, id=chat_room_id)
+        hash_uploads(request)
+        chat_room = get_object_or_404(ChatRoom, id=chat_room_id or request.data.get('chat_room_id'))
         user = request.user
         
         # Check permissions
@@ -248,6 +279,7 @@ def send_message(request, chat_room_id):
         content = request.data.get('content')
         message_type = request.data.get('message_type', 'text')
         attachment = request.FILES.get('attachment')
+        upload_id = request.data.get('upload_id')
         
         if not content or not content.strip():
             return Response({
@@ -283,14 +315,26 @@ def send_message(request, chat_room_id):
                     'error': 'File type not allowed'
                 }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Create message
-        message = Message.objects.create(
-            chat_room=chat_room,
-            sender=user,
-            message_type=message_type,
-            content=content,
-            attachment=attachment
-        )
+        # Create message; attachments are stored once per content digest
+        try:
+            with transaction.atomic():
+                blob = None
+                if attachment:
+                    blob = store_attachment(attachment, attachment.content_type)
+                elif upload_id:
+                    blob = claim_upload(upload_id, user)
+                message = Message.objects.create(
+                    chat_room=chat_room,
+                    sender=user,
+                    message_type=message_type,
+                    content=content,
+                    attachment=blob.file.name if blob else None,
+                    attachment_blob=blob
+                )
+        except UploadError as e:
+            return Response({
+                'error': str(e)
+            }, status=e.status)
         
         # Update chat room timestamp
         chat_room.updated_at = now()
@@ -307,7 +351,7 @@ def send_message(request, chat_room_id):
         )
         
         # Create notification for recipient
-        recipient = chat_room.mentorship.mentor if user == chat_room.mentorship.mentee else chat_room.mentorship.mentee
+        recipient = chat_room.user2 if user.id == chat_room.user1_id else chat_room.user1
         ChatNotification.objects.create(
             recipient=recipient,
             sender=user,
@@ -350,14 +394,9 @@ def mark_messages_read(request, chat_room_id):
             }, status=status.HTTP_403_FORBIDDEN)
         
         # Mark messages as read
-        unread_messages = chat_room.messages.filter(
-            is_deleted=False,
-            is_read=False
-        ).exclude(sender=user)
-        
-        count = unread_messages.count()
-        for message in unread_messages:
-            message.mark_as_read()
+        count, read_at = chat_room.mark_messages_read(user)
+        if count:
+            send_messages_read_event(chat_room.id, user.id, count, read_at)
         
         return Response({
             'success': True,
@@ -371,6 +410,123 @@ def mark_messages_read(request, chat_room_id):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_chat_room_presence(request, chat_room_id):
+    """Check whether the users of a chat room are online"""
+    try:
+        chat_room = get_object_or_404(ChatRoom, id=chat_room_id)
+        user = request.user
+        
+        if user.id not in (chat_room.user1_id, chat_room.user2_id) and user.role not in ['admin', 'hr']:
+            return Response({
+                'error': 'Permission denied'
+            }, status=status.HTTP_403_FORBIDDEN)
+        
+        in_room = set(get_online_users(chat_room.id))
+        return Response({
+            'success': True,
+            'presence': [{
+                'user_id': user_id,
+                'is_online': is_user_online(user_id),
+                'in_chat': user_id in in_room
+            } for user_id in (chat_room.user1_id, chat_room.user2_id)]
+        }, status=status.HTTP_200_OK)
+    
+    except Exception as e:
+        return Response({
+            'error': 'Failed to fetch presence',
+            'detail': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+# ==================== ATTACHMENT UPLOAD VIEWS ====================
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def create_attachment_upload(request):
+    """Start a resumable chunked attachment upload"""
+    try:
+        filename = request.data.get('filename')
+        content_type = request.data.get('content_type')
+        try:
+            size = int(request.data.get('size'))
+        except (TypeError, ValueError):
+            return Response({
+                'error': 'size must be an integer'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not filename:
+            return Response({
+                'error': 'filename is required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        upload = start_upload(request.user, filename, content_type, size)
+        return Response({
+            'success': True,
+            'upload': describe_upload(upload)
+        }, status=status.HTTP_201_CREATED)
+    
+    except UploadError as e:
+        return Response({
+            'error': str(e)
+        }, status=e.status)
+    except Exception as e:
+        return Response({
+            'error': 'Failed to start upload',
+            'detail': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET', 'PUT', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def attachment_upload_detail(request, upload_id):
+    """
+    GET: upload progress, to resume from the returned offset
+    PUT ?offset=N: append the raw request body as the next chunk
+    DELETE: cancel the upload
+    """
+    try:
+        if request.method == 'PUT':
+            try:
+                offset = int(request.query_params.get('offset', ''))
+            except ValueError:
+                return Response({
+                    'error': 'offset must be an integer'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
+            upload = append_chunk(upload_id, request.user, offset, request.stream or io.BytesIO())
+            return Response({
+                'success': True,
+                'upload': describe_upload(upload)
+            }, status=status.HTTP_200_OK)
+        
+        upload = get_object_or_404(AttachmentUpload, id=upload_id, user=request.user)
+        
+        if request.method == 'DELETE':
+            cancel_upload(upload)
+            return Response({
+                'success': True,
+                'message': 'Upload cancelled'
+            }, status=status.HTTP_200_OK)
+        
+        return Response({
+            'success': True,
+            'upload': describe_upload(upload)
+        }, status=status.HTTP_200_OK)
+    
+    except UploadError as e:
+        response = {'error': str(e)}
+        if e.offset is not None:
+            response['offset'] = e.offset
+        return Response(response, status=e.status)
+    except Exception as e:
+        return Response({
+            'error': 'Failed to process upload',
+            'detail': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 # ==================== NOTIFICATION VIEWS ====================
 
 @api_view(['GET'])
@@ -623,6 +779,81 @@ def get_group_chat(request, group_chat_id):
         }, status=status.HTTP_404_NOT_FOUND)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_group_chat_online_users(request, group_chat_id):
+    """Get participants currently connected to a group chat"""
+    try:
+        group_chat = get_object_or_404(GroupChatRoom, id=group_chat_id)
+        user = request.user
+        
+        # Check if user is participant
+        if not group_chat.has_participant(user):
+            if user.role not in ['admin', 'hr']:
+                return Response({
+                    'error': 'Permission denied. You are not a participant in this chat'
+                }, status=status.HTTP_403_FORBIDDEN)
+        
+        online_user_ids = get_online_users(group_chat.id, 'group')
+        return Response({
+            'success': True,
+            'count': len(online_user_ids),
+            'online_user_ids': online_user_ids
+        }, status=status.HTTP_200_OK)
+    
+    except Exception as e:
+        return Response({
+            'error': 'Failed to fetch online users',
+            'detail': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_group_chat_fanout_metrics(request):
+    """Broadcast fan-out counters per group chat, as seen by this server process (admin/HR only)"""
+    try:
+        if request.user.role not in ['admin', 'hr']:
+            return Response({
+                'error': 'Permission denied'
+            }, status=status.HTTP_403_FORBIDDEN)
+        
+        group_chat_id = request.query_params.get('group_chat_id')
+        rooms = fanout_metrics.snapshot(int(group_chat_id) if group_chat_id else None)
+        return Response({
+            'success': True,
+            'rooms': [{'group_chat_id': room_id, **counters} for room_id, counters in sorted(rooms.items())]
+        }, status=status.HTTP_200_OK)
+    
+    except Exception as e:
+        return Response({
+            'error': 'Failed to fetch fan-out metrics',
+            'detail': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_chat_rate_limit_metrics(request):
+    """WebSocket frames allowed and rejected per frame type, as seen by this server process (admin/HR only)"""
+    try:
+        if request.user.role not in ['admin', 'hr']:
+            return Response({
+                'error': 'Permission denied'
+            }, status=status.HTTP_403_FORBIDDEN)
+        
+        return Response({
+            'success': True,
+            'frames': get_rate_limiter().snapshot()
+        }, status=status.HTTP_200_OK)
+    
+    except Exception as e:
+        return Response({
+            'error': 'Failed to fetch rate limit metrics',
+            'detail': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def add_group_chat_participant(request, group_chat_id):
@@ -732,6 +963,7 @@ def remove_group_chat_participant(request, group_chat_id, user_id):
 def send_group_message(request):
     """Send message to group chat"""
     try:
+        hash_uploads(request)
         serializer = GroupMessageCreateSerializer(data=request.data, context={'request': request})
         
         if not serializer.is_valid():
@@ -760,20 +992,32 @@ def send_group_message(request):
                 'error': 'You are muted in this chat room'
             }, status=status.HTTP_403_FORBIDDEN)
         
-        # Create message
-        message = GroupChatMessage.objects.create(
-            chat_room=group_chat,
-            sender=request.user,
-            message_type=data['message_type'],
-            content=data['content'],
-            attachment=data.get('attachment'),
-            reply_to_id=data.get('reply_to_id')
-        )
+        # Create message; attachments are stored once per content digest
+        attachment = data.get('attachment')
+        try:
+            with transaction.atomic():
+                blob = None
+                if attachment:
+                    blob = store_attachment(attachment, attachment.content_type)
+                elif data.get('upload_id'):
+                    blob = claim_upload(data['upload_id'], request.user)
+                message = GroupChatMessage.objects.create(
+                    chat_room=group_chat,
+                    sender=request.user,
+                    message_type=data['message_type'],
+                    content=data['content'],
+                    attachment=blob.file.name if blob else None,
+                    attachment_blob=blob,
+                    reply_to_id=data.get('reply_to_id')
+                )
+        except UploadError as e:
+            return Response({
+                'error': str(e)
+            }, status=e.status)
         
         # Update participant's last read time
         if participant:
-            participant.last_read_at = now()
-            participant.save(update_fields=['last_read_at'])
+            GroupChatParticipant.advance_watermark(group_chat, request.user)
         
         return Response({
             'success': True,
@@ -803,45 +1047,34 @@ def list_group_messages(request, group_chat_id):
                     'error': 'Permission denied. You are not a participant in this chat'
                 }, status=status.HTTP_403_FORBIDDEN)
         
-        # Mark unread messages as read for this user
-        unread_messages = group_chat.group_messages.filter(
-            is_deleted=False
-        ).exclude(
-            read_statuses__user=user
-        )
-        
-        for message in unread_messages:
-            message.mark_as_read_by_user(user)
-        
-        # Update participant's last read time
-        participant = GroupChatParticipant.objects.filter(
-            chat_room=group_chat,
-            user=user
-        ).first()
-        
-        if participant:
-            participant.last_read_at = now()
-            participant.save(update_fields=['last_read_at'])
+        # Mark everything as read by moving the user's watermark
+        GroupChatParticipant.advance_watermark(group_chat, user)
         
-        # Get messages with pagination
-        limit = request.query_params.get('limit', 50)
+        # Get messages with cursor pagination, or everything after a sequence when resuming
+        paginate = messages_since if 'after_sequence' in request.query_params else paginate_messages
         try:
-            limit = int(limit)
-            if limit > 100:
-                limit = 100
-        except (ValueError, TypeError):
-            limit = 50
-        
-        messages = group_chat.group_messages.filter(
-            is_deleted=False
-        ).order_by('-created_at')[:limit]
-        messages = list(reversed(messages))
+            messages, cursors = paginate(
+                group_chat.group_messages.filter(
+                    is_deleted=False
+                ).select_related('sender', 'reply_to__sender', 'attachment_blob'),
+                request.query_params,
+                archive=RoomArchive(GroupChatMessage, group_chat.id)
+            )
+        except InvalidCursor as e:
+            return Response({
+                'error': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
         
-        serializer = GroupChatMessageSerializer(messages, many=True, context={'request': request})
+        serializer = GroupChatMessageSerializer(messages, many=True, context={
+            'request': request,
+            'read_watermarks': group_chat.get_read_watermarks(),
+            'include_read_by': 'read_by' in request.query_params.get('include', '').split(',')
+        })
         return Response({
             'success': True,
             'count': len(messages),
-            'messages': serializer.data
+            'messages': serializer.data,
+            **cursors
         }, status=status.HTTP_200_OK)
     
     except Exception as e:
@@ -927,18 +1160,7 @@ def get_available_chats(request):
 def get_group_chat_unread_count(chat, user):
     """Helper function to get unread count for group chat"""
     try:
-        participant = GroupChatParticipant.objects.filter(
-            chat_room=chat,
-            user=user
-        ).first()
-        
-        if participant and participant.last_read_at:
-            return chat.group_messages.filter(
-                created_at__gt=participant.last_read_at,
-                is_deleted=False
-            ).exclude(sender=user).count()
-        else:
-            return chat.group_messages.filter(is_deleted=False).exclude(sender=user).count()
+        return chat.get_unread_count_for_user(user)
     except:
         return 0
 
@@ -998,14 +1220,41 @@ def get_my_chats(request):
         one_on_one_chats = ChatRoom.objects.filter(
             Q(user1=user) | Q(user2=user),
             is_active=True
-        ).select_related('user1', 'user2', 'mentorship')
-        
-        # Get group chats where user is a participant
+        ).select_related(
+            'user1__department', 'user2__department', 'mentorship', 'last_message__sender'
+        ).prefetch_related(
+            'mentorship__programs'
+        ).annotate(
+            last_activity=Coalesce('last_message_at', 'updated_at')
+        ).order_by('-last_activity')
+        
+        # Memberships of the user, then their group chats. Filtering by id
+        # keeps the participant count over every participant, and up to five
+        # other participants of each room come in one query.
+        participations = {
+            participant.chat_room_id: participant
+            for participant in GroupChatParticipant.objects.filter(user=user)
+        }
         group_chats = GroupChatRoom.objects.filter(
-            participants=user,
+            id__in=list(participations),
             is_active=True,
             is_archived=False
-        ).select_related('mentorship', 'created_by')
+        ).select_related(
+            'mentorship__mentor', 'mentorship__mentee', 'created_by', 'last_message__sender'
+        ).prefetch_related(
+            'mentorship__programs',
+            Prefetch(
+                'chat_participants',
+                queryset=GroupChatParticipant.objects.exclude(user=user).select_related('user').order_by('id')[:5],
+                to_attr='other_participants'
+            )
+        ).annotate(
+            last_activity=Coalesce('last_message_at', 'updated_at'),
+            total_participants=Count('chat_participants')
+        ).order_by('-last_activity')
+        
+        # Unread counts for every room in one query
+        chat_unread_counts, group_unread_counts = UnreadCounter.counts_for_user(user)
         
         # Process one-on-one chats
         one_on_one_data = []
@@ -1016,15 +1265,12 @@ def get_my_chats(request):
             if chat.mentorship:
                 mentorship_info = {
                     'id': chat.mentorship.id,
-                    'program_name': chat.mentorship.program.name,
+                    'program_name': program_names(chat.mentorship),
                     'status': chat.mentorship.status
                 }
             
-            last_message = chat.messages.filter(is_deleted=False).last()
-            unread_count = chat.messages.filter(
-                is_deleted=False,
-                is_read=False
-            ).exclude(sender=user).count()
+            last_message = chat.last_message
+            unread_count = chat_unread_counts.get(chat.id, 0)
             
             one_on_one_data.append({
                 'chat_type': 'one_on_one',
@@ -1034,17 +1280,18 @@ def get_my_chats(request):
                     'id': other_user.id,
                     'full_name': other_user.full_name,
                     'role': other_user.role,
-                    'department': other_user.department,
+                    'department': other_user.department.name if other_user.department else None,
                     'avatar': None  # Add if you have avatar field
                 },
                 'mentorship_info': mentorship_info,
                 'last_message': {
-                    'content': last_message.content[:100] + '...' if last_message and len(last_message.content) > 100 else (last_message.content if last_message else ''),
+                    'content': chat.last_message_preview,
                     'sender_id': last_message.sender.id if last_message else None,
                     'sender_name': last_message.sender.full_name if last_message else None,
-                    'timestamp': last_message.created_at if last_message else None
+                    'timestamp': chat.last_message_at
                 },
                 'unread_count': unread_count,
+                'last_activity': chat.last_activity,
                 'updated_at': chat.updated_at,
                 'created_at': chat.created_at
             })
@@ -1053,34 +1300,19 @@ def get_my_chats(request):
         group_chat_data = []
         for chat in group_chats:
             # Get participant info for this user
-            participant = GroupChatParticipant.objects.filter(
-                chat_room=chat,
-                user=user
-            ).first()
+            participant = participations.get(chat.id)
             
-            last_message = chat.group_messages.filter(is_deleted=False).last()
+            last_message = chat.last_message
+            unread_count = group_unread_counts.get(chat.id, 0)
             
-            # Calculate unread messages
-            unread_count = 0
-            if participant and participant.last_read_at:
-                unread_count = chat.group_messages.filter(
-                    created_at__gt=participant.last_read_at,
-                    is_deleted=False
-                ).exclude(sender=user).count()
-            else:
-                unread_count = chat.group_messages.filter(
-                    is_deleted=False
-                ).exclude(sender=user).count()
-            
-            # Get other participants info
-            other_participants = chat.participants.exclude(id=user.id)
+            # Get other participants info (up to 5, prefetched)
             other_participants_data = []
             
-            for participant_user in other_participants[:5]:  # Limit to 5
+            for other_participant in chat.other_participants:
                 other_participants_data.append({
-                    'id': participant_user.id,
-                    'full_name': participant_user.full_name,
-                    'role': participant_user.role
+                    'id': other_participant.user.id,
+                    'full_name': other_participant.user.full_name,
+                    'role': other_participant.user.role
                 })
             
             group_chat_data.append({
@@ -1093,29 +1325,33 @@ def get_my_chats(request):
                 'participant_role': participant.role if participant else 'member',
                 'is_muted': participant.is_muted if participant else False,
                 'other_participants': other_participants_data,
-                'total_participants': chat.participants.count(),
+                'total_participants': chat.total_participants,
                 'mentorship_info': {
                     'id': chat.mentorship.id,
-                    'program_name': chat.mentorship.program.name,
+                    'program_name': program_names(chat.mentorship),
                     'mentor_name': chat.mentorship.mentor.full_name,
                     'mentee_name': chat.mentorship.mentee.full_name
                 } if chat.mentorship else None,
                 'last_message': {
-                    'content': last_message.content[:100] + '...' if last_message and len(last_message.content) > 100 else (last_message.content if last_message else ''),
+                    'content': chat.last_message_preview,
                     'sender_id': last_message.sender.id if last_message else None,
                     'sender_name': last_message.sender.full_name if last_message else None,
                     'message_type': last_message.message_type if last_message else None,
-                    'timestamp': last_message.created_at if last_message else None
+                    'timestamp': chat.last_message_at
                 },
                 'unread_count': unread_count,
+                'last_activity': chat.last_activity,
                 'updated_at': chat.updated_at,
                 'created_at': chat.created_at,
-                'can_manage': chat.can_manage_chat(user)
+                # can_manage_chat() without its membership query
+                'can_manage': user.role in ['admin', 'hr'] or (
+                    participant is not None and participant.role in ['admin', 'moderator']
+                )
             })
         
         # Combine and sort by last activity
         all_chats = one_on_one_data + group_chat_data
-        all_chats.sort(key=lambda x: x['updated_at'], reverse=True)
+        all_chats.sort(key=lambda x: x['last_activity'], reverse=True)
         
         # Get statistics
         total_chats = len(all_chats)
@@ -1127,7 +1363,7 @@ def get_my_chats(request):
                 'id': user.id,
                 'full_name': user.full_name,
                 'role': user.role,
-                'department': user.department
+                'department': user.department.name if user.department_id else None
             },
             'stats': {
                 'total_chats': total_chats,
@@ -1162,12 +1398,12 @@ def get_mentor_mentee_chats(request):
             mentorships = Mentorship.objects.filter(
                 mentor=user,
                 status__in=['active', 'pending']
-            ).select_related('mentee', 'program')
+            ).select_related('mentee').prefetch_related('programs')
         else:  # mentee
             mentorships = Mentorship.objects.filter(
                 mentee=user,
                 status__in=['active', 'pending']
-            ).select_related('mentor', 'program')
+            ).select_related('mentor').prefetch_related('programs')
         
         chat_data = []
         
@@ -1202,8 +1438,8 @@ def get_mentor_mentee_chats(request):
                     'chat_id': one_on_one_chat.id,
                     'chat_name': f"Direct Chat with {other_user.full_name}",
                     'mentorship_id': mentorship.id,
-                    'program_name': mentorship.program.name,
-                    'program_id': mentorship.program.id,
+                    'program_name': program_names(mentorship),
+                    'program_id': mentorship.current_program_id,
                     'other_user': {
                         'id': other_user.id,
                         'full_name': other_user.full_name,
@@ -1249,12 +1485,12 @@ def get_mentor_mentee_chats(request):
                     'chat_name': group_chat.name,
                     'description': group_chat.description,
                     'mentorship_id': mentorship.id,
-                    'program_name': mentorship.program.name,
-                    'program_id': mentorship.program.id,
+                    'program_name': program_names(mentorship),
+                    'program_id': mentorship.current_program_id,
                     'other_user': {
                         'id': other_user.id,
                         'full_name': other_user.full_name,
-                        'role': other_user.user.role
+                        'role': other_user.role
                     },
                     'admin_hr_participants': list(admin_hr_participants),
                     'participant_count': group_chat.participants.count(),
@@ -1545,72 +1781,57 @@ def get_chat_summary(request):
         
         # Get group chat count
         group_chats = GroupChatRoom.objects.filter(
-            participants=user,
+            chat_participants__user=user,
             is_active=True,
             is_archived=False
         ).count()
         
         # Get total unread messages
-        total_unread = 0
-        
-        # Unread in one-on-one chats
-        one_on_one_unread = 0
-        for chat in ChatRoom.objects.filter(Q(user1=user) | Q(user2=user), is_active=True):
-            one_on_one_unread += chat.messages.filter(
-                is_deleted=False,
-                is_read=False
-            ).exclude(sender=user).count()
-        
-        # Unread in group chats
-        group_unread = 0
-        for chat in GroupChatRoom.objects.filter(participants=user, is_active=True, is_archived=False):
-            participant = GroupChatParticipant.objects.filter(
-                chat_room=chat,
-                user=user
-            ).first()
-            
-            if participant and participant.last_read_at:
-                group_unread += chat.group_messages.filter(
-                    created_at__gt=participant.last_read_at,
-                    is_deleted=False
-                ).exclude(sender=user).count()
-            else:
-                group_unread += chat.group_messages.filter(
-                    is_deleted=False
-                ).exclude(sender=user).count()
-        
-        total_unread = one_on_one_unread + group_unread
+        unread_totals = UnreadCounter.totals_for_user(user)
+        one_on_one_unread = unread_totals['one_on_one']
+        group_unread = unread_totals['group']
+        total_unread = unread_totals['total']
         
         # Get recent activity
         recent_messages = []
         
         # Get recent one-on-one messages
-        for chat in ChatRoom.objects.filter(Q(user1=user) | Q(user2=user), is_active=True):
-            last_message = chat.messages.filter(is_deleted=False).last()
-            if last_message:
-                other_user = chat.user2 if chat.user1 == user else chat.user1
-                recent_messages.append({
-                    'chat_type': 'one_on_one',
-                    'chat_id': chat.id,
-                    'other_user': other_user.full_name,
-                    'content': last_message.content[:50] + '...' if len(last_message.content) > 50 else last_message.content,
-                    'timestamp': last_message.created_at,
-                    'is_read': last_message.is_read if last_message.sender != user else True
-                })
+        recent_chats = ChatRoom.objects.filter(
+            Q(user1=user) | Q(user2=user),
+            is_active=True,
+            last_message__isnull=False
+        ).select_related('user1', 'user2', 'last_message').order_by('-last_message_at')[:10]
+        for chat in recent_chats:
+            last_message = chat.last_message
+            other_user = chat.user2 if chat.user1_id == user.id else chat.user1
+            recent_messages.append({
+                'chat_type': 'one_on_one',
+                'chat_id': chat.id,
+                'other_user': other_user.full_name,
+                'content': message_preview(last_message.content, 50),
+                'timestamp': chat.last_message_at,
+                'is_read': last_message.is_read if last_message.sender_id != user.id else True
+            })
         
         # Get recent group messages
-        for chat in GroupChatRoom.objects.filter(participants=user, is_active=True, is_archived=False):
-            last_message = chat.group_messages.filter(is_deleted=False).last()
-            if last_message:
-                recent_messages.append({
-                    'chat_type': 'group',
-                    'chat_id': chat.id,
-                    'chat_name': chat.name,
-                    'sender': last_message.sender.full_name,
-                    'content': last_message.content[:50] + '...' if len(last_message.content) > 50 else last_message.content,
-                    'timestamp': last_message.created_at,
-                    'is_read': last_message.get_read_by().filter(id=user.id).exists() if last_message.sender != user else True
-                })
+        _, group_unread_counts = UnreadCounter.counts_for_user(user)
+        recent_group_chats = GroupChatRoom.objects.filter(
+            chat_participants__user=user,
+            is_active=True,
+            is_archived=False,
+            last_message__isnull=False
+        ).select_related('last_message__sender').order_by('-last_message_at')[:10]
+        for chat in recent_group_chats:
+            last_message = chat.last_message
+            recent_messages.append({
+                'chat_type': 'group',
+                'chat_id': chat.id,
+                'chat_name': chat.name,
+                'sender': last_message.sender.full_name,
+                'content': message_preview(last_message.content, 50),
+                'timestamp': chat.last_message_at,
+                'is_read': not group_unread_counts.get(chat.id) if last_message.sender_id != user.id else True
+            })
         
         # Sort recent messages by timestamp
         recent_messages.sort(key=lambda x: x['timestamp'], reverse=True)
@@ -1669,20 +1890,19 @@ def search_my_chats(request):
             
             # Search in user name
             if search_query.lower() in other_user.full_name.lower():
-                last_message = chat.messages.filter(is_deleted=False).last()
                 one_on_one_results.append({
                     'type': 'one_on_one',
                     'chat_id': chat.id,
                     'name': other_user.full_name,
                     'role': other_user.role,
-                    'last_message': last_message.content[:100] + '...' if last_message and len(last_message.content) > 100 else (last_message.content if last_message else ''),
-                    'timestamp': last_message.created_at if last_message else chat.updated_at
+                    'last_message': chat.last_message_preview,
+                    'timestamp': chat.last_message_at or chat.updated_at
                 })
         
         # Search in group chats
         group_results = []
         group_chats = GroupChatRoom.objects.filter(
-            participants=user,
+            chat_participants__user=user,
             is_active=True,
             is_archived=False
         )
@@ -1692,15 +1912,14 @@ def search_my_chats(request):
             if (search_query.lower() in chat.name.lower() or 
                 search_query.lower() in chat.description.lower()):
                 
-                last_message = chat.group_messages.filter(is_deleted=False).last()
                 group_results.append({
                     'type': 'group',
                     'chat_id': chat.id,
                     'name': chat.name,
                     'description': chat.description,
                     'chat_type': chat.get_chat_type_display(),
-                    'last_message': last_message.content[:100] + '...' if last_message and len(last_message.content) > 100 else (last_message.content if last_message else ''),
-                    'timestamp': last_message.created_at if last_message else chat.updated_at
+                    'last_message': chat.last_message_preview,
+                    'timestamp': chat.last_message_at or chat.updated_at
                 })
         
         # Combine results
@@ -1725,6 +1944,43 @@ def search_my_chats(request):
 
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_messages(request):
+    """Full-text search over messages in the user's chats"""
+    try:
+        search_query = request.query_params.get('q', '').strip()
+        
+        if not search_query:
+            return Response({
+                'error': 'Search query is required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+        except (ValueError, TypeError):
+            page = 1
+        page_size = get_page_size({'limit': request.query_params.get('page_size', 20)})
+        
+        results, has_more = search_chat_messages(request.user, search_query, page, page_size)
+        
+        return Response({
+            'success': True,
+            'search_query': search_query,
+            'page': page,
+            'page_size': page_size,
+            'has_more': has_more,
+            'count': len(results),
+            'results': results
+        }, status=status.HTTP_200_OK)
+    
+    except Exception as e:
+        return Response({
+            'error': 'Failed to search messages',
+            'detail': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_chat_dashboard(request):
@@ -1737,135 +1993,11 @@ def get_chat_dashboard(request):
                 'error': 'This endpoint is for mentors and mentees only'
             }, status=status.HTTP_403_FORBIDDEN)
         
-        # Get chat statistics
-        from .utils import get_user_chat_statistics, get_recent_chat_activity
-        stats = get_user_chat_statistics(user)
-        
-        # Get recent activity
-        recent_activity = get_recent_chat_activity(user, limit=10)
-        
-        # Get active mentorships for chat categorization
-        if user.role == 'mentor':
-            active_mentorships = Mentorship.objects.filter(
-                mentor=user,
-                status='active'
-            ).select_related('mentee', 'program')
-        else:
-            active_mentorships = Mentorship.objects.filter(
-                mentee=user,
-                status='active'
-            ).select_related('mentor', 'program')
-        
-        # Categorize chats
-        mentorship_chats = []
-        department_chats = []
-        staff_chats = []
-        
-        # Process each mentorship
-        for mentorship in active_mentorships:
-            # Get mentorship-specific chats
-            mentorship_group = GroupChatRoom.objects.filter(
-                mentorship=mentorship,
-                chat_type='mentorship_group',
-                is_active=True,
-                is_archived=False
-            ).first()
-            
-            one_on_one = ChatRoom.objects.filter(
-                mentorship=mentorship,
-                chat_type='mentor_mentee',
-                is_active=True
-            ).first()
-            
-            if mentorship_group:
-                last_message = mentorship_group.group_messages.filter(is_deleted=False).last()
-                mentorship_chats.append({
-                    'type': 'group',
-                    'id': mentorship_group.id,
-                    'name': mentorship_group.name,
-                    'description': f"Mentorship with {mentorship.mentee.full_name if user.role == 'mentor' else mentorship.mentor.full_name}",
-                    'program': mentorship.program.name,
-                    'last_activity': last_message.created_at if last_message else mentorship_group.updated_at,
-                    'unread_count': calculate_group_unread(mentorship_group, user)
-                })
-            
-            if one_on_one:
-                last_message = one_on_one.messages.filter(is_deleted=False).last()
-                other_user = mentorship.mentee if user.role == 'mentor' else mentorship.mentor
-                mentorship_chats.append({
-                    'type': 'one_on_one',
-                    'id': one_on_one.id,
-                    'name': f"Direct chat with {other_user.full_name}",
-                    'description': f"One-on-one communication",
-                    'program': mentorship.program.name,
-                    'last_activity': last_message.created_at if last_message else one_on_one.updated_at,
-                    'unread_count': one_on_one.messages.filter(
-                        is_deleted=False,
-                        is_read=False
-                    ).exclude(sender=user).count()
-                })
-        
-        # Get department chats
-        if user.department:
-            department_group_chats = GroupChatRoom.objects.filter(
-                department=user.department,
-                chat_type='department_group',
-                is_active=True,
-                is_archived=False,
-                participants=user
-            )
-            
-            for chat in department_group_chats:
-                last_message = chat.group_messages.filter(is_deleted=False).last()
-                department_chats.append({
-                    'type': 'department_group',
-                    'id': chat.id,
-                    'name': chat.name,
-                    'description': chat.description,
-                    'participant_count': chat.participants.count(),
-                    'last_activity': last_message.created_at if last_message else chat.updated_at,
-                    'unread_count': calculate_group_unread(chat, user)
-                })
-        
-        # Get staff chats (for mentees)
-        if user.role == 'mentee':
-            staff_contacts = ChatRoom.objects.filter(
-                Q(user1=user) | Q(user2=user),
-                chat_type__in=['mentee_admin', 'mentee_hr'],
-                is_active=True
-            ).select_related('user1', 'user2')
-            
-            for chat in staff_contacts:
-                staff_user = chat.user2 if chat.user1 == user else chat.user1
-                last_message = chat.messages.filter(is_deleted=False).last()
-                staff_chats.append({
-                    'type': 'staff_chat',
-                    'id': chat.id,
-                    'name': f"Chat with {staff_user.full_name} ({staff_user.role})",
-                    'description': f"{staff_user.role.upper()} Support",
-                    'staff_role': staff_user.role,
-                    'last_activity': last_message.created_at if last_message else chat.updated_at,
-                    'unread_count': chat.messages.filter(
-                        is_deleted=False,
-                        is_read=False
-                    ).exclude(sender=user).count()
-                })
+        dashboard = build_chat_dashboard(user, activity_limit=10)
         
         return Response({
             'success': True,
-            'user': {
-                'id': user.id,
-                'full_name': user.full_name,
-                'role': user.role,
-                'department': user.department
-            },
-            'statistics': stats,
-            'recent_activity': recent_activity,
-            'chats': {
-                'mentorship_chats': sorted(mentorship_chats, key=lambda x: x['last_activity'], reverse=True),
-                'department_chats': sorted(department_chats, key=lambda x: x['last_activity'], reverse=True),
-                'staff_chats': sorted(staff_chats, key=lambda x: x['last_activity'], reverse=True) if user.role == 'mentee' else []
-            }
+            **dashboard
         }, status=status.HTTP_200_OK)
     
     except Exception as e:
@@ -1875,25 +2007,6 @@ def get_chat_dashboard(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-def calculate_group_unread(group_chat, user):
-    """Helper function to calculate unread messages in group chat"""
-    try:
-        participant = GroupChatParticipant.objects.filter(
-            chat_room=group_chat,
-            user=user
-        ).first()
-        
-        if participant and participant.last_read_at:
-            return group_chat.group_messages.filter(
-                created_at__gt=participant.last_read_at,
-                is_deleted=False
-            ).exclude(sender=user).count()
-        else:
-            return group_chat.group_messages.filter(
-                is_deleted=False
-            ).exclude(sender=user).count()
-    except:
-        return 0
 
 
 
@@ -2025,21 +2138,15 @@ def create_cross_department_chat(request):
                 cross_chat.add_participant(mentee_user, added_by=user, role='member')
                 added_user_ids.add(mentee_user.id)
         
-        # Send notifications to all added participants
-        for participant_id in added_user_ids:
-            if participant_id != user.id:  # Don't notify creator
-                try:
-                    participant_user = CustomUser.objects.get(id=participant_id)
-                    ChatNotification.objects.create(
-                        recipient=participant_user,
-                        sender=user,
-                        chat_room=cross_chat,
-                        notification_type='case_assigned',
-                        title=f'Added to Cross-Department Chat',
-                        message=f'You have been added to "{cross_chat.name}" by {user.full_name}'
-                    )
-                except CustomUser.DoesNotExist:
-                    continue
+        # Send notifications to all added participants, except the creator
+        dispatch_notifications(
+            CustomUser.objects.filter(id__in=added_user_ids).exclude(id=user.id),
+            ADDED_TO_CROSS_DEPARTMENT_CHAT,
+            sender=user,
+            group_chat_room=cross_chat,
+            chat_name=cross_chat.name,
+            sender_name=user.full_name
+        )
         
         # Create system announcement in the chat
         system_message = f"""🚀 **Cross-Department Chat Created!**
@@ -2344,13 +2451,24 @@ def manage_cross_department_chat_participants(request, chat_id):
             'not_found': []
         }
         
+        # Targets and current memberships in one query each
+        target_users = CustomUser.objects.in_bulk(
+            [user_id for user_id in user_ids if str(user_id).isdigit()]
+        )
+        participant_ids = set(
+            GroupChatParticipant.objects.filter(chat_room=cross_chat).values_list('user_id', flat=True)
+        )
+        notified_users = []
+        
         if action == 'add':
             for user_id in user_ids:
                 try:
-                    target_user = CustomUser.objects.get(id=user_id)
+                    target_user = target_users.get(int(user_id)) if str(user_id).isdigit() else None
+                    if target_user is None:
+                        raise CustomUser.DoesNotExist
                     
                     # Check if user is already a participant
-                    if cross_chat.participants.filter(id=target_user.id).exists():
+                    if target_user.id in participant_ids:
                         results['already_exists'].append({
                             'user_id': user_id,
                             'name': target_user.full_name
@@ -2363,22 +2481,14 @@ def manage_cross_department_chat_participants(request, chat_id):
                         added_by=user,
                         role=role
                     )
+                    participant_ids.add(target_user.id)
                     
                     results['added'].append({
                         'user_id': user_id,
                         'name': target_user.full_name,
                         'role': role
                     })
-                    
-                    # Send notification
-                    ChatNotification.objects.create(
-                        recipient=target_user,
-                        sender=user,
-                        chat_room=cross_chat,
-                        notification_type='case_assigned',
-                        title=f'Added to Cross-Department Chat',
-                        message=f'You have been added to "{cross_chat.name}" by {user.full_name}'
-                    )
+                    notified_users.append(target_user)
                     
                 except CustomUser.DoesNotExist:
                     results['not_found'].append(user_id)
@@ -2391,10 +2501,12 @@ def manage_cross_department_chat_participants(request, chat_id):
         elif action == 'remove':
             for user_id in user_ids:
                 try:
-                    target_user = CustomUser.objects.get(id=user_id)
+                    target_user = target_users.get(int(user_id)) if str(user_id).isdigit() else None
+                    if target_user is None:
+                        raise CustomUser.DoesNotExist
                     
                     # Check if user is a participant
-                    if not cross_chat.participants.filter(id=target_user.id).exists():
+                    if target_user.id not in participant_ids:
                         results['not_found'].append(user_id)
                         continue
                     
@@ -2413,21 +2525,13 @@ def manage_cross_department_chat_participants(request, chat_id):
                     
                     # Remove user from chat
                     cross_chat.remove_participant(target_user)
+                    participant_ids.discard(target_user.id)
                     
                     results['removed'].append({
                         'user_id': user_id,
                         'name': target_user.full_name
                     })
-                    
-                    # Send notification
-                    ChatNotification.objects.create(
-                        recipient=target_user,
-                        sender=user,
-                        chat_room=cross_chat,
-                        notification_type='status_changed',
-                        title=f'Removed from Cross-Department Chat',
-                        message=f'You have been removed from "{cross_chat.name}" by {user.full_name}'
-                    )
+                    notified_users.append(target_user)
                     
                 except CustomUser.DoesNotExist:
                     results['not_found'].append(user_id)
@@ -2437,6 +2541,16 @@ def manage_cross_department_chat_participants(request, chat_id):
                         'error': str(e)
                     })
         
+        # One notification batch for everyone added or removed
+        dispatch_notifications(
+            notified_users,
+            ADDED_TO_CROSS_DEPARTMENT_CHAT if action == 'add' else REMOVED_FROM_CROSS_DEPARTMENT_CHAT,
+            sender=user,
+            group_chat_room=cross_chat,
+            chat_name=cross_chat.name,
+            sender_name=user.full_name
+        )
+        
         # Create system message about the changes
         if results['added'] or results['removed']:
             system_message = f"""📢 **Participant Update**
@@ -2643,17 +2757,13 @@ Participants can no longer send messages in this chat.
         )
         
         # Send notifications to all participants
-        participants = cross_chat.participants.all()
-        for participant in participants:
-            if participant.id != user.id:
-                ChatNotification.objects.create(
-                    recipient=participant,
-                    sender=user,
-                    chat_room=cross_chat,
-                    notification_type='status_changed',
-                    title=f'Chat Archived',
-                    message=f'The cross-department chat "{cross_chat.name}" has been archived'
-                )
+        dispatch_notifications(
+            cross_chat.participants.exclude(id=user.id),
+            CROSS_DEPARTMENT_CHAT_ARCHIVED,
+            sender=user,
+            group_chat_room=cross_chat,
+            chat_name=cross_chat.name
+        )
         
         return Response({
             'success': True,
@@ -2743,4 +2853,44 @@ def get_available_users_for_cross_department(request):
         return Response({
             'error': 'Failed to fetch available users',
             'detail': str(e)
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_cross_department_candidates(request):
+    """
+    Search users to add to a cross-department chat (Admin/HR only).
+
+    ``q`` prefix-matches name, email, role and department; ``role``,
+    ``department`` and ``exclude_chat_id`` narrow the results. Pages are
+    ordered by name; pass ``next_cursor`` back as ``cursor`` for more.
+    """
+    try:
+        user = request.user
+        
+        if user.role not in ['admin', 'hr']:
+            return Response({
+                'error': 'Permission denied. Only Admin and HR can access this endpoint'
+            }, status=status.HTTP_403_FORBIDDEN)
+        
+        try:
+            users, next_cursor = search_candidates(request.query_params, exclude_user_id=user.id)
+        except ValueError as e:
+            return Response({
+                'error': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'success': True,
+            'count': len(users),
+            'users': [describe_candidate(candidate) for candidate in users],
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
+        }, status=status.HTTP_200_OK)
+    
+    except Exception as e:
+        return Response({
+            'error': 'Failed to search users',
+            'detail': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
@@ -0,0 +1,131 @@
+# chatApp/wire.py
+import json
+import threading
+from collections import OrderedDict
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional; clients then always get JSON
+    msgpack = None
+
+
+JSON_SUBPROTOCOL = 'chat.json'
+MSGPACK_SUBPROTOCOL = 'chat.msgpack'
+MSGPACK_FRAMES_SIZE = 256
+
+
+class DecodeError(ValueError):
+    """A frame that is not a valid payload for the connection's wire format"""
+
+
+def _default(value):
+    return DjangoJSONEncoder().default(value)
+
+
+def encode_json(payload):
+    return json.dumps(payload, cls=DjangoJSONEncoder)
+
+
+def encode_msgpack(payload):
+    return msgpack.packb(payload, default=_default, use_bin_type=True)
+
+
+def msgpack_available():
+    return msgpack is not None
+
+
+class MsgpackFrames:
+    """
+    MessagePack encodings of broadcast frames, made from their JSON frame
+    the first time a MessagePack socket of this process needs one. Rooms
+    without such sockets never pay for the second encoding.
+    """
+
+    def __init__(self, size=MSGPACK_FRAMES_SIZE):
+        self.size = size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, frames):
+        frame_id = frames['id']
+        with self.lock:
+            if frame_id in self.entries:
+                self.entries.move_to_end(frame_id)
+                return self.entries[frame_id]
+        data = encode_msgpack(json.loads(frames['json']))
+        with self.lock:
+            self.entries[frame_id] = data
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return data
+
+
+msgpack_frames = MsgpackFrames()
+
+
+def negotiate(scope):
+    """
+    Pick the subprotocol to accept from the ones the client offered.
+    MessagePack wins when offered and installed; None means plain JSON
+    without a Sec-WebSocket-Protocol header, as before.
+    """
+    offered = scope.get('subprotocols') or []
+    if MSGPACK_SUBPROTOCOL in offered and msgpack_available():
+        return MSGPACK_SUBPROTOCOL
+    if JSON_SUBPROTOCOL in offered:
+        return JSON_SUBPROTOCOL
+    return None
+
+
+class WireFormatMixin:
+    """
+    Negotiated wire format for AsyncWebsocketConsumer subclasses.
+
+    Consumers call send_payload() with a dict and decode_frame() on what
+    they receive; the mixin turns those into JSON text frames or
+    MessagePack binary frames depending on the accepted subprotocol.
+    """
+
+    subprotocol = None
+
+    @property
+    def uses_msgpack(self):
+        return self.subprotocol == MSGPACK_SUBPROTOCOL
+
+    async def accept(self, subprotocol=None, headers=None):
+        self.subprotocol = subprotocol or negotiate(self.scope)
+        await super().accept(subprotocol=self.subprotocol, headers=headers)
+
+    def decode_frame(self, text_data=None, bytes_data=None):
+        """Payload dict of an incoming frame"""
+        try:
+            if bytes_data is not None and self.uses_msgpack:
+                data = msgpack.unpackb(bytes_data, raw=False)
+            else:
+                data = json.loads(text_data if text_data is not None else bytes_data)
+        except Exception as e:
+            raise DecodeError(str(e))
+        if not isinstance(data, dict):
+            raise DecodeError('Expected an object')
+        return data
+
+    async def send_payload(self, payload):
+        if self.uses_msgpack:
+            await self.send(bytes_data=encode_msgpack(payload))
+        else:
+            await self.send(text_data=encode_json(payload))
+
+    async def send_frames(self, frames):
+        """
+        Send a broadcast that was already encoded as JSON (see
+        fanout.broadcast_frame); MessagePack sockets get it transcoded once
+        per process. Returns the number of bytes sent.
+        """
+        if self.uses_msgpack:
+            data = msgpack_frames.get(frames)
+            await self.send(bytes_data=data)
+            return len(data)
+        await self.send(text_data=frames['json'])
+        return len(frames['json'])
@@ -14,4 +14,22 @@ app.conf.beat_schedule = {
         'task': 'mentorshipApp.tasks.send_session_reminders',
         'schedule': crontab(hour='*/1'),  # Run every hour
     },
+    'archive-chat-messages': {
+        'task': 'chatApp.tasks.archive_chat_messages',
+        'schedule': crontab(hour=3, minute=0),  # Run daily at 3 AM
+    },
+    'relay-notification-outbox': {
+        'task': 'notificationApp.tasks.relay_notification_outbox',
+        'schedule': crontab(),  # Run every minute for retries and missed relays
+    },
+    'send-daily-notification-digests': {
+        'task': 'notificationApp.tasks.send_notification_digests',
+        'schedule': crontab(hour=7, minute=0),  # Run daily at 7 AM
+        'args': ('daily',),
+    },
+    'send-weekly-notification-digests': {
+        'task': 'notificationApp.tasks.send_notification_digests',
+        'schedule': crontab(hour=7, minute=0, day_of_week=1),  # Run Mondays at 7 AM
+        'args': ('weekly',),
+    },
 }
\ No newline at end of file
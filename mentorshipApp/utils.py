@@ -1,6 +1,7 @@
 # mentoshipApp/utils.py
 from django.utils import timezone
 from datetime import timedelta
+from notificationApp.dispatch import NotificationTemplate, dispatch_notifications
 from notificationApp.models import ChatNotification
 from chatApp.models import ChatRoom
 from userApp.models import CustomUser
@@ -322,6 +323,13 @@ def send_program_completed_notification(mentorship, program):
         logger.error(f"Error sending program completed notification: {str(e)}")
 
 
+HIGH_RATED_MENTORSHIP = NotificationTemplate(
+    'mentorship_success',
+    'High-Rated Mentorship Completed',
+    'Mentorship between {mentor_name} and {mentee_name} completed with rating: {rating}/5'
+)
+
+
 def send_mentorship_completed_notification(mentorship):
     """Send notification when mentorship is completed"""
     try:
@@ -331,15 +339,7 @@ def send_mentorship_completed_notification(mentorship):
             chat_room=get_chat_room(mentorship),
             notification_type='mentorship_completed',
             title='Mentorship Completed! 🎓',
-            message=f'Congratulations on completing your mentorship journey!',
-            metadata={
-                'mentorship_id': mentorship.id,
-                'completed_at': mentorship.actual_end_date.isoformat() if mentorship.actual_end_date else timezone.now().isoformat(),
-                'start_date': mentorship.start_date.isoformat() if mentorship.start_date else '',
-                'duration_days': (mentorship.actual_end_date - mentorship.start_date).days if mentorship.actual_end_date and mentorship.start_date else 0,
-                'total_programs': mentorship.programs.count(),
-                'rating': mentorship.rating or 0
-            }
+            message=f'Congratulations on completing your mentorship journey!'
         )
         
         # Notification for mentor
@@ -348,37 +348,18 @@ def send_mentorship_completed_notification(mentorship):
             chat_room=get_chat_room(mentorship),
             notification_type='mentorship_completed',
             title='Mentorship Completed',
-            message=f'Your mentorship with {mentorship.mentee.full_name} has been completed',
-            metadata={
-                'mentorship_id': mentorship.id,
-                'mentee_name': mentorship.mentee.full_name,
-                'completed_at': mentorship.actual_end_date.isoformat() if mentorship.actual_end_date else timezone.now().isoformat(),
-                'duration_days': (mentorship.actual_end_date - mentorship.start_date).days if mentorship.actual_end_date and mentorship.start_date else 0,
-                'rating': mentorship.rating or 0
-            }
+            message=f'Your mentorship with {mentorship.mentee.full_name} has been completed'
         )
         
         # Notification for admin/HR if mentorship has high rating
         if mentorship.rating and mentorship.rating >= 4.5:
-            admins = CustomUser.objects.filter(
-                role__in=['admin', 'hr'],
-                is_active=True
+            dispatch_notifications(
+                CustomUser.objects.filter(role__in=['admin', 'hr'], is_active=True),
+                HIGH_RATED_MENTORSHIP,
+                mentor_name=mentorship.mentor.full_name,
+                mentee_name=mentorship.mentee.full_name,
+                rating=mentorship.rating
             )
-            
-            for admin in admins:
-                ChatNotification.objects.create(
-                    recipient=admin,
-                    notification_type='mentorship_success',
-                    title='High-Rated Mentorship Completed',
-                    message=f'Mentorship between {mentorship.mentor.full_name} and {mentorship.mentee.full_name} completed with rating: {mentorship.rating}/5',
-                    metadata={
-                        'mentorship_id': mentorship.id,
-                        'mentor_name': mentorship.mentor.full_name,
-                        'mentee_name': mentorship.mentee.full_name,
-                        'rating': mentorship.rating,
-                        'department': mentorship.department.name if mentorship.department else 'Unknown'
-                    }
-                )
         
         logger.info(f"Mentorship completed notification sent for mentorship {mentorship.id}")
         
@@ -694,7 +675,7 @@ def get_online_users(chat_room_id):
 
 # Add to mentorshipApp/utils.py (create if it doesn't exist)
 
-from django.db.models import Count, Q, Max
+from django.db.models import Count, Q, Max, OuterRef, Subquery
 from django.utils import timezone
 from datetime import timedelta
 
@@ -845,9 +826,14 @@ def get_recent_chat_activity(user, limit=5):
         
         # Get recent group messages
         group_chats = GroupChatRoom.objects.filter(
-            participants=user,
+            chat_participants__user=user,
             is_active=True,
             is_archived=False
+        ).annotate(
+            my_last_read_sequence=Subquery(GroupChatParticipant.objects.filter(
+                chat_room=OuterRef('pk'),
+                user=user
+            ).values('last_read_sequence')[:1])
         )
         
         for chat in group_chats:
@@ -864,7 +850,7 @@ def get_recent_chat_activity(user, limit=5):
                     'timestamp': message.created_at,
                     'sender': message.sender.full_name,
                     'is_own': message.sender == user,
-                    'is_read': message.get_read_by().filter(id=user.id).exists() if message.sender != user else True
+                    'is_read': (message.sequence or 0) <= (chat.my_last_read_sequence or 0) if message.sender != user else True
                 })
         
         # Sort by timestamp and limit
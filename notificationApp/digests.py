@@ -0,0 +1,170 @@
+# notificationApp/digests.py
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import DateTimeField, F, Q, Value
+from django.db.models.functions import Coalesce
+from django.template.loader import render_to_string
+from django.utils.timezone import now
+
+from .models import ChatNotification, NotificationLog, UserNotificationPreference
+
+logger = logging.getLogger(__name__)
+
+
+PERIODS = {
+    'daily': timedelta(days=1),
+    'weekly': timedelta(weeks=1),
+}
+# Scheduled runs drift; a digest sent a little less than a period ago is due again
+SCHEDULE_SLACK = timedelta(hours=1)
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_MAX_ITEMS = 50
+
+
+def get_digest_config():
+    config = getattr(settings, 'NOTIFICATION_DIGESTS', {})
+    return {
+        'BATCH_SIZE': config.get('BATCH_SIZE', DEFAULT_BATCH_SIZE),
+        'MAX_ITEMS': config.get('MAX_ITEMS', DEFAULT_MAX_ITEMS),
+    }
+
+
+def due_preferences(frequency, sent_at):
+    """Preferences of users who chose this digest and have not had one for a period"""
+    return UserNotificationPreference.objects.filter(
+        Q(last_digest_sent_at__isnull=True) |
+        Q(last_digest_sent_at__lte=sent_at - PERIODS[frequency] + SCHEDULE_SLACK),
+        email_frequency=frequency,
+        enable_email_notifications=True,
+        user__is_active=True
+    ).select_related('user')
+
+
+def pending_notifications(preferences, frequency, sent_at):
+    """
+    Unread notifications of each user created since their last digest, or
+    within the last period for a first digest, newest first. One query for
+    the whole batch.
+    """
+    first_since = Value(sent_at - PERIODS[frequency], output_field=DateTimeField())
+    notifications = ChatNotification.objects.filter(
+        recipient_id__in=[preference.user_id for preference in preferences],
+        is_read=False,
+        is_archived=False,
+        created_at__lte=sent_at
+    ).annotate(
+        since=Coalesce('recipient__notification_preferences__last_digest_sent_at', first_since)
+    ).filter(
+        created_at__gt=F('since')
+    ).select_related('sender').order_by('recipient_id', '-created_at')
+
+    pending = {}
+    for notification in notifications:
+        pending.setdefault(notification.recipient_id, []).append(notification)
+    return pending
+
+
+def build_digest(user, notifications, frequency, max_items, connection=None):
+    """The digest email of one user"""
+    context = {
+        'user': user,
+        'frequency': frequency,
+        'count': len(notifications),
+        'notifications': notifications[:max_items],
+        'more': max(len(notifications) - max_items, 0),
+    }
+    subject = f"Your {frequency} digest: {len(notifications)} new notification{'s' if len(notifications) != 1 else ''}"
+    message = EmailMultiAlternatives(
+        subject=subject,
+        body=render_to_string('notificationApp/email_digest.txt', context),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[user.email],
+        connection=connection
+    )
+    message.attach_alternative(render_to_string('notificationApp/email_digest.html', context), 'text/html')
+    return message
+
+
+def reconnect(connection):
+    """Start a fresh session after a failed send; False if the server cannot be reached"""
+    try:
+        connection.close()
+        connection.open()
+        return True
+    except Exception as e:
+        logger.error(f"Could not reconnect to send digests, stopping: {e}")
+        return False
+
+
+def send_digests(frequency, sent_at=None, connection=None):
+    """
+    Email every user due for a daily or weekly digest one message covering
+    their unread notifications since the previous digest.
+
+    Users are handled BATCH_SIZE at a time: one query for their pending
+    notifications, then their messages over a single SMTP connection that
+    stays open for the whole run, then one UPDATE and one log insert. A
+    user whose message failed keeps their old watermark and is picked up
+    by the next run. The batch is recorded even when the run stops early
+    because the server cannot be reached again. Returns (sent, failed).
+    """
+    if frequency not in PERIODS:
+        raise ValueError(f'Unknown digest frequency: {frequency}')
+    config = get_digest_config()
+    sent_at = sent_at or now()
+    connection = connection or get_connection()
+
+    sent = failed = 0
+    last_id = 0
+    connection.open()
+    try:
+        while True:
+            preferences = list(due_preferences(frequency, sent_at).filter(
+                id__gt=last_id
+            ).order_by('id')[:config['BATCH_SIZE']])
+            if not preferences:
+                return sent, failed
+            last_id = preferences[-1].id
+
+            pending = pending_notifications(preferences, frequency, sent_at)
+            done, logs = [], []
+            try:
+                for preference in preferences:
+                    user = preference.user
+                    notifications = pending.get(user.id)
+                    if not notifications or not user.email:
+                        # Nothing to send; the next digest starts from here
+                        done.append(user.id)
+                        continue
+
+                    message = build_digest(user, notifications, frequency, config['MAX_ITEMS'], connection)
+                    try:
+                        connection.send_messages([message])
+                        done.append(user.id)
+                        sent += 1
+                        error = None
+                    except Exception as e:
+                        failed += 1
+                        error = str(e)
+                        logger.error(f"Error sending {frequency} digest to {user.email}: {e}")
+                    logs.append(NotificationLog(
+                        recipient=user,
+                        notification_type=f'{frequency}_digest',
+                        title=message.subject,
+                        message=f'{len(notifications)} notifications',
+                        sent_via=['email'],
+                        success=error is None,
+                        error_message=error
+                    ))
+                    # Start over with a fresh session for the rest of the batch
+                    if error is not None and not reconnect(connection):
+                        return sent, failed
+            finally:
+                # Users emailed so far must not get the same digest again
+                UserNotificationPreference.objects.filter(user_id__in=done).update(last_digest_sent_at=sent_at)
+                NotificationLog.objects.bulk_create(logs)
+    finally:
+        connection.close()
@@ -0,0 +1,82 @@
+# notificationApp/dispatch.py
+import uuid
+
+from django.db import transaction
+from django.utils.timezone import now
+
+from .models import ChatNotification
+from .outbox import enqueue_notifications
+
+
+BATCH_SIZE = 500
+
+
+class NotificationTemplate:
+    """
+    Type, title and message of a notification sent to many users. Title
+    and message are str.format templates filled per recipient from
+    {recipient} and the context given to dispatch_notifications; values
+    are inserted as they are, so user-provided names need no escaping.
+    """
+
+    def __init__(self, notification_type, title, message):
+        self.notification_type = notification_type
+        self.title = title
+        self.message = message
+
+    def render(self, recipient, context):
+        return (
+            self.title.format(recipient=recipient, **context),
+            self.message.format(recipient=recipient, **context)
+        )
+
+
+def _resolve_primary_keys(notifications, batch_id):
+    """
+    Fill in ids after bulk_create on backends that cannot return them
+    (MySQL). Rows are matched by the batch id written with them, which no
+    other dispatch shares, and recipients are unique within a batch.
+    """
+    missing = [notification for notification in notifications if notification.pk is None]
+    if not missing:
+        return
+    rows = ChatNotification.objects.filter(batch_id=batch_id).values_list('id', 'recipient_id')
+    ids = {recipient_id: pk for pk, recipient_id in rows}
+    for notification in missing:
+        notification.pk = ids.get(notification.recipient_id)
+
+
+def dispatch_notifications(recipients, template, sender=None, chat_room=None, group_chat_room=None, **context):
+    """
+    Notify every recipient once: all rows are inserted with one
+    bulk_create and their WebSocket events go through the outbox together.
+
+    bulk_create skips the post_save signal that queues single
+    notifications, so nothing is sent twice. Returns the notifications.
+    """
+    recipients = list({recipient.pk: recipient for recipient in recipients}.values())
+    if not recipients:
+        return []
+
+    created_at = now()
+    batch_id = uuid.uuid4()
+    notifications = []
+    for recipient in recipients:
+        title, message = template.render(recipient, context)
+        notifications.append(ChatNotification(
+            recipient=recipient,
+            sender=sender,
+            chat_room=chat_room,
+            group_chat_room=group_chat_room,
+            notification_type=template.notification_type,
+            title=title,
+            message=message,
+            created_at=created_at,
+            batch_id=batch_id
+        ))
+
+    with transaction.atomic():
+        ChatNotification.objects.bulk_create(notifications, batch_size=BATCH_SIZE)
+        _resolve_primary_keys(notifications, batch_id)
+        enqueue_notifications(notifications)
+    return notifications
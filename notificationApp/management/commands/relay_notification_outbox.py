@@ -0,0 +1,22 @@
+# notificationApp/management/commands/relay_notification_outbox.py
+from django.core.management.base import BaseCommand
+
+from notificationApp.models import NotificationOutbox
+from notificationApp.outbox import get_outbox_config, relay_outbox
+
+
+class Command(BaseCommand):
+    help = 'Publish committed notifications waiting in the outbox to the channel layer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=get_outbox_config()['BATCH_SIZE'])
+        parser.add_argument('--retry-failed', action='store_true', help='Make entries that ran out of attempts due again')
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            NotificationOutbox.objects.filter(
+                attempts__gte=get_outbox_config()['MAX_ATTEMPTS']
+            ).update(attempts=0)
+
+        published, failed = relay_outbox(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Published {published} notifications, {failed} failed"))
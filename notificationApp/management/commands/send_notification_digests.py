@@ -0,0 +1,15 @@
+# notificationApp/management/commands/send_notification_digests.py
+from django.core.management.base import BaseCommand
+
+from notificationApp.digests import PERIODS, send_digests
+
+
+class Command(BaseCommand):
+    help = 'Email the daily or weekly notification digest to every user who is due one'
+
+    def add_arguments(self, parser):
+        parser.add_argument('frequency', choices=sorted(PERIODS))
+
+    def handle(self, *args, **options):
+        sent, failed = send_digests(options['frequency'])
+        self.stdout.write(self.style.SUCCESS(f"Sent {sent} {options['frequency']} digests, {failed} failed"))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notificationApp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatnotification',
+            name='batch_id',
+            field=models.UUIDField(blank=True, db_index=True, editable=False, null=True),
+        ),
+    ]
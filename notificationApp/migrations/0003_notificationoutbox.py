@@ -0,0 +1,31 @@
+# Generated by Django 6.0 on 2026-10-17 18:15
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notificationApp', '0002_chatnotification_batch_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('notification', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='outbox_entry', to='notificationApp.chatnotification')),
+            ],
+            options={
+                'verbose_name': 'Notification Outbox Entry',
+                'verbose_name_plural': 'Notification Outbox',
+                'indexes': [models.Index(fields=['next_attempt_at'], name='notificatio_next_at_5322a6_idx')],
+            },
+        ),
+    ]
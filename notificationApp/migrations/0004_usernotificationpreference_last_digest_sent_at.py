@@ -0,0 +1,24 @@
+# Generated by Django 6.0 on 2026-10-17 18:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notificationApp', '0003_notificationoutbox'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usernotificationpreference',
+            name='last_digest_sent_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='usernotificationpreference',
+            index=models.Index(fields=['email_frequency', 'last_digest_sent_at'], name='notificatio_email_f_bedcf2_idx'),
+        ),
+    ]
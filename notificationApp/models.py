@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils.timezone import now
 from userApp.models import CustomUser
 from mentorshipApp.models import Mentorship
@@ -53,6 +53,8 @@ class ChatNotification(models.Model):
     created_at = models.DateTimeField(default=now)
     read_at = models.DateTimeField(null=True, blank=True)
     archived_at = models.DateTimeField(null=True, blank=True)
+    # Shared by the rows of one dispatch_notifications() call
+    batch_id = models.UUIDField(null=True, blank=True, db_index=True, editable=False)
     
     class Meta:
         ordering = ['-created_at']
@@ -67,6 +69,11 @@ class ChatNotification(models.Model):
     def __str__(self):
         return f"Notification for {self.recipient.full_name}: {self.title}"
     
+    def save(self, *args, **kwargs):
+        # The outbox entry written by post_save commits together with the row
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+    
     def mark_as_read(self):
         """Mark notification as read"""
         if not self.is_read:
@@ -82,6 +89,36 @@ class ChatNotification(models.Model):
             self.save()
 
 
+class NotificationOutbox(models.Model):
+    """
+    Real-time event of a notification waiting to be published.
+    
+    Written in the same transaction as the notification, so only committed
+    notifications are ever published; the relay deletes the row once the
+    event reached the channel layer and reschedules it with a growing
+    delay otherwise. Delivery is at least once.
+    """
+    notification = models.OneToOneField(
+        ChatNotification,
+        on_delete=models.CASCADE,
+        related_name='outbox_entry'
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=now)
+    
+    class Meta:
+        verbose_name = 'Notification Outbox Entry'
+        verbose_name_plural = 'Notification Outbox'
+        indexes = [
+            models.Index(fields=['next_attempt_at']),
+        ]
+    
+    def __str__(self):
+        return f"Outbox entry for notification {self.notification_id} ({self.attempts} attempts)"
+
+
 class SystemNotification(models.Model):
     """System-wide notifications"""
     NOTIFICATION_LEVELS = [
@@ -167,6 +204,8 @@ class UserNotificationPreference(models.Model):
         ],
         default='instant'
     )
+    # End of the period covered by the last daily/weekly digest
+    last_digest_sent_at = models.DateTimeField(null=True, blank=True)
     
     # Push notifications
     enable_push_notifications = models.BooleanField(default=True)
@@ -185,6 +224,9 @@ class UserNotificationPreference(models.Model):
     class Meta:
         verbose_name = 'User Notification Preference'
         verbose_name_plural = 'User Notification Preferences'
+        indexes = [
+            models.Index(fields=['email_frequency', 'last_digest_sent_at']),
+        ]
     
     def __str__(self):
         return f"Notification preferences for {self.user.full_name}"
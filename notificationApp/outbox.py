@@ -0,0 +1,164 @@
+# notificationApp/outbox.py
+import asyncio
+import logging
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.utils.timezone import now
+
+from .models import NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_MAX_ATTEMPTS = 10
+DEFAULT_RETRY_DELAY = 5
+DEFAULT_MAX_RETRY_DELAY = 600
+
+
+def get_outbox_config():
+    config = getattr(settings, 'NOTIFICATION_OUTBOX', {})
+    return {
+        'INLINE': config.get('INLINE', getattr(settings, 'CELERY_TASK_ALWAYS_EAGER', False)),
+        'BATCH_SIZE': config.get('BATCH_SIZE', DEFAULT_BATCH_SIZE),
+        'MAX_ATTEMPTS': config.get('MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS),
+        'RETRY_DELAY': config.get('RETRY_DELAY', DEFAULT_RETRY_DELAY),
+        'MAX_RETRY_DELAY': config.get('MAX_RETRY_DELAY', DEFAULT_MAX_RETRY_DELAY),
+    }
+
+
+def notification_event(notification):
+    """Channel layer event NotificationConsumer forwards for a saved notification"""
+    return {
+        'type': 'notification_message',
+        'notification': {
+            'id': notification.id,
+            'title': notification.title,
+            'message': notification.message,
+            'notification_type': notification.notification_type,
+            'created_at': notification.created_at.isoformat(),
+            'sender': {
+                'id': notification.sender.id,
+                'full_name': notification.sender.full_name
+            } if notification.sender else None
+        }
+    }
+
+
+def enqueue_notifications(notifications):
+    """
+    Queue the real-time events of notifications saved in the current
+    transaction; the relay runs once it commits, outside the request.
+    """
+    if not notifications:
+        return
+    NotificationOutbox.objects.bulk_create([
+        NotificationOutbox(notification_id=notification.pk) for notification in notifications
+    ])
+    transaction.on_commit(schedule_relay)
+
+
+def schedule_relay():
+    """Relay the outbox in the Celery worker, or right away in inline mode"""
+    if get_outbox_config()['INLINE']:
+        relay_outbox()
+        return
+
+    from .tasks import relay_notification_outbox
+    try:
+        relay_notification_outbox.delay()
+    except Exception as e:
+        # The entries stay queued; the periodic relay picks them up
+        logger.error(f"Could not queue notification relay: {e}")
+
+
+def publish(notifications):
+    """Send events to the channel layer together; the error of each send, or None"""
+    channel_layer = get_channel_layer()
+
+    async def send_all():
+        return await asyncio.gather(*(
+            channel_layer.group_send(f'user_{notification.recipient_id}', notification_event(notification))
+            for notification in notifications
+        ), return_exceptions=True)
+
+    return async_to_sync(send_all)()
+
+
+def retry_delay(attempts, config):
+    return timedelta(seconds=min(config['RETRY_DELAY'] * 2 ** (attempts - 1), config['MAX_RETRY_DELAY']))
+
+
+def claim_batch(batch_size, config):
+    """
+    Lease up to batch_size due entries in a short transaction: their
+    attempts go up and next_attempt_at moves past the retry delay, so
+    other relays leave them alone while this one publishes. Entries of a
+    relay that dies before recording the outcome come due again later.
+    """
+    with transaction.atomic():
+        entries = list(NotificationOutbox.objects.select_for_update(skip_locked=True).filter(
+            next_attempt_at__lte=now(),
+            attempts__lt=config['MAX_ATTEMPTS']
+        ).select_related('notification__sender').order_by('id')[:batch_size])
+        claimed_at = now()
+        for entry in entries:
+            entry.attempts += 1
+            entry.next_attempt_at = claimed_at + retry_delay(entry.attempts, config)
+        NotificationOutbox.objects.bulk_update(entries, ['attempts', 'next_attempt_at'])
+    return entries
+
+
+def relay_batch(batch_size=None):
+    """
+    Publish one batch of due entries. The entries are claimed first and
+    published outside any transaction, so no row locks are held while the
+    channel layer is slow, and several relays can run at once. Published
+    entries are deleted; failed ones keep their claimed backoff until
+    MAX_ATTEMPTS. Returns (published, failed).
+    """
+    config = get_outbox_config()
+    batch_size = batch_size or config['BATCH_SIZE']
+
+    entries = claim_batch(batch_size, config)
+    if not entries:
+        return 0, 0
+
+    errors = publish([entry.notification for entry in entries])
+
+    failed = []
+    for entry, error in zip(entries, errors):
+        if error is not None:
+            entry.last_error = f"{type(error).__name__}: {error}"
+            failed.append(entry)
+
+    with transaction.atomic():
+        NotificationOutbox.objects.filter(
+            id__in=[entry.id for entry, error in zip(entries, errors) if error is None]
+        ).delete()
+        NotificationOutbox.objects.bulk_update(failed, ['last_error'])
+
+    for entry in failed:
+        if entry.attempts >= config['MAX_ATTEMPTS']:
+            logger.error(
+                f"Giving up on notification {entry.notification_id} after {entry.attempts} attempts: {entry.last_error}"
+            )
+        else:
+            logger.error(f"Could not publish notification {entry.notification_id}: {entry.last_error}")
+    return len(entries) - len(failed), len(failed)
+
+
+def relay_outbox(batch_size=None):
+    """Publish every due entry, batch by batch. Returns (published, failed)."""
+    batch_size = batch_size or get_outbox_config()['BATCH_SIZE']
+    published = failed = 0
+    while True:
+        batch_published, batch_failed = relay_batch(batch_size)
+        published += batch_published
+        failed += batch_failed
+        if batch_published + batch_failed < batch_size:
+            return published, failed
@@ -0,0 +1,27 @@
+# notificationApp/tasks.py
+from celery import shared_task
+from .digests import send_digests
+from .outbox import relay_outbox
+import logging
+
+logger = logging.getLogger(__name__)
+
+@shared_task
+def relay_notification_outbox():
+    """Celery task to publish committed notifications waiting in the outbox"""
+    try:
+        published, failed = relay_outbox()
+        if published or failed:
+            logger.info(f"Notification relay: {published} published, {failed} failed")
+    except Exception as e:
+        logger.error(f"Error in notification relay task: {str(e)}")
+
+
+@shared_task
+def send_notification_digests(frequency):
+    """Celery task to email the daily or weekly notification digests"""
+    try:
+        sent, failed = send_digests(frequency)
+        logger.info(f"{frequency.title()} digests: {sent} sent, {failed} failed")
+    except Exception as e:
+        logger.error(f"Error in {frequency} digest task: {str(e)}")
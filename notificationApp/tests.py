@@ -1,3 +1,376 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.utils.timezone import now
+
+from chatApp.loadtest import IN_MEMORY_CHANNEL_LAYERS
+from userApp.models import CustomUser
+from .digests import send_digests
+from .dispatch import NotificationTemplate, dispatch_notifications
+from .models import ChatNotification, NotificationLog, NotificationOutbox, UserNotificationPreference
+from .outbox import get_outbox_config, relay_batch, relay_outbox, retry_delay
+
+
+class NotificationMixin:
+    """Helpers to create users and notifications; HR users need no department"""
+
+    def setUp(self):
+        self.users = 0
+
+    def create_user(self, role='hr', **fields):
+        self.users += 1
+        fields.setdefault('email', f'{role}{self.users}@example.com')
+        fields.setdefault('full_name', f'{role.title()} {self.users}')
+        return CustomUser.objects.create_user(
+            phone_number=f'0790000{self.users:03d}',
+            role=role,
+            status='approved',
+            password='password',
+            **fields
+        )
+
+    def notify(self, recipient, title='Hello'):
+        return ChatNotification.objects.create(
+            recipient=recipient, notification_type='new_message', title=title, message='New message'
+        )
+
+
+class NotificationTestCase(NotificationMixin, TestCase):
+    pass
+
+
+class DispatchNotificationsTests(NotificationTestCase):
+    """dispatch_notifications inserts every row at once and queues their events"""
+
+    template = NotificationTemplate('chat_created', 'Welcome {recipient.full_name}', 'You joined {room}')
+
+    def test_rows_are_rendered_and_queued(self):
+        recipients = [self.create_user() for _ in range(3)]
+
+        notifications = dispatch_notifications(recipients + recipients[:1], self.template, room='Engineering')
+
+        self.assertEqual(len(notifications), 3)
+        self.assertEqual(len({notification.batch_id for notification in notifications}), 1)
+        self.assertEqual(
+            sorted(ChatNotification.objects.values_list('title', flat=True)),
+            sorted(f'Welcome {recipient.full_name}' for recipient in recipients)
+        )
+        self.assertEqual(
+            set(NotificationOutbox.objects.values_list('notification_id', flat=True)),
+            {notification.pk for notification in notifications}
+        )
+
+    def test_ids_are_resolved_by_batch_when_bulk_create_returns_none(self):
+        recipient = self.create_user()
+        created_at = now()
+        bulk_create = ChatNotification.objects.bulk_create
+        others = []
+
+        def bulk_create_without_ids(objs, **kwargs):
+            # As on MySQL, where inserted ids are not returned
+            created = bulk_create(objs, **kwargs)
+            for obj in created:
+                obj.pk = None
+            # A concurrent dispatch with the same recipient, type and timestamp
+            others.append(ChatNotification.objects.create(
+                recipient=recipient,
+                notification_type=self.template.notification_type,
+                title='Concurrent',
+                message='Concurrent',
+                created_at=created_at
+            ))
+            return created
+
+        with mock.patch('notificationApp.dispatch.now', return_value=created_at), \
+                mock.patch.object(ChatNotification.objects, 'bulk_create', bulk_create_without_ids):
+            notifications = dispatch_notifications([recipient], self.template, room='Engineering')
+
+        self.assertIsNotNone(notifications[0].pk)
+        self.assertNotEqual(notifications[0].pk, others[0].pk)
+        self.assertEqual(ChatNotification.objects.get(pk=notifications[0].pk).title, f'Welcome {recipient.full_name}')
+        self.assertTrue(NotificationOutbox.objects.filter(notification_id=notifications[0].pk).exists())
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, NOTIFICATION_OUTBOX={'INLINE': True})
+class NotificationOutboxTests(NotificationTestCase):
+    """Committed notifications are relayed from the outbox, failed ones retried later"""
+
+    def setUp(self):
+        super().setUp()
+        self.recipient = self.create_user()
+
+    def receive(self):
+        async def listen():
+            channel_layer = get_channel_layer()
+            channel = await channel_layer.new_channel()
+            await channel_layer.group_add(f'user_{self.recipient.id}', channel)
+            return channel_layer, channel
+
+        return async_to_sync(listen)()
+
+    def test_event_is_published_after_commit(self):
+        channel_layer, channel = self.receive()
+        with self.captureOnCommitCallbacks() as callbacks:
+            notification = self.notify(self.recipient)
+        self.assertTrue(NotificationOutbox.objects.filter(notification=notification).exists())
+
+        for callback in callbacks:
+            callback()
+
+        event = async_to_sync(channel_layer.receive)(channel)
+        self.assertEqual(event['notification']['id'], notification.id)
+        self.assertEqual(event['notification']['title'], 'Hello')
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+    def test_rolled_back_notification_is_never_queued(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            try:
+                with transaction.atomic():
+                    self.notify(self.recipient)
+                    raise RuntimeError('request failed')
+            except RuntimeError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+    def test_failed_publish_backs_off_until_max_attempts(self):
+        notification = self.notify(self.recipient)
+        entry = NotificationOutbox.objects.get(notification=notification)
+        config = get_outbox_config()
+
+        with mock.patch('notificationApp.outbox.publish', return_value=[ConnectionError('layer down')]), \
+                self.assertLogs('notificationApp.outbox', 'ERROR'):
+            self.assertEqual(relay_batch(), (0, 1))
+        entry.refresh_from_db()
+        self.assertEqual(entry.attempts, 1)
+        self.assertEqual(entry.last_error, 'ConnectionError: layer down')
+        self.assertAlmostEqual(
+            (entry.next_attempt_at - now()).total_seconds(), config['RETRY_DELAY'], delta=1
+        )
+        # Not due yet
+        self.assertEqual(relay_outbox(), (0, 0))
+
+        NotificationOutbox.objects.update(attempts=config['MAX_ATTEMPTS'], next_attempt_at=now())
+        self.assertEqual(relay_outbox(), (0, 0))
+
+        NotificationOutbox.objects.update(attempts=3)
+        self.assertEqual(relay_outbox(), (1, 0))
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+    def test_entries_are_claimed_before_publishing(self):
+        notification = self.notify(self.recipient)
+        during_publish = []
+
+        def publish(notifications):
+            entry = NotificationOutbox.objects.get(notification=notification)
+            # Another relay starting now finds nothing due
+            during_publish.append((entry.attempts, entry.next_attempt_at > now(), relay_batch()))
+            return [None]
+
+        with mock.patch('notificationApp.outbox.publish', side_effect=publish):
+            self.assertEqual(relay_batch(), (1, 0))
+        self.assertEqual(during_publish, [(1, True, (0, 0))])
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+    def test_last_failed_attempt_is_logged_as_given_up(self):
+        notification = self.notify(self.recipient)
+        config = get_outbox_config()
+        NotificationOutbox.objects.update(attempts=config['MAX_ATTEMPTS'] - 1)
+
+        with mock.patch('notificationApp.outbox.publish', return_value=[ConnectionError('layer down')]), \
+                self.assertLogs('notificationApp.outbox', 'ERROR') as logs:
+            self.assertEqual(relay_batch(), (0, 1))
+        self.assertEqual(logs.output, [
+            f"ERROR:notificationApp.outbox:Giving up on notification {notification.id} "
+            f"after {config['MAX_ATTEMPTS']} attempts: ConnectionError: layer down"
+        ])
+        entry = NotificationOutbox.objects.get(notification=notification)
+        self.assertEqual((entry.attempts, entry.last_error), (config['MAX_ATTEMPTS'], 'ConnectionError: layer down'))
+        NotificationOutbox.objects.update(next_attempt_at=now())
+        self.assertEqual(relay_outbox(), (0, 0))
+
+    def test_retry_delay_doubles_up_to_the_cap(self):
+        config = {'RETRY_DELAY': 5, 'MAX_RETRY_DELAY': 30}
+        self.assertEqual(
+            [retry_delay(attempts, config).total_seconds() for attempts in range(1, 6)],
+            [5, 10, 20, 30, 30]
+        )
+
+    def test_relay_walks_every_batch(self):
+        for index in range(5):
+            self.notify(self.recipient, title=f'Notification {index}')
+        channel_layer, channel = self.receive()
+
+        self.assertEqual(relay_outbox(batch_size=2), (5, 0))
+
+        titles = [async_to_sync(channel_layer.receive)(channel)['notification']['title'] for _ in range(5)]
+        self.assertEqual(titles, [f'Notification {index}' for index in range(5)])
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, NOTIFICATION_OUTBOX={'INLINE': False})
+@skipUnlessDBFeature('has_select_for_update_skip_locked')
+class ConcurrentRelayTests(NotificationMixin, TransactionTestCase):
+    """A relay skips entries another relay holds instead of waiting for them"""
+
+    def test_locked_entries_are_skipped(self):
+        recipient = self.create_user()
+        with mock.patch('notificationApp.outbox.schedule_relay'):
+            locked = self.notify(recipient, 'Locked')
+            self.notify(recipient, 'Free')
+        results = []
+
+        def relay_in_other_thread():
+            try:
+                results.append(relay_batch())
+            finally:
+                connection.close()
+
+        with transaction.atomic():
+            NotificationOutbox.objects.select_for_update().get(notification=locked)
+            thread = threading.Thread(target=relay_in_other_thread)
+            thread.start()
+            thread.join(timeout=10)
+
+        self.assertEqual(results, [(1, 0)])
+        self.assertEqual(list(NotificationOutbox.objects.values_list('notification_id', flat=True)), [locked.id])
+
+
+class RecordingConnection:
+    """Email connection that records sessions and messages, failing for some addresses"""
+
+    def __init__(self, failing=(), max_opens=None):
+        self.failing = set(failing)
+        self.max_opens = max_opens
+        self.opened = 0
+        self.is_open = False
+        self.sent = []
+
+    def open(self):
+        if self.opened == self.max_opens:
+            raise ConnectionRefusedError('server unreachable')
+        self.opened += 1
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def send_messages(self, messages):
+        assert self.is_open
+        for message in messages:
+            if self.failing & set(message.to):
+                raise ConnectionError('recipient refused')
+            self.sent.append(message)
+        return len(messages)
+
+
+@override_settings(NOTIFICATION_DIGESTS={'BATCH_SIZE': 2, 'MAX_ITEMS': 2})
+class NotificationDigestTests(NotificationTestCase):
+    """Digests cover unread notifications since the last one, sent over one connection"""
+
+    def setUp(self):
+        super().setUp()
+        self.sent_at = now() + timedelta(minutes=1)
+
+    def subscribe(self, frequency='daily', notifications=1, last_digest_sent_at=None):
+        user = self.create_user()
+        UserNotificationPreference.objects.create(
+            user=user, email_frequency=frequency, last_digest_sent_at=last_digest_sent_at
+        )
+        for index in range(notifications):
+            self.notify(user, title=f'Notification {index}')
+        return user
+
+    def watermark(self, user):
+        return UserNotificationPreference.objects.get(user=user).last_digest_sent_at
+
+    def test_due_users_are_emailed_in_batches_over_one_connection(self):
+        first = self.subscribe(notifications=3)
+        second = self.subscribe()
+        quiet = self.subscribe(notifications=0)
+        recent = self.subscribe(last_digest_sent_at=now() - timedelta(hours=2))
+        weekly = self.subscribe('weekly')
+        read = self.subscribe()
+        ChatNotification.objects.filter(recipient=read).update(is_read=True)
+        connection = RecordingConnection()
+
+        self.assertEqual(send_digests('daily', self.sent_at, connection), (2, 0))
+
+        self.assertEqual(connection.opened, 1)
+        self.assertFalse(connection.is_open)
+        self.assertEqual([message.to for message in connection.sent], [[first.email], [second.email]])
+        self.assertEqual(connection.sent[0].subject, 'Your daily digest: 3 new notifications')
+        self.assertIn('Notification 2', connection.sent[0].body)
+        self.assertNotIn('Notification 0', connection.sent[0].body)
+        self.assertIn('...and 1 more.', connection.sent[0].body)
+        for user in (first, second, quiet, read):
+            self.assertEqual(self.watermark(user), self.sent_at)
+        self.assertNotEqual(self.watermark(recent), self.sent_at)
+        self.assertIsNone(self.watermark(weekly))
+        self.assertEqual(NotificationLog.objects.filter(notification_type='daily_digest', success=True).count(), 2)
+
+        # Nothing new since the watermark
+        self.assertEqual(send_digests('daily', self.sent_at, RecordingConnection()), (0, 0))
+
+    def test_failed_user_keeps_watermark_and_is_retried(self):
+        refused = self.subscribe()
+        other = self.subscribe()
+        connection = RecordingConnection(failing=[refused.email])
+
+        with self.assertLogs('notificationApp.digests', 'ERROR'):
+            self.assertEqual(send_digests('daily', self.sent_at, connection), (1, 1))
+
+        # A fresh session after the failure
+        self.assertEqual(connection.opened, 2)
+        self.assertEqual([message.to for message in connection.sent], [[other.email]])
+        self.assertIsNone(self.watermark(refused))
+        log = NotificationLog.objects.get(recipient=refused)
+        self.assertFalse(log.success)
+        self.assertEqual(log.error_message, 'recipient refused')
+
+        connection = RecordingConnection()
+        self.assertEqual(send_digests('daily', self.sent_at + timedelta(minutes=5), connection), (1, 0))
+        self.assertEqual([message.to for message in connection.sent], [[refused.email]])
+
+    def test_failed_reconnect_stops_the_run_and_keeps_progress(self):
+        emailed = self.subscribe()
+        refused = self.subscribe()
+        self.subscribe()
+        later = self.subscribe()
+        connection = RecordingConnection(failing=[refused.email], max_opens=1)
+
+        with self.assertLogs('notificationApp.digests', 'ERROR') as logs:
+            self.assertEqual(send_digests('daily', self.sent_at, connection), (1, 1))
+
+        self.assertIn('stopping', logs.output[-1])
+        self.assertEqual([message.to for message in connection.sent], [[emailed.email]])
+        self.assertEqual(self.watermark(emailed), self.sent_at)
+        self.assertIsNone(self.watermark(refused))
+        self.assertIsNone(self.watermark(later))
+        self.assertEqual(
+            list(NotificationLog.objects.order_by('id').values_list('recipient', 'success')),
+            [(emailed.id, True), (refused.id, False)]
+        )
+
+        # The next run picks up where this one stopped
+        connection = RecordingConnection()
+        self.assertEqual(send_digests('daily', self.sent_at + timedelta(minutes=5), connection), (3, 0))
+        self.assertNotIn([emailed.email], [message.to for message in connection.sent])
+
+    def test_notifications_since_the_last_digest_only(self):
+        user = self.subscribe('weekly', notifications=0, last_digest_sent_at=now() - timedelta(days=8))
+        self.notify(user, title='New')
+        old = self.notify(user, title='Old')
+        ChatNotification.objects.filter(pk=old.pk).update(created_at=now() - timedelta(days=9))
+        connection = RecordingConnection()
+
+        self.assertEqual(send_digests('weekly', self.sent_at, connection), (1, 0))
+        self.assertEqual(connection.sent[0].subject, 'Your weekly digest: 1 new notification')
+
+    def test_unknown_frequency_is_rejected(self):
+        with self.assertRaises(ValueError):
+            send_digests('hourly', connection=RecordingConnection())
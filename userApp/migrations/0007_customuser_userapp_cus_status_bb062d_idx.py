@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-17 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('departmentApp', '0001_initial'),
+        ('userApp', '0006_alter_customuser_work_mail_address'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['status', 'full_name', 'id'], name='userApp_cus_status_bb062d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['role'], name='userApp_cus_role_4a13e8_idx'),
+        ),
+    ]
@@ -235,6 +235,14 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
 
     objects = CustomUserManager()
 
+    class Meta:
+        indexes = [
+            # Candidate search: approved users by name prefix, keyset-paged on (full_name, id)
+            models.Index(fields=['status', 'full_name', 'id']),
+            # Candidate search terms naming a role
+            models.Index(fields=['role']),
+        ]
+
     def __str__(self):
         return self.work_mail_address
 